@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench.py — offline benchmarks for scrap.py (no live sites)
+
+Micro: extractors on the fixture corpus (bench/corpus.py), pages/sec + tracemalloc peak per page
+python bench/bench.py micro --out micro.json
+
+End-to-end: scrap.py main() against bench/standin.py simulating hundreds of domains
+python bench/bench.py e2e --domains 200 --listings 10 --latency-ms 30 --p429 0.02 --out e2e.json -- --engine async
+
+Parser backends must agree (--parser lxml/scan vs bs4): python bench/parity.py
+
+Regression check: exit 1 when a metric is worse than the baseline by more than --tolerance
+python bench/bench.py compare e2e.json --baseline e2e_main.json --tolerance 0.15
+
+Results are JSON: {"suite", "created", "python", "git", "config", "results": {name: {metric: value}}}.
+"""
+
+import argparse, csv, json, os, platform, resource, shutil, subprocess, sys, tempfile, time, tracemalloc
+from datetime import datetime, timezone
+from urllib.request import urlopen
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRAP = os.path.join(os.path.dirname(HERE), "scrap.py")
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import corpus
+
+# metric -> +1 higher is better, -1 lower is better
+DIRECTIONS = {"pages_per_sec": 1, "listings_per_sec": 1, "rows_per_sec": 1,
+              "ms_per_page": -1, "peak_kb_per_page": -1, "wall_seconds": -1, "peak_rss_mb": -1}
+
+def envelope(suite, config, results):
+    try: git = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except Exception: git = ""
+    return {"suite": suite, "created": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+            "git": git, "config": config, "results": results}
+
+def save(doc, path):
+    text = json.dumps(doc, indent=1, sort_keys=True)
+    if path:
+        with open(path, "w", encoding="utf-8") as f: f.write(text + "\n")
+    print(text)
+
+# -------------- Micro-benchmarks --------------
+def micro_cases(scrap):
+    """name -> (function(input), input builder(html) or None for the raw page)."""
+    def listing_nodes(html):
+        return [d for d in scrap.parse_jsonld(html) if isinstance(d, dict) and "RealEstateListing" in str(d.get("@type"))]
+    return {
+        "parse_jsonld": (scrap.parse_jsonld, None),
+        "extract_meta": (lambda html: scrap.extract_meta(html, "http://bench.example/"), None),
+        "harvest_text_features": (lambda html: scrap.harvest_text_features(html, "Piso con piscina y garaje"), None),
+        "find_social_links": (scrap.find_social_links, None),
+        "extract_contacts": (lambda html: scrap.extract_contacts(html, "ES"), None),
+        "property_from_jsonld": (lambda nodes: [scrap.property_from_jsonld(d) for d in nodes], listing_nodes),
+        "extract_listing": (lambda html: scrap.extract_listing(html, {"ISO": "ES", "Agency Name": "Bench"}, "", "http://bench.example/l/1"), None),
+    }
+
+def time_case(fn, inputs, min_time):
+    n, t0 = 0, time.perf_counter()
+    while True:
+        for x in inputs: fn(x)
+        n += len(inputs); elapsed = time.perf_counter() - t0
+        if elapsed >= min_time: return n, elapsed
+
+def alloc_case(fn, inputs):
+    tracemalloc.start()
+    try:
+        for x in inputs:
+            tracemalloc.reset_peak(); fn(x)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+    return peak
+
+def run_micro(args):
+    import scrap
+    scrap.configure_features(args.features_file or "")
+    scrap.configure_parser(args.parser)
+    pages = corpus.pages(args.per_kind)
+    results = {}
+    for name, (fn, prep) in micro_cases(scrap).items():
+        if args.only and name not in args.only: continue
+        for kind, docs in pages.items():
+            inputs = [prep(h) for h in docs] if prep else docs
+            if prep and not any(inputs): continue
+            fn(inputs[0])  # warm-up (imports, regex compilation)
+            n, elapsed = time_case(fn, inputs, args.min_time)
+            peak = max(alloc_case(fn, [x]) for x in inputs[:5])
+            results[f"{name}/{kind}"] = {"pages_per_sec": round(n / elapsed, 1), "ms_per_page": round(1000 * elapsed / n, 3),
+                                         "peak_kb_per_page": round(peak / 1024, 1), "pages": n}
+            print(f"[micro] {name:<22} {kind:<8} {n / elapsed:10.1f} pages/s  {peak / 1024:9.1f} KB peak", file=sys.stderr)
+    return envelope("micro", {"per_kind": args.per_kind, "min_time": args.min_time, "parser": args.parser}, results)
+
+# -------------- End-to-end --------------
+def domain_hosts(args):
+    if args.proxy_mode: return [f"d{k}.bench" for k in range(args.domains)]
+    return [f"127.0.{1 + k // 254}.{1 + k % 254}:{args.port}" for k in range(args.domains)]
+
+def write_seeds(workdir, hosts, listings, order="grouped"):
+    agencies, props = os.path.join(workdir, "agencies.tsv"), os.path.join(workdir, "props.tsv")
+    with open(agencies, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter="\t"); w.writerow(["Agency Name", "Website", "Country", "ISO"])
+        for k, h in enumerate(hosts): w.writerow([f"Agency {k}", f"http://{h}/", "Spain", "ES"])
+    with open(props, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter="\t"); w.writerow(["Agency Name", "Listing URL", "ISO", "Country"])
+        pairs = [(k, i) for k in range(len(hosts)) for i in range(listings)]  # grouped by agency, like a real export
+        if order == "interleaved": pairs.sort(key=lambda p: (p[1], p[0]))
+        for k, i in pairs: w.writerow([f"Agency {k}", f"http://{hosts[k]}/l/{i}", "ES", "Spain"])
+    return agencies, props
+
+def start_standin(args):
+    cmd = [sys.executable, os.path.join(HERE, "standin.py"), "--port", str(args.port), "--host", "127.0.0.1" if args.proxy_mode else "0.0.0.0",
+           "--latency-ms", str(args.latency_ms), "--p429", str(args.p429), "--pfail", str(args.pfail), "--pdrop", str(args.pdrop),
+           "--domain-capacity", str(args.domain_capacity), "--captcha-every", str(args.captcha_every), "--huge-every", str(args.huge_every)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try: urlopen(f"http://127.0.0.1:{args.port}/__stats", timeout=1).read(); return proc
+        except Exception: time.sleep(0.1)
+    proc.kill(); raise SystemExit("[ERROR] stand-in server did not start")
+
+def count_rows(path):
+    if not os.path.exists(path): return 0
+    with open(path, encoding="utf-8-sig", newline="") as f: return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+def run_e2e(args):
+    workdir = tempfile.mkdtemp(prefix="scrap-bench-"); outdir = os.path.join(workdir, "out")
+    hosts = domain_hosts(args)
+    agencies, props = write_seeds(workdir, hosts, args.listings, args.order)
+    cmd = [sys.executable, SCRAP, "--in", agencies, "--props-in", props, "--outdir", outdir, "--workers", str(args.workers),
+           "--max-per-agency", str(args.listings), "--metrics-file", "metrics.json", *args.scrap_args]
+    if args.proxy_mode:
+        with open(os.path.join(workdir, "proxies.json"), "w") as f: json.dump([f"http://127.0.0.1:{args.port}"], f)
+        cmd += ["--proxies-file", os.path.join(workdir, "proxies.json")]
+    server = start_standin(args)
+    try:
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=args.timeout)
+        wall = time.perf_counter() - t0
+        stats = json.loads(urlopen(f"http://127.0.0.1:{args.port}/__stats", timeout=5).read())
+    finally:
+        server.kill(); server.wait()
+    metrics = {}
+    if os.path.exists(os.path.join(outdir, "metrics.json")):
+        with open(os.path.join(outdir, "metrics.json"), encoding="utf-8") as f: metrics = json.load(f)
+    seeds = args.domains * args.listings
+    rows = {name: count_rows(os.path.join(outdir, f"{name}.csv")) for name in ("properties_import", "agents_import", "enriched_agencies", "manual_review")}
+    stage_ms = {k: round(1000 * v["sum"] / v["count"], 3) for k, v in metrics.get("stages", {}).items() if v["count"]}
+    result = {"wall_seconds": round(wall, 2), "listings_per_sec": round(seeds / wall, 1),
+              "rows_per_sec": round(rows["properties_import"] / wall, 1), "exit_code": proc.returncode,
+              "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+              "rows": rows, "server": stats, "events": metrics.get("events", {}), "stage_mean_ms": stage_ms}
+    if proc.returncode: print(proc.stdout[-4000:], file=sys.stderr)
+    if args.keep: print(f"[INFO] kept {workdir}", file=sys.stderr)
+    else: shutil.rmtree(workdir, ignore_errors=True)
+    config = {k: v for k, v in vars(args).items() if k not in ("func", "out")}
+    return envelope("e2e", config, {"e2e": result})
+
+# -------------- Compare --------------
+def compare(args):
+    with open(args.results, encoding="utf-8") as f: new = json.load(f)["results"]
+    with open(args.baseline, encoding="utf-8") as f: base = json.load(f)["results"]
+    regressions = 0
+    for name in sorted(set(new) & set(base)):
+        for metric, sign in DIRECTIONS.items():
+            a, b = base[name].get(metric), new[name].get(metric)
+            if not a or b is None: continue
+            change = (b - a) / a * sign  # > 0 means better
+            flag = "REGRESSION" if change < -args.tolerance else ""
+            regressions += bool(flag)
+            print(f"{name:<34} {metric:<18} {a:>12} -> {b:<12} {change:+7.1%} {flag}")
+    print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("micro", help="Extractor micro-benchmarks on the fixture corpus")
+    m.add_argument("--per-kind", type=int, default=20, help="Pages per kind (huge pages: a tenth)")
+    m.add_argument("--min-time", type=float, default=1.0, help="Seconds per case")
+    m.add_argument("--only", nargs="*", default=[], help="Benchmark names to run")
+    m.add_argument("--features-file", default="")
+    m.add_argument("--parser", default="bs4", help="scrap.py --parser backend")
+    m.add_argument("--out", default="")
+    e = sub.add_parser("e2e", help="Full run against the local stand-in server")
+    e.add_argument("--domains", type=int, default=200)
+    e.add_argument("--listings", type=int, default=10, help="Listings per domain")
+    e.add_argument("--workers", type=int, default=32)
+    e.add_argument("--order", choices=["grouped","interleaved"], default="grouped", help="Seed file order: by agency (skewed) or round-robin")
+    e.add_argument("--port", type=int, default=8800)
+    e.add_argument("--latency-ms", type=float, default=30.0)
+    e.add_argument("--p429", type=float, default=0.0)
+    e.add_argument("--pfail", type=float, default=0.0)
+    e.add_argument("--pdrop", type=float, default=0.0)
+    e.add_argument("--domain-capacity", type=int, default=0)
+    e.add_argument("--captcha-every", type=int, default=11)
+    e.add_argument("--huge-every", type=int, default=0)
+    e.add_argument("--proxy-mode", action="store_true", help="Made-up hostnames behind the stand-in as HTTP proxy (no 127/8 needed)")
+    e.add_argument("--timeout", type=float, default=1800)
+    e.add_argument("--keep", action="store_true", help="Keep the work directory (seeds + outputs)")
+    e.add_argument("--out", default="")
+    e.add_argument("scrap_args", nargs="*", help="Extra scrap.py arguments (after --)")
+    c = sub.add_parser("compare", help="Compare results against a baseline")
+    c.add_argument("results")
+    c.add_argument("--baseline", required=True)
+    c.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args()
+    if args.cmd == "compare": return compare(args)
+    doc = run_micro(args) if args.cmd == "micro" else run_e2e(args)
+    save(doc, args.out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+corpus.py — deterministic fixture corpus for the scraper benchmarks
+
+Page kinds (same generator feeds the micro-benchmarks and the stand-in server)
+- jsonld:   listing with rich JSON-LD (RealEstateListing + offers/geo/address + agents), OG/meta, social links
+- plain:    listing without JSON-LD (text + meta only, features from free text in es/en/pt)
+- huge:     ~2 MB results page (hundreds of cards, inline scripts, nav boilerplate)
+- captcha:  Cloudflare/CAPTCHA interstitial
+- agency:   agency homepage (Organization JSON-LD, logo, socials, tel:/mailto:/wa.me)
+- sitemap:  sitemap index + urlset documents (plain and .xml.gz)
+
+Write the corpus to disk:
+python bench/corpus.py --out bench/fixtures
+"""
+
+import argparse, gzip, json, os, random
+
+KINDS = ("jsonld", "plain", "huge", "captcha", "agency")
+
+STREETS = ["Calle Mayor", "Avenida da Liberdade", "Rua Augusta", "Main Street", "Paseo de Gracia", "Carrer de Balmes"]
+CITIES = [("Madrid","ES"), ("Lisboa","PT"), ("Barcelona","ES"), ("Porto","PT"), ("Miami","US"), ("Valencia","ES")]
+PHRASES = [
+    "Luminoso piso con terraza, ascensor y garaje, cerca del metro.", "Apartamento amueblado con aire acondicionado y calefacción central.",
+    "Bright apartment with balcony, built-in wardrobes and sea view.", "Moradia com piscina, jardim, churrasqueira e lareira.",
+    "Fully furnished flat, hardwood floors, gym and 24h concierge.", "Ático sin amueblar, suelo de mármol, vistas a la montaña, trastero.",
+    "Pet friendly building with elevator, storage room and parking space.", "Casa com vista mar, pavimento cerâmico, ar condicionado, segurança 24h.",
+]
+SOCIAL = ["https://www.facebook.com/{s}", "https://instagram.com/{s}", "https://www.linkedin.com/company/{s}", "https://twitter.com/{s}", "https://www.youtube.com/@{s}"]
+CAPTCHA = ("<html><head><title>Just a moment...</title></head><body><div id='cf-wrapper'>Checking your browser before accessing."
+           "<div class='cf-turnstile' data-sitekey='0x4AAA'></div> Please complete the captcha to continue.</div></body></html>")
+
+def rng(*key): return random.Random("|".join(map(str, key)))
+
+def _nav(r, n=40):
+    return "<nav>" + "".join(f"<a href='/section/{i}'>Section {i}</a>" for i in range(n)) + "</nav>"
+
+def listing_jsonld(domain, i, r=None):
+    r = r or rng(domain, i)
+    city, iso = r.choice(CITIES)
+    return {
+        "@context": "https://schema.org", "@type": "RealEstateListing", "name": f"{r.choice(['Piso','Apartment','Moradia','Villa'])} {i} in {city}",
+        "description": " ".join(r.sample(PHRASES, 3)) + f" {r.randint(600, 4000)} sqft." + (" For rent." if i % 4 == 0 else ""),
+        "image": [f"http://{domain}/img/{i}/{k}.jpg" for k in range(r.randint(3, 12))],
+        "address": {"streetAddress": f"{r.choice(STREETS)} {r.randint(1, 200)}", "addressLocality": city, "postalCode": f"{r.randint(10000, 99999)}", "addressCountry": iso},
+        "geo": {"latitude": round(r.uniform(-40, 50), 5), "longitude": round(r.uniform(-80, 10), 5)},
+        "numberOfRooms": r.randint(1, 6), "numberOfBathroomsTotal": r.randint(1, 4),
+        "floorSize": {"value": r.randint(40, 400), "unitCode": "MTK"},
+        "offers": {"price": r.randint(80, 2500) * 1000, "priceCurrency": "EUR" if iso != "US" else "USD", "seller": {"name": f"Agent {r.randint(1, 30)}"}},
+        "amenityFeature": [{"name": a} for a in r.sample(["Lift", "Pool", "Garden", "Parking", "Gym", "Storage"], 3)],
+    }
+
+def listing_page(domain, i, kind="jsonld"):
+    """HTML for listing i of domain in the given kind."""
+    r = rng(domain, i, kind)
+    if kind == "captcha": return CAPTCHA
+    if kind == "huge": return huge_page(domain, i)
+    d = listing_jsonld(domain, i, r)
+    head = (f"<title>{d['name']}</title><meta name='description' content='{d['description'][:150]}'>"
+            f"<meta property='og:image' content='/img/{i}/0.jpg'><meta name='viewport' content='width=device-width'>")
+    if kind == "jsonld":
+        agents = [{"@type": "Person", "name": f"Agent {k}", "email": f"agent{k}@{domain}", "telephone": f"+34 600 {k:03d} {i % 1000:03d}"} for k in range(r.randint(1, 3))]
+        head += f"<script type='application/ld+json'>{json.dumps([d, *agents])}</script>"
+    body = (_nav(r) + f"<main><h1>{d['name']}</h1><p class='price'>{d['offers']['price']} {d['offers']['priceCurrency']}</p>"
+            + "".join(f"<p>{p}</p>" for p in r.sample(PHRASES, 4))
+            + "".join(f"<img src='{u}' loading='lazy'>" for u in d["image"])
+            + f"<a href='{SOCIAL[0].format(s=domain.split('.')[0])}'>Facebook</a></main>"
+            + "<footer>" + "".join(f"<a href='/legal/{k}'>Legal {k}</a>" for k in range(15)) + "</footer>"
+            + "<script>window.dataLayer=window.dataLayer||[];" + "x=1;" * 200 + "</script>")
+    return f"<!doctype html><html lang='es'><head>{head}</head><body>{body}</body></html>"
+
+def huge_page(domain, i, cards=900):
+    r = rng(domain, i, "huge")
+    cards_html = "".join(
+        f"<article class='card'><a href='/l/{k}'><img src='/img/{k}/0.jpg'><h3>Listing {k}</h3></a><p>{r.choice(PHRASES)} {r.choice(PHRASES)}</p>"
+        f"<span class='price'>{r.randint(80, 2500)}.000 EUR</span><ul>" + "".join(f"<li>{f}</li>" for f in r.sample(['Pool','Garage','Lift','Garden','Terrace'], 3)) + "</ul></article>"
+        for k in range(cards))
+    scripts = "".join(f"<script>var s{k}={json.dumps({'id': k, 'v': 'x' * 400})};</script>" for k in range(400))
+    ld = json.dumps({"@context": "https://schema.org", "@type": "ItemList", "itemListElement": [{"@type": "ListItem", "position": k, "url": f"http://{domain}/l/{k}"} for k in range(cards)]})
+    return (f"<!doctype html><html lang='en'><head><title>Search results {i}</title><meta name='description' content='Homes for sale'>"
+            f"<script type='application/ld+json'>{ld}</script></head><body>{_nav(r, 300)}<main>{cards_html}</main>{scripts}</body></html>")
+
+def agency_page(domain, i=0):
+    r = rng(domain, "agency")
+    slug = domain.split(".")[0].replace(":", "-")
+    org = {"@context": "https://schema.org", "@type": "RealEstateAgent", "name": f"Agency {slug}", "logo": f"http://{domain}/img/logo.png",
+           "telephone": f"+34 91 {r.randint(100, 999)} {r.randint(10, 99)} {r.randint(10, 99)}", "email": f"info@{slug}.example",
+           "employee": [{"@type": "Person", "name": f"Agent {k}", "email": f"a{k}@{slug}.example"} for k in range(3)]}
+    socials = "".join(f"<a href='{u.format(s=slug)}'>s</a>" for u in r.sample(SOCIAL, 3))
+    return (f"<!doctype html><html lang='es'><head><title>Agency {slug} — homes</title><meta name='description' content='Real estate agency in {r.choice(CITIES)[0]}'>"
+            f"<meta property='og:image' content='/img/logo.png'><script type='application/ld+json'>{json.dumps(org)}</script></head>"
+            f"<body>{_nav(r)}<p>{' '.join(r.sample(PHRASES, 3))}</p>{socials}<a href='tel:{org['telephone']}'>call</a>"
+            f"<a href='mailto:{org['email']}'>mail</a><a href='https://wa.me/3460000{r.randint(1000, 9999)}'>WhatsApp</a>"
+            f"<script>fetch('/api/search?page=1')</script></body></html>")
+
+def sitemap_index(domain, parts):
+    locs = "".join(f"<sitemap><loc>http://{domain}/sitemap-{p}.xml.gz</loc></sitemap>" for p in range(parts))
+    return f"<?xml version='1.0' encoding='UTF-8'?><sitemapindex xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{locs}</sitemapindex>"
+
+def sitemap_urlset(domain, start, n):
+    locs = "".join(f"<url><loc>http://{domain}/l/{k}</loc><lastmod>2024-01-01</lastmod></url>" for k in range(start, start + n))
+    return f"<?xml version='1.0' encoding='UTF-8'?><urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{locs}</urlset>"
+
+def pages(n_per_kind=20, domain="bench.example"):
+    """{kind: [html, ...]} for the micro-benchmarks."""
+    out = {k: [listing_page(domain, i, k) if k != "agency" else agency_page(f"a{i}.{domain}") for i in range(n_per_kind)]
+           for k in KINDS if k != "huge"}
+    out["huge"] = [huge_page(domain, i) for i in range(max(1, n_per_kind // 10))]
+    return out
+
+def write_corpus(outdir, n_per_kind=20):
+    for kind, docs in pages(n_per_kind).items():
+        os.makedirs(os.path.join(outdir, kind), exist_ok=True)
+        for i, html in enumerate(docs):
+            with open(os.path.join(outdir, kind, f"{i:03d}.html"), "w", encoding="utf-8") as f: f.write(html)
+    os.makedirs(os.path.join(outdir, "sitemap"), exist_ok=True)
+    with open(os.path.join(outdir, "sitemap", "index.xml"), "w", encoding="utf-8") as f: f.write(sitemap_index("bench.example", 4))
+    for p in range(4):
+        with gzip.open(os.path.join(outdir, "sitemap", f"sitemap-{p}.xml.gz"), "wt", encoding="utf-8") as f:
+            f.write(sitemap_urlset("bench.example", p * 10000, 10000))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    ap.add_argument("--per-kind", type=int, default=20)
+    args = ap.parse_args()
+    write_corpus(args.out, args.per_kind)
+    print(f"[INFO] corpus written to {args.out}")
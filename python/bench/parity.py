@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+parity.py — every --parser backend must extract exactly what the BeautifulSoup backend does
+
+Compares text, JSON-LD, meta, social links, API/feed discovery and the final listing/agency rows on the
+fixture corpus (bench/corpus.py) plus any saved pages (*.html) under --pages. Exit 1 on the first mismatch per page.
+
+python bench/parity.py --pages ./saved_pages
+"""
+
+import argparse, glob, os, sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import corpus
+import scrap
+
+URL = "http://bench.example/l/1"
+
+def extract(cls, html):
+    """Everything the scraper derives from a page, with the given page class."""
+    scrap.configure_parser(cls)
+    page = scrap.as_page(html, URL)
+    row = {"Agency Name": "Bench", "Website": URL, "ISO": "ES", "Country": "Spain"}
+    return {
+        "text": page.text, "jsonld": page.jsonld, "meta": scrap.extract_meta(page, URL),
+        "social": scrap.find_social_links(page), "api": scrap.try_api_endpoints(page, URL),
+        "features": scrap.harvest_text_features(page, "piso con piscina"),
+        "listing": scrap.extract_listing(html, row, "", URL), "agency": scrap.agency_from_html(row, URL, html),
+    }
+
+def documents(args):
+    for kind, docs in corpus.pages(args.per_kind).items():
+        for i, html in enumerate(docs): yield f"{kind}/{i:03d}", html
+    for edge, html in EDGE_CASES.items(): yield f"edge/{edge}", html
+    for path in sorted(glob.glob(os.path.join(args.pages, "**", "*.htm*"), recursive=True)) if args.pages else []:
+        with open(path, encoding="utf-8", errors="replace") as f: yield path, f.read()
+
+EDGE_CASES = {
+    "empty": "", "whitespace": "  \n ", "comment_only": "<!-- nothing -->", "fragment": "hello <b>world</b>",
+    "xml_decl": "<?xml version='1.0' encoding='utf-8'?><html lang=' pt '><head><title> T </title></head><body>x</body></html>",
+    "empty_ld": "<script type='application/ld+json'></script><script type=application/ld+json>[{\"@type\":\"Person\",\"name\":\"A\"}]</script>",
+    "bad_ld": "<script type=\"application/ld+json\">{not json</script><p>after</p>",
+    "text_skips": "<p>a<!-- c -->b<style>x{}</style><template><i>t</i></template>c<ruby>k<rt>r</rt><rp>(</rp></ruby></p>",
+    "feeds": "<link rel=alternate type='application/rss+xml' href='/feed'><script>fetch('/api/list?x=1')</script><a href=''>e</a>",
+    "og_fallback": "<meta property='og:description' content=' og desc '><meta property='og:image' content='//cdn/x.jpg'>",
+}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", default="", help="Directory of saved HTML pages to include")
+    ap.add_argument("--per-kind", type=int, default=20)
+    ap.add_argument("--parsers", nargs="*", default=[p for p in scrap.PARSERS if p != "bs4"])
+    args = ap.parse_args()
+    mismatches = checked = 0
+    for name, html in documents(args):
+        ref = extract("bs4", html); checked += 1
+        for parser in args.parsers:
+            got = extract(parser, html)
+            diff = [k for k in ref if ref[k] != got[k]]
+            if diff:
+                mismatches += 1
+                print(f"[DIFF] {parser} {name}: {', '.join(diff)}")
+                for k in diff[:1]: print(f"   bs4:    {str(ref[k])[:300]}\n   {parser}: {str(got[k])[:300]}")
+    print(f"[INFO] {checked} pages x {len(args.parsers)} backends, {mismatches} mismatch(es)")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+standin.py — local HTTP stand-in for hundreds of real-estate domains (end-to-end benchmarks)
+
+Every loopback address is its own "domain": http://127.0.1.17:8800/ and http://127.0.1.18:8800/ are
+two sites served by one process (Linux routes all of 127.0.0.0/8 to lo). The server also answers
+absolute-URI proxy requests, so on systems without the 127/8 range it can stand in for made-up hosts
+(http://d17.bench/...) behind --proxies-file (bench.py e2e --proxy-mode).
+
+Paths: /  (agency homepage), /l/<n> (listing: jsonld/plain/huge/captcha mix), /sitemap.xml (index) +
+/sitemap-<p>.xml.gz on domains with sitemaps, /img/... (image bytes, HEAD ok), /__stats (JSON counters).
+
+Simulated trouble (deterministic per seed): latency + jitter, a few slow domains, random 429s with
+Retry-After, 5xx, dropped connections, and 429s whenever a domain gets more than --domain-capacity
+concurrent requests.
+
+Run:
+python bench/standin.py --port 8800 --latency-ms 30 --p429 0.02 --pfail 0.01
+"""
+
+import argparse, gzip, json, random, sys, time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock
+from urllib.parse import urlparse
+
+import corpus
+
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, addr, args):
+        super().__init__(addr, Handler)
+        self.args = args; self.rnd = random.Random(args.seed); self.lock = Lock()
+        self.stats = Counter(); self.active = Counter()
+
+    def roll(self, p):
+        with self.lock: return p > 0 and self.rnd.random() < p
+
+    def jitter(self):
+        with self.lock: return self.rnd.uniform(-1, 1)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    def log_message(self, *a): pass
+
+    def _send(self, code, body=b"", ctype="text/html; charset=utf-8", headers=None, head=False):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype); self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        if not head: self.wfile.write(body)
+
+    def do_HEAD(self): self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        srv, args = self.server, self.server.args
+        u = urlparse(self.path); host = (u.netloc or self.headers.get("Host", "")).lower(); path = u.path or "/"
+        if path == "/__stats":
+            return self._send(200, json.dumps(dict(srv.stats)).encode(), "application/json")
+        r = corpus.rng(host)
+        slow = 5.0 if r.random() < args.slow_domains else 1.0
+        with srv.lock:
+            srv.stats["requests"] += 1; srv.active[host] += 1; overloaded = args.domain_capacity and srv.active[host] > args.domain_capacity
+        try:
+            time.sleep(max(0.0, (args.latency_ms + args.jitter_ms * srv.jitter()) * slow / 1000.0))
+            if overloaded or srv.roll(args.p429):
+                with srv.lock: srv.stats["429"] += 1
+                return self._send(429, b"slow down", headers={"Retry-After": str(args.retry_after)}, head=head)
+            if srv.roll(args.pdrop):
+                with srv.lock: srv.stats["dropped"] += 1
+                self.close_connection = True; self.connection.close(); return
+            if srv.roll(args.pfail):
+                with srv.lock: srv.stats["5xx"] += 1
+                return self._send(503 if srv.roll(0.5) else 500, b"upstream error", head=head)
+            self._route(host, path, r, head)
+        finally:
+            with srv.lock: srv.active[host] -= 1
+
+    def _route(self, host, path, r, head):
+        args = self.server.args
+        has_sitemap = r.random() < args.sitemap_domains
+        if path == "/":
+            return self._send(200, corpus.agency_page(host).encode(), head=head)
+        if path.startswith("/l/") and path[3:].isdigit():
+            i = int(path[3:])
+            kind = ("captcha" if args.captcha_every and i % args.captcha_every == args.captcha_every - 1 else
+                    "huge" if args.huge_every and i % args.huge_every == args.huge_every - 1 else
+                    "plain" if i % 3 == 2 else "jsonld")
+            return self._send(200, corpus.listing_page(host, i, kind).encode(), head=head)
+        if path == "/sitemap.xml" and has_sitemap:
+            return self._send(200, corpus.sitemap_index(host, 2).encode(), "application/xml", head=head)
+        if path.startswith("/sitemap-") and path.endswith(".xml.gz") and has_sitemap:
+            p = int(path[len("/sitemap-"):-len(".xml.gz")] or 0)
+            return self._send(200, gzip.compress(corpus.sitemap_urlset(host, p * 500, 500).encode()), "application/gzip", head=head)
+        if path.startswith("/img/"):
+            return self._send(200, (path * 64).encode(), "image/jpeg", head=head)
+        self._send(404, b"not found", head=head)
+
+def build_parser():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8800)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--slow-domains", type=float, default=0.02, help="Fraction of domains answering 5x slower")
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--pfail", type=float, default=0.0, help="Probability of a 500/503")
+    ap.add_argument("--pdrop", type=float, default=0.0, help="Probability of closing the connection without a response")
+    ap.add_argument("--domain-capacity", type=int, default=0, help="429 when a domain has more concurrent requests (0 = unlimited)")
+    ap.add_argument("--captcha-every", type=int, default=11)
+    ap.add_argument("--huge-every", type=int, default=0)
+    ap.add_argument("--sitemap-domains", type=float, default=0.3)
+    return ap
+
+def serve(args):
+    srv = StandIn((args.host, args.port), args)
+    print(f"[INFO] stand-in listening on {args.host}:{args.port}", flush=True)
+    try: srv.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: srv.server_close()
+
+if __name__ == "__main__":
+    sys.exit(serve(build_parser().parse_args()))
@@ -6,13 +6,32 @@ scrape_master.py — Unified Scraper for ~350 real-estate sites
 What it does
 - Scrapes: Agencies, Agents, Properties
 - Fields: price, currency, address, lat/lng, beds/baths, m² (sqft→m²), images, video, interior, exterior, amenities, services
-- Robustness: timeouts, retries/backoff, per-domain concurrency, circuit breaker, task timeouts, throttle, checkpoint/resume
-- Fallbacks: sitemap/API discovery, og:image → agency logo, manual_review queue
-- Extras: stable UIDs (md5), agent dedupe, image HEAD check, CSV outputs ready for import
+- Robustness: timeouts, retries/backoff, adaptive per-domain rate control (AIMD + Retry-After), circuit breaker, task timeouts, checkpoint/resume
+- Fallbacks: sitemap/API discovery (once per domain; streamed sitemaps incl. .xml.gz + nested indexes), og:image → agency logo, manual_review queue
+- Extras: stable UIDs (md5), run-wide + cross-run dedupe (canonical URLs, UIDs, agents), image HEAD check, CSV outputs ready for import
 
 Optional
-- Playwright fallback for JS-heavy pages: --use-playwright (requires `pip install playwright` + `playwright install`)
-- Proxy rotation via JSON file: --proxies-file proxies.json  (list of proxies)
+- Playwright fallback for JS-heavy pages: --use-playwright (requires `pip install playwright` + `playwright install`;
+  pooled browsers: --browser-pool-size, --browser-recycle-pages)
+- Proxy pool via JSON file: --proxies-file proxies.json  (list of proxies; per-request choice by latency/success, per-proxy cap,
+  quarantine + probe for failing proxies, proxy errors never trip the domain breaker; --proxy-sticky pins a domain to its proxy)
+- Image validation (drops dead links) + content-addressed mirror: --check-images / --mirror-images  (--image-workers, --image-bandwidth-kbps)
+- Persistent HTTP cache with ETag/Last-Modified revalidation: --http-cache  (--cache-max-age, --cache-max-mb)
+- Size-capped streaming fetch for multi-MB pages: --max-bytes 1500000  (encoding from headers/<meta charset>, no full chardet pass)
+- Nightly re-scrapes: --incremental (per-page/per-row fingerprints; only new/changed rows + removed listings, in delta-<run>/)
+- Huge seed files: --stream-seeds reads --props-in lazily with a bounded task window (--max-inflight)
+- Multi-node crawl: --cluster crawl.sqlite on every node (shared leased queue, cluster-wide per-domain caps/cooldowns,
+  outputs sharded per node); then --merge --outdir <dir> combines the shards
+- Asyncio fetch engine: --engine async  (requires `pip install aiohttp`; --async-connections, --parse-workers)
+- Multi-core parsing: --parse-pool process  (fetchers hand pages to --parse-workers processes; either engine)
+- Faster HTML backend: --parser lxml | scan  (same output as the default BeautifulSoup backend; bench/parity.py checks it)
+- Extra feature keywords (more languages): --features-file features.json|.yaml  (--feature-match word = whole words/plurals only)
+- Domain circuit breakers: --domain-fail-threshold / --domain-cooldown-seconds, half-open probe after the cooldown;
+  tasks of a cooling domain are re-queued (--requeue-max-wait), state kept in domain_health.sqlite
+- Metrics (stage timings, per-domain latency/status/bytes/trips, fallback counts): --metrics-file metrics.json|.prom; --profile (cProfile)
+- Re-derive outputs after an extractor fix without re-crawling: crawl with --archive (every response kept in a WARC-style
+  archive), then --reparse <that outdir> --outdir <new dir> (same --in/--props-in; no network, extraction on every core)
+- Agency contacts: tel:/mailto:/wa.me links first, then JSON-LD, then ranked text matches; phones in E.164 (seed ISO/Country)
 - Translation/CAPTCHA not auto-enabled (hooks ready; supply your own service if needed)
 
 Outputs (in --outdir)
@@ -21,8 +40,16 @@ Outputs (in --outdir)
 - properties_import.csv
 - agents_import.csv
 - manual_review.csv
-- progress.json (resume state)
+- progress.json + progress.journal (resume state: compacted snapshot + append-only journal)
+- dedupe.sqlite (seen canonical listing URLs, Unique IDs and agents, kept across runs)
+- domain_health.sqlite (per-domain circuit-breaker state and response stats, kept across runs)
+- fingerprints.sqlite + delta-<run>/ (with --incremental: properties_import.csv, agents_import.csv and removed_listings.csv
+  hold only this run's changes; that run's dedupe.sqlite lives there too)
 - scrape_errors.log
+- metrics.json (or --metrics-file), profile.pstats (with --profile)
+- http_cache.sqlite (with --http-cache)
+- archive/<run>.warc.gz + archive/index.sqlite (with --archive: one gzip member per response; URL -> offset index)
+- image_cache.sqlite + images/ (with --check-images / --mirror-images)
 
 Quick start
 pip install requests beautifulsoup4 urllib3 tqdm python-dateutil
@@ -33,15 +60,24 @@ python scrape_master.py --in agencies.csv --props-in properties_seed.csv --outdi
 """
 
 import argparse, csv, json, re, os, sys, time, hashlib, signal
-from collections import defaultdict, Counter
-from urllib.parse import urlparse, urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Semaphore, Lock
+import asyncio, queue, socket, sqlite3
+import codecs, glob, heapq, math, random, zlib
+from collections import defaultdict, deque, Counter, namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlparse, urljoin, unquote, urlsplit, parse_qsl, urlencode, quote
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock, Condition, Thread, Event, Semaphore, local
 from datetime import datetime, timezone
+from functools import cached_property
+from bisect import bisect_left
+from email.utils import parsedate_to_datetime
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
@@ -52,19 +88,98 @@ DEFAULT_WORKERS = 10
 DEFAULT_DOMAIN_CONCURRENCY = 2
 DEFAULT_MAX_PER_AGENCY = 20
 PROGRESS_FILE = "progress.json"
+JOURNAL_FILE = "progress.journal"
+DEFAULT_COMPACT_EVERY = 100000
+DEFAULT_FLUSH_ROWS = 500
+DEFAULT_FLUSH_SECONDS = 2.0
 ERROR_LOG = "scrape_errors.log"
 SQFT_TO_M2 = 0.09290304
+FETCH_RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_AFTER_MAX_WAIT = 60          # longer Retry-After: give up on the request, the domain stays blocked
+DEFAULT_DOMAIN_CONCURRENCY_CEILING = 8
+DOMAIN_HEALTH_FILE = "domain_health.sqlite"
+DOMAIN_PROBE_TIMEOUT = 120         # a half-open probe that never reports back is replaced after this
+DOMAIN_PROBE_RETRY = 5             # other tasks of a half-open domain ask again after this
+DEFAULT_REQUEUE_MAX_WAIT = 300     # end of run: wait this long at most for cooling domains to reopen
+DEFAULT_CACHE_MAX_AGE = 86400       # pages without ETag/Last-Modified are reused this long
+DEFAULT_CACHE_MAX_MB = 2048
+HTTP_CACHE_FILE = "http_cache.sqlite"
+ARCHIVE_DIR = "archive"            # --archive: <run>.warc.gz data files + the index, inside --outdir
+ARCHIVE_INDEX = "index.sqlite"
+SITEMAP_PATHS = ("/sitemap.xml", "/sitemap_index.xml", "/sitemap.xml.gz")
+SITEMAP_MAX_FILES = 50             # sitemap documents fetched per domain (indexes included)
+SITEMAP_MAX_URLS = 50000
+SITEMAP_KEEP_BYTES = 16 << 20      # sitemaps up to this size are kept for --http-cache/--archive while streamed
+DEFAULT_BROWSER_POOL = 2
+DEFAULT_BROWSER_RECYCLE_PAGES = 200
+BROWSER_QUEUE_GRACE = 30           # s a render may wait for a free browser (incl. a relaunch) on top of its own timeout
+IMAGE_CACHE_FILE = "image_cache.sqlite"
+IMAGE_STORE_DIR = "images"
+DEFAULT_IMAGE_WORKERS = 4
+DEFAULT_IMAGE_CACHE_MAX_AGE = 7 * 86400
+DEFAULT_MAX_INFLIGHT = 2000
+DEDUPE_FILE = "dedupe.sqlite"
+DEFAULT_DEDUPE_CAPACITY = 1_000_000  # Bloom filter sizing; doubles automatically when exceeded
+FINGERPRINT_FILE = "fingerprints.sqlite"
+METRICS_FILE = "metrics.json"
+DEFAULT_METRICS_INTERVAL = 30.0
+PROFILE_FILE = "profile.pstats"
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+CLUSTER_RETRY_SECONDS = 30         # a failed listing becomes visible again after this
+DEFAULT_PROXY_CONCURRENCY = 32     # requests in flight per proxy
+DEFAULT_PROXY_QUARANTINE = 30      # first quarantine of a failing proxy; doubles per relapse
+PROXY_QUARANTINE_MAX = 3600
+PROXY_FAIL_STREAK = 3              # proxy-side failures in a row before quarantine
+DEFAULT_ASYNC_CONNECTIONS = 1000
+DEFAULT_PARSE_WORKERS = 4
 
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124 Safari/537.36"}
 
-EMAIL_RE = re.compile(r"[A-Z0-9._%+\-]+@[A-Z0-9.\-]+\.[A-Z]{2,}", re.I)
-PHONE_RE = re.compile(r"(?:(?:\+|00)\d{1,3}[\s\-\.]?)?(?:\(?\d{2,4}\)?[\s\-\.]?)?\d{3,6}[\s\-\.]?\d{3,6}")
-WHATS_RE = re.compile(r"(?:https?://)?(?:wa\.me|api\.whatsapp\.com|chat\.whatsapp\.com)/[^\s\"']+", re.I)
+# Contacts: one scan over the visible text. Every quantifier is bounded and the lookbehinds reject starts inside a
+# word/number, so each position costs O(1) work and long digit runs (prices, IDs, tables) cannot backtrack.
+CONTACT_RE = re.compile(r"(?P<email>(?<![\w.%+\-])[\w.%+\-]{1,64}@[A-Za-z0-9\-]{1,63}(?:\.[A-Za-z0-9\-]{1,63}){1,8})"
+                        r"|(?P<phone>(?<![\w+])(?:\+|00)?\(?\d(?:[ ().\-/]{0,3}\d){5,16}(?!\d))")
+PHONE_LABEL_RE = re.compile(r"(?:tel|tlf|tfno|phone|mobile|m[oó]vil|telem[oó]vel|tel[eé]fono|telefone|call|ll[aá]m[ae]\w*|whatsapp|contact\w*)\W{0,4}$", re.I)
+JUNK_LABEL_RE = re.compile(r"(?:\bref|\bid|\bn[º°o]|\bcp|\bzip|postal|\bfax|iban|\bnif|\bcif|\bvat|\bdni|c[oó]d(?:igo)?|\bsku|\bmls|\blot)\W{0,4}$", re.I)
+CURRENCY_RE = re.compile(r"[€$£]|(?:eur|usd|gbp|euros?|d[oó]lar)", re.I)
+DATE_LIKE_RE = re.compile(r"\d{1,4}[./\-]\d{1,2}[./\-]\d{1,4}$")
+THOUSANDS_RE = re.compile(r"\d{1,3}(?:[.,]\d{3})+$")
+NON_DIGIT_RE = re.compile(r"\D")
+# WhatsApp links anywhere in the raw HTML (onclick handlers, chat widgets built in <script>), not only in <a href>
+WHATS_RE = re.compile(r"(?:https?://)?(?:wa\.me|api\.whatsapp\.com|chat\.whatsapp\.com)/[^\s\"'<>\\]{0,200}", re.I)
+NOT_EMAIL_TLDS = {"png", "jpg", "jpeg", "gif", "webp", "svg", "css", "js"}  # "logo@2x.png" and friends
+ORG_TYPES = {"organization", "localbusiness", "realestateagent"}
+
+CALLING_CODES = {
+    "ES":"34","PT":"351","FR":"33","IT":"39","DE":"49","GB":"44","IE":"353","NL":"31","BE":"32","LU":"352","CH":"41","AT":"43",
+    "DK":"45","SE":"46","NO":"47","FI":"358","IS":"354","PL":"48","CZ":"420","SK":"421","HU":"36","RO":"40","BG":"359","GR":"30",
+    "CY":"357","MT":"356","HR":"385","SI":"386","RS":"381","TR":"90","RU":"7","UA":"380","EE":"372","LV":"371","LT":"370",
+    "AD":"376","MC":"377","GI":"350","SM":"378","VA":"39","US":"1","CA":"1","DO":"1","PR":"1","MX":"52","GT":"502","CR":"506",
+    "PA":"507","CO":"57","VE":"58","EC":"593","PE":"51","BR":"55","BO":"591","CL":"56","AR":"54","UY":"598","PY":"595",
+    "AU":"61","NZ":"64","ZA":"27","MA":"212","EG":"20","AE":"971","SA":"966","QA":"974","IL":"972","IN":"91","TH":"66",
+    "ID":"62","MY":"60","SG":"65","PH":"63","JP":"81","CN":"86","HK":"852","KR":"82",
+}
+TRUNK_ZERO_KEPT = {"IT", "SM", "VA"}  # national numbers there keep their leading 0 after the country code
+ISO_BY_COUNTRY = {
+    "spain":"ES","españa":"ES","espanha":"ES","portugal":"PT","france":"FR","francia":"FR","frança":"FR","italy":"IT","italia":"IT",
+    "itália":"IT","germany":"DE","alemania":"DE","alemanha":"DE","deutschland":"DE","united kingdom":"GB","uk":"GB","england":"GB",
+    "reino unido":"GB","ireland":"IE","irlanda":"IE","netherlands":"NL","holland":"NL","países bajos":"NL","nederland":"NL",
+    "belgium":"BE","bélgica":"BE","belgique":"BE","switzerland":"CH","suiza":"CH","suíça":"CH","austria":"AT","greece":"GR",
+    "grecia":"GR","cyprus":"CY","chipre":"CY","malta":"MT","andorra":"AD","morocco":"MA","marruecos":"MA","marrocos":"MA",
+    "turkey":"TR","turquía":"TR","türkiye":"TR","united arab emirates":"AE","uae":"AE","emiratos árabes unidos":"AE",
+    "united states":"US","usa":"US","estados unidos":"US","eua":"US","canada":"CA","canadá":"CA","mexico":"MX","méxico":"MX",
+    "dominican republic":"DO","república dominicana":"DO","costa rica":"CR","panama":"PA","panamá":"PA","colombia":"CO",
+    "ecuador":"EC","peru":"PE","perú":"PE","brazil":"BR","brasil":"BR","argentina":"AR","chile":"CL","uruguay":"UY",
+    "australia":"AU","south africa":"ZA","sudáfrica":"ZA",
+}
 
 SOCIAL_DOMAINS = {
     "facebook.com":"Facebook","fb.com":"Facebook","instagram.com":"Instagram","twitter.com":"Twitter","x.com":"Twitter",
     "linkedin.com":"LinkedIn","youtube.com":"YouTube","wa.me":"WhatsApp","whatsapp.com":"WhatsApp",
-}
+}  # matched against a link's hostname and its parent domains (social_label)
 
 # Feature dictionaries (EN/ES/PT/NL/FR mix — uitbreidbaar)
 FEATURES = {
@@ -110,18 +225,71 @@ FEATURES = {
         "rental management","gestión de alquileres","key holding","sleutelbeheer"
     ],
 }
+FEATURE_COLUMNS = {"interior":"Interior Features", "exterior":"Exterior Features", "amenities":"Amenities", "services":"Services"}
+# "Yes"-flags and ordered picks, harvested in the same text scan as FEATURES
+FEATURE_FLAGS = {
+    "Parking": ["parking","garage","garaje","garagem","cochera","estacionamiento","carport"],
+    "Furnished": ["furnished","amueblado","mobiliado","gemeubileerd"],
+    "Air Conditioning": ["air conditioning","aire acondicionado","ar-condicionado","airco","climatisation"],
+    "Heating": ["heating","calefacción","aquecimento","chauffage","vloerverwarming"],
+}
+FEATURE_PICKS = {
+    "View": ["sea view","ocean view","city view","mountain view","lake view","vista al mar","vista a la montaña"],
+    "Flooring": ["hardwood","tile","ceramic","porcelain","marble","laminate","vinyl","parquet"],
+}
 
 # -------------- Session + retry --------------
+# timing of connection set-up (DNS + TCP + TLS, as urllib3 does them in one call) for fetch()
+_conn_timing = local()
+
+class _TimedConnect:
+    def connect(self):
+        t0 = time.monotonic()
+        try: return super().connect()
+        finally: _conn_timing.seconds = getattr(_conn_timing, "seconds", 0.0) + time.monotonic() - t0
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = type("TimedHTTPConnection", (_TimedConnect, HTTPConnection), {})
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = type("TimedHTTPSConnection", (_TimedConnect, HTTPSConnection), {})
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report their set-up time (direct and proxied pools)."""
+    POOLS = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+    def init_poolmanager(self, *a, **kw):
+        super().init_poolmanager(*a, **kw); self.poolmanager.pool_classes_by_scheme = self.POOLS
+    def proxy_manager_for(self, *a, **kw):
+        pm = super().proxy_manager_for(*a, **kw); pm.pool_classes_by_scheme = self.POOLS
+        return pm
+
+def take_connect_time():
+    t = getattr(_conn_timing, "seconds", 0.0); _conn_timing.seconds = 0.0
+    return t
+
 session = requests.Session()
-retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500,502,503,504])
-session.mount("http://", HTTPAdapter(max_retries=retry))
-session.mount("https://", HTTPAdapter(max_retries=retry))
+# connection-level retries only; status retries (429/5xx) go through fetch() so the domain controller sees them
+retry = Retry(total=FETCH_RETRIES, backoff_factor=RETRY_BACKOFF, status_forcelist=[], respect_retry_after_header=False)
+session.mount("http://", TimedAdapter(max_retries=retry))
+session.mount("https://", TimedAdapter(max_retries=retry))
 
 # -------------- Globals --------------
-domain_semaphores, domain_status = {}, {}
+domain_controllers = {}
 semaphores_lock = Lock()
 progress_lock = Lock()
-csv_lock = Lock()
+output_sinks = None  # OutputSinks while main() runs; direct file appends otherwise
+http_cache = None    # HttpCache with --http-cache
+discovery_memo = {}  # (kind, domain) -> Future with sitemap/API discovery results
+discovery_lock = Lock()
+browser_pool = None  # BrowserPool with --use-playwright
+image_stage = None   # ImageStage with --check-images / --mirror-images
+parse_processes = None  # ProcessPoolExecutor with --parse-pool process
+parse_processes_lock = Lock()
+cluster = None       # ClusterGate with --cluster
+proxy_pool = None    # ProxyPool with --proxies-file
+fingerprints = None  # FingerprintStore with --incremental
+response_archive = None  # ResponseArchive with --archive
+archive_reader = None    # ArchiveReader with --reparse (one per parse process)
 shutdown_flag = False
 
 def signal_handler(sig, frame):
@@ -134,8 +302,10 @@ signal.signal(signal.SIGTERM, signal_handler)
 # -------------- Utils --------------
 def now_iso(): return datetime.now(timezone.utc).isoformat()
 def write_error(msg):
+    line = f"{now_iso()} ERROR: {msg}\n"
+    if output_sinks: output_sinks.write_line(ERROR_LOG, line); return
     with open(ERROR_LOG, "a", encoding="utf-8") as f:
-        f.write(f"{now_iso()} ERROR: {msg}\n")
+        f.write(line)
 
 def absolute_url(u: str, base: str = "") -> str:
     if not u: return ""
@@ -144,23 +314,162 @@ def absolute_url(u: str, base: str = "") -> str:
 
 def soupify(html): return BeautifulSoup(html or "", "lxml")
 
-def fetch_url(url, headers=None, timeout=DEFAULT_TIMEOUT, proxy=None):
+def _detect_encoding(content):
+    det = requests.compat.chardet
+    return det.detect(content)["encoding"] if det is not None else "utf-8"
+
+CHARSET_RE = re.compile(r"""charset\s*=\s*["']?([\w.:\-]+)""", re.I)
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:\-]+)""", re.I)
+BOMS = ((b"\xef\xbb\xbf", "utf-8-sig"), (b"\xff\xfe", "utf-16"), (b"\xfe\xff", "utf-16"))
+
+def _codec(name):
+    try: return codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError): return None
+
+def sniff_encoding(content, headers):
+    """Cheap encoding detection for the streaming mode: BOM, Content-Type charset, <meta charset>/http-equiv in the
+    first 4 KB; chardet only as a last resort and only over the first 64 KB."""
+    for bom, enc in BOMS:
+        if content.startswith(bom): return enc
+    m = CHARSET_RE.search(headers.get("Content-Type","") or "")
+    enc = m and _codec(m.group(1))
+    if enc: return enc
+    m = META_CHARSET_RE.search(content[:4096])
+    enc = m and _codec(m.group(1))
+    return enc or _detect_encoding(content[:65536]) or "utf-8"
+
+def decode_response(content, headers, status):
+    """Body -> text the way requests does it (HTML pages re-detected from the bytes); shared by both fetch engines.
+    With --max-bytes the cheaper sniff_encoding() is used instead."""
+    if not content: return ""
+    if fetch_config["max_bytes"]:
+        try: return str(content, sniff_encoding(content, headers), errors="replace")
+        except (LookupError, TypeError): return str(content, errors="replace")
+    enc = requests.utils.get_encoding_from_headers(headers)
+    if status < 400 and "text/html" in (headers.get("Content-Type","") or ""):
+        try: enc = _detect_encoding(content) or enc
+        except Exception: pass
+    if not enc: enc = _detect_encoding(content)
+    try: return str(content, enc, errors="replace")
+    except (LookupError, TypeError): return str(content, errors="replace")
+
+def retry_backoff(attempt):
+    """urllib3 Retry backoff before retry number `attempt` (1-based): 0, then factor * 2**(n-1)."""
+    return 0 if attempt <= 1 else min(RETRY_BACKOFF * (2 ** (attempt - 1)), 120)
+
+def retry_after_seconds(value):
+    """Retry-After header (seconds or HTTP date) -> seconds to wait, or None."""
+    if not value: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try: return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except Exception: return None
+
+FetchResult = namedtuple("FetchResult", "text status headers elapsed cached proxy_failed", defaults=("", False))
+fetch_config = {"max_bytes": 0}  # --max-bytes: stream bodies and stop reading after this many (decoded) bytes
+
+def configure_fetch(args):
+    fetch_config.update(max_bytes=max(0, args.max_bytes))
+
+def read_body(r, max_bytes):
+    """(body, truncated) of a stream=True response, reading at most max_bytes. Always closes the response:
+    a fully read connection goes back to the pool, an abandoned one is dropped."""
+    buf = bytearray()
     try:
-        r = session.get(url, headers=headers or HEADERS, timeout=timeout, proxies=proxy)
-        if r.ok and "text/html" in r.headers.get("Content-Type",""):
-            try: r.encoding = r.apparent_encoding or r.encoding
-            except Exception: pass
-            return r.text
-        return r.text or ""
-    except Exception as e:
-        write_error(f"fetch_url({url}) -> {e}")
-        return ""
+        for chunk in r.iter_content(65536):
+            buf += chunk
+            if len(buf) >= max_bytes: return bytes(buf[:max_bytes]), True
+        return bytes(buf), False
+    finally: r.close()
+
+BLOCK_RE = re.compile(r"access denied|cf-chl-bypass|captcha", re.I)
+
+def retry_wait(status, headers, attempt):
+    """Seconds to wait before retrying a RETRY_STATUSES response, or None when Retry-After is too long to wait for."""
+    ra = retry_after_seconds(headers.get("Retry-After")) if status in (429, 503) else None
+    if ra is None: return retry_backoff(attempt)
+    return ra if ra <= RETRY_AFTER_MAX_WAIT else None
+
+def cache_request(url, headers):
+    """(cache entry or None, request headers with its validators) for a GET about to be sent."""
+    entry = http_cache.lookup(url) if http_cache else None
+    headers = dict(headers or HEADERS)
+    if entry: headers.update(entry.validators())
+    return entry, headers
+
+def cache_response(url, entry, status, headers, body, truncated=False):
+    """Serve a 304 from the cache entry / store a fresh 200 (never a --max-bytes truncated one); returns (status, headers, body, cached)."""
+    if status == 304 and entry:
+        http_cache.revalidated(url, headers)
+        return 200, entry.headers, entry.body, "304"
+    if status == 200 and http_cache and not truncated: http_cache.store(url, headers, body)
+    return status, headers, body, ""
+
+def response_outcome(status, blocked=False):
+    """Proxy-pool verdict on one response: "proxy" (407 from the proxy), "site" (error or block page) or "ok"."""
+    return "proxy" if status == 407 else "site" if status >= 400 or blocked else "ok"
+
+def fetch(url, headers=None, timeout=DEFAULT_TIMEOUT, proxy=None):
+    """GET with status retries; every attempt is reported to the domain's rate controller and health record.
+    Without an explicit proxy each attempt takes one from the proxy pool; a proxy-side failure is retried on
+    another proxy and is not held against the domain (proxy_failed=True when no proxy got through)."""
+    domain = get_domain(url)
+    entry, req_headers = cache_request(url, headers)
+    if entry and entry.fresh:
+        archive_response(url, 200, entry.headers, entry.body)
+        return FetchResult(decode_response(entry.body, entry.headers, 200), 200, entry.headers, 0.0, "fresh")
+    max_bytes = fetch_config["max_bytes"]; attempt = 0; tried = set()
+    while attempt <= FETCH_RETRIES:
+        pooled = proxy_pool.acquire(domain, tried, timeout) if proxy is None and proxy_pool else None
+        if proxy is None and proxy_pool and pooled is None:
+            write_error(f"fetch_url({url}) -> no usable proxy"); return FetchResult("", 0, {}, 0.0, "", True)
+        t0 = time.monotonic(); take_connect_time()
+        try:
+            r = session.get(url, headers=req_headers, timeout=timeout, proxies=pooled.proxies if pooled else proxy, stream=bool(max_bytes))
+            body, truncated = read_body(r, max_bytes) if max_bytes else (r.content, False)
+        except Exception as e:
+            elapsed = time.monotonic() - t0
+            if pooled:
+                proxy_pool.done(pooled, domain, "proxy" if is_proxy_error(e) else "site", elapsed)
+                if is_proxy_error(e):
+                    metrics.event("proxy.failover"); tried.add(pooled.name); continue
+            observe_response(domain, None, elapsed)
+            metrics.response(domain, None, elapsed)
+            write_error(f"fetch_url({url}) -> {e}")
+            return FetchResult("", 0, {}, elapsed)
+        elapsed = time.monotonic() - t0
+        connect, headers_at = take_connect_time(), r.elapsed.total_seconds()
+        if connect: metrics.stage("fetch.connect", connect)
+        metrics.stage("fetch.ttfb", max(0.0, headers_at - connect)); metrics.stage("fetch.download", max(0.0, elapsed - headers_at))
+        if pooled and r.status_code == 407:
+            proxy_pool.done(pooled, domain, "proxy", elapsed); metrics.event("proxy.failover"); tried.add(pooled.name); continue
+        metrics.response(domain, r.status_code, elapsed, len(body))
+        if truncated: metrics.event("fetch.truncated")
+        if r.status_code in RETRY_STATUSES:
+            if pooled: proxy_pool.done(pooled, domain, "site", elapsed)
+            observe_response(domain, r.status_code, elapsed, r.headers.get("Retry-After"))
+            attempt += 1
+            wait = retry_wait(r.status_code, r.headers, attempt) if attempt <= FETCH_RETRIES else None
+            if wait is None:
+                write_error(f"fetch_url({url}) -> too many {r.status_code} error responses")
+                return FetchResult("", r.status_code, r.headers, elapsed)
+            time.sleep(wait); continue
+        status, resp_headers, body, cached = cache_response(url, entry, r.status_code, r.headers, body, truncated)
+        archive_response(url, status, resp_headers, body, truncated)
+        text = decode_response(body, resp_headers, status)
+        blocked = bool(BLOCK_RE.search(text))
+        if pooled: proxy_pool.done(pooled, domain, response_outcome(r.status_code, blocked), elapsed)
+        observe_response(domain, r.status_code, elapsed, blocked=blocked)
+        return FetchResult(text, status, resp_headers, elapsed, cached)
+    return FetchResult("", 0, {}, 0.0)
+
+def fetch_url(url, headers=None, timeout=DEFAULT_TIMEOUT, proxy=None):
+    return fetch(url, headers=headers, timeout=timeout, proxy=proxy).text
 
 def head_check(url, timeout=8, proxy=None):
     try:
-        r = session.head(url, timeout=timeout, headers=HEADERS, proxies=proxy, allow_redirects=True)
-        ct = r.headers.get("Content-Type","").lower()
-        return r.status_code < 400 and ("image" in ct)
+        status, ct, _ = probe_image(url, timeout=timeout, proxy=proxy)
+        return status < 400 and ct.startswith("image/")
     except Exception:
         return False
 
@@ -180,45 +489,847 @@ def get_domain(u):
     try: return urlparse(u).netloc.lower()
     except Exception: return u
 
+TRACKING_PARAM_RE = re.compile(r"^(utm_\w+|hsa_\w+|gclid|gbraid|wbraid|dclid|fbclid|msclkid|yclid|igshid|mc_cid|mc_eid|_ga|_gl|_hsenc|_hsmi|mkt_tok|ref_src)$", re.I)
+
+def canonical_url(u):
+    """Dedupe key for a URL: scheme dropped, host lower-cased without default port/userinfo, tracking params removed,
+    remaining params sorted, escapes normalised, no fragment and no trailing slash. Not meant to be fetched."""
+    u = (u or "").strip()
+    p = urlsplit(u if "//" in u else "//" + u)
+    try: port = p.port
+    except ValueError: port = None
+    netloc = (p.hostname or "").rstrip(".") + (f":{port}" if port and port not in (80, 443) else "")
+    path = quote(unquote(re.sub(r"/{2,}", "/", p.path or "/")), safe="/:@!$&'()*+,;=~%")
+    if len(path) > 1: path = path.rstrip("/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(p.query, keep_blank_values=True) if not TRACKING_PARAM_RE.match(k)))
+    return netloc + path + ("?" + query if query else "")
+
+# -------------- Per-domain rate control --------------
+class DomainController:
+    """Politeness for one domain: an adaptive concurrency limit plus a token bucket.
+
+    AIMD: every healthy response adds 1/limit to the limit (about +1 per round trip) up to `ceiling`;
+    429/503/CAPTCHA pages halve it and double the request interval, errors and latency spikes cut it
+    by a quarter (at most one cut per round-trip time). Retry-After blocks new requests until it expires.
+    With adaptive=False the limit and interval stay fixed (old semaphore + throttle behaviour).
+    """
+    LATENCY_SPIKE = 3.0
+    MAX_INTERVAL = 30.0
+
+    def __init__(self, limit, ceiling=DEFAULT_DOMAIN_CONCURRENCY_CEILING, interval=0.0, adaptive=True):
+        self.limit = float(max(1, limit)); self.ceiling = max(self.limit, float(ceiling)) if adaptive else self.limit
+        self.base_interval = self.interval = max(0.0, interval); self.adaptive = adaptive
+        self.inflight = 0; self.tokens = 1.0; self.refilled = time.monotonic()
+        self.blocked_until = 0.0; self.last_cut = 0.0
+        self.lat_ewma = self.lat_base = None
+        self.stats = Counter()
+        self.cond = Condition(Lock())
+
+    def _try_acquire(self):
+        """Take a slot and a token, or return how long to wait before trying again."""
+        now = time.monotonic()
+        if now < self.blocked_until: return self.blocked_until - now
+        if self.inflight >= int(self.limit): return 0.25
+        if self.interval > 0:
+            self.tokens = min(max(1.0, self.limit), self.tokens + (now - self.refilled) / self.interval); self.refilled = now
+            if self.tokens < 1: return (1 - self.tokens) * self.interval
+            self.tokens -= 1
+        self.inflight += 1
+        return None
+
+    def try_acquire(self):
+        with self.cond: return self._try_acquire() is None
+
+    def poll(self):
+        """Non-blocking acquire: None when a slot was taken, else seconds to wait before retrying."""
+        with self.cond: return self._try_acquire()
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                wait = self._try_acquire()
+                if wait is None: return
+                self.cond.wait(timeout=min(wait, 1.0))
+
+    async def acquire_async(self):
+        while True:
+            with self.cond: wait = self._try_acquire()
+            if wait is None: return
+            await asyncio.sleep(min(wait, 0.25))
+
+    def release(self):
+        with self.cond:
+            self.inflight = max(0, self.inflight - 1); self.cond.notify()
+
+    def _cut(self, factor, now):
+        if now - self.last_cut < max(self.lat_ewma or 0.0, 1.0): return False
+        self.limit = max(1.0, self.limit * factor); self.last_cut = now
+        return True
+
+    def observe(self, status, latency, retry_after=None, blocked=False):
+        """Feed back one response (status None = network error)."""
+        with self.cond:
+            now = time.monotonic()
+            self.stats[status or "error"] += 1
+            ra = retry_after_seconds(retry_after) if status in (429, 503) else None
+            if ra: self.blocked_until = max(self.blocked_until, now + ra)
+            if not self.adaptive: return
+            if status in (429, 503) or blocked:
+                self.stats["throttled"] += 1
+                if self._cut(0.5, now): self.interval = min(self.MAX_INTERVAL, max(self.interval * 2, 0.5))
+            elif status is None or status >= 500:
+                self._cut(0.75, now)
+            else:
+                spike = self.lat_base is not None and latency > max(self.LATENCY_SPIKE * self.lat_base, 1.0)
+                self.lat_ewma = latency if self.lat_ewma is None else 0.8 * self.lat_ewma + 0.2 * latency
+                self.lat_base = self.lat_ewma if self.lat_base is None else min(self.lat_base * 1.01, self.lat_ewma)
+                if spike: self._cut(0.75, now)
+                else:
+                    self.limit = min(self.ceiling, self.limit + 1.0 / self.limit)
+                    self.interval = max(self.base_interval, self.interval * 0.9) if self.interval > 0.05 else self.base_interval
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            return {"limit": round(self.limit, 2), "inflight": self.inflight, "interval": round(self.interval, 3),
+                    "latency_ewma": round(self.lat_ewma or 0.0, 3), **{str(k): v for k, v in self.stats.items()}}
+
+rate_config = {"ceiling": DEFAULT_DOMAIN_CONCURRENCY_CEILING, "interval": 0.0, "adaptive": True}
+
+def configure_rate_control(args):
+    rate_config.update(ceiling=args.domain_concurrency_ceiling, interval=args.throttle_seconds, adaptive=(args.rate_control == "adaptive"))
+
 def ensure_semaphore_for(domain, concurrency):
     with semaphores_lock:
-        domain_semaphores.setdefault(domain, Semaphore(concurrency))
-        domain_status.setdefault(domain, {"fails":0, "cooldown_until":0})
+        if domain not in domain_controllers:
+            domain_controllers[domain] = DomainController(concurrency, **rate_config)
+    return domain_controllers[domain]
+
+_prepaid = local()  # slot already taken for this thread by DomainScheduler
+
+@contextmanager
+def domain_slot(domain):
+    ctl = domain_controllers[domain]
+    if getattr(_prepaid, "domain", None) == domain: _prepaid.domain = None
+    else:
+        with metrics.timed("wait.domain_slot"): ctl.acquire()
+    try: yield ctl
+    finally: ctl.release()
+
+def observe_response(domain, status, latency, retry_after=None, blocked=False):
+    """Feed one response (status None = network error) to the domain's rate controller and health record."""
+    ctl = domain_controllers.get(domain)
+    if ctl: ctl.observe(status, latency, retry_after, blocked)
+    domain_health.observe(domain, status, latency, blocked)
+
+# -------------- Domain health (circuit breaker) --------------
+Deferred = namedtuple("Deferred", "domain until")  # task result: the domain's breaker is open, run it again at `until`
+
+class DomainRecord:
+    __slots__ = ("fails", "cooldown_until", "probe_at", "trips", "requests", "ok", "blocked", "errors", "lat", "last_success", "last_failure", "dirty")
+    def __init__(self):
+        self.fails = self.trips = self.requests = self.ok = self.blocked = self.errors = 0
+        self.cooldown_until = self.probe_at = self.last_success = self.last_failure = 0.0
+        self.lat = None; self.dirty = True
+
+class DomainHealth:
+    """Circuit breaker + response stats per domain, shared by all threads and kept in domain_health.sqlite across runs.
+
+    closed: requests flow; fail_threshold failed tasks in a row open the breaker for cooldown_seconds.
+    open: allow() refuses until the cooldown ends; tasks come back as Deferred and the gates re-queue them.
+    half-open: the first allow() after the cooldown is a probe; its success closes the breaker, its failure reopens
+    it for another cooldown, and a probe that never reports back is replaced after DOMAIN_PROBE_TIMEOUT.
+    A cooldown loaded from an earlier run still applies; one that ended in the meantime starts half-open.
+    """
+    COLUMNS = "fails cooldown_until trips requests ok blocked errors lat last_success last_failure".split()
+
+    def __init__(self):
+        self.lock = Lock(); self.records = defaultdict(DomainRecord); self.db = None
+
+    def load(self, path=DOMAIN_HEALTH_FILE):
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, {', '.join(self.COLUMNS)})")
+        with self.lock:
+            for domain, *values in self.db.execute(f"SELECT domain, {', '.join(self.COLUMNS)} FROM domains"):
+                rec = self.records[domain]
+                for k, v in zip(self.COLUMNS, values): setattr(rec, k, v)
+                rec.dirty = False
+
+    def save(self):
+        if self.db is None: return
+        with self.lock:
+            rows = [(d, *(getattr(r, k) for k in self.COLUMNS)) for d, r in self.records.items() if r.dirty]
+            for r in self.records.values(): r.dirty = False
+        self.db.executemany(f"INSERT OR REPLACE INTO domains VALUES (?{', ?' * len(self.COLUMNS)})", rows); self.db.commit()
+
+    def close(self):
+        if self.db is None: return
+        self.save(); self.db.close(); self.db = None
+
+    @staticmethod
+    def _state(rec, now):
+        if not rec.cooldown_until: return "closed"
+        return "open" if now < rec.cooldown_until else "half-open"
+
+    def retry_at(self, domain, now=None):
+        """0 when a task for domain may start now (a half-open domain's probe included), else when to ask again."""
+        now = now or time.time()
+        with self.lock:
+            rec = self.records.get(domain)
+            if rec is None or not rec.cooldown_until: return 0
+            if now < rec.cooldown_until: return rec.cooldown_until
+            return now + DOMAIN_PROBE_RETRY if rec.probe_at and now - rec.probe_at < DOMAIN_PROBE_TIMEOUT else 0
+
+    def allow(self, domain, now=None):
+        """True if a task may fetch now; a half-open domain gives True to one probe only."""
+        now = now or time.time()
+        with self.lock:
+            rec = self.records.get(domain)
+            if rec is None or not rec.cooldown_until: return True
+            if now < rec.cooldown_until or (rec.probe_at and now - rec.probe_at < DOMAIN_PROBE_TIMEOUT): return False
+            rec.probe_at = now
+        metrics.event("breaker.probe")
+        return True
+
+    def failure(self, domain, threshold, cooldown):
+        now = time.time()
+        with self.lock:
+            rec = self.records[domain]; rec.fails += 1; rec.last_failure = now; rec.dirty = True
+            if not rec.probe_at and rec.fails < threshold: return
+            rec.cooldown_until = until = now + cooldown; rec.fails = 0; rec.probe_at = 0.0; rec.trips += 1
+        metrics.trip(domain)
+        if cluster: cluster.trip(domain, until)
+
+    def success(self, domain):
+        with self.lock:
+            rec = self.records[domain]; rec.fails = 0; rec.dirty = True
+            closing = bool(rec.cooldown_until) and time.time() >= rec.cooldown_until
+            if closing: rec.cooldown_until = rec.probe_at = 0.0
+        if closing: metrics.event("breaker.closed")
+
+    def adopt_cooldown(self, domain, until):
+        """A cooldown decided elsewhere (another --cluster node)."""
+        with self.lock:
+            rec = self.records[domain]
+            if until > rec.cooldown_until: rec.cooldown_until = until; rec.probe_at = 0.0; rec.dirty = True
+
+    def observe(self, domain, status, latency, blocked=False):
+        now = time.time()
+        with self.lock:
+            rec = self.records[domain]; rec.requests += 1; rec.dirty = True
+            if status is None or status >= 500: rec.errors += 1
+            if blocked or status in (403, 429): rec.blocked += 1
+            elif status is not None and status < 400: rec.ok += 1; rec.last_success = now
+            if status is not None: rec.lat = latency if rec.lat is None else 0.8 * rec.lat + 0.2 * latency
+
+    def stats(self, domain):
+        """State, latency EWMA, block/error rates and last success (epoch seconds) of one domain; {} if never seen."""
+        now = time.time()
+        with self.lock:
+            rec = self.records.get(domain)
+            if rec is None: return {}
+            n = rec.requests or 1
+            return {"state": self._state(rec, now), "latency_ewma": round(rec.lat or 0.0, 3), "block_rate": round(rec.blocked / n, 3),
+                    "error_rate": round(rec.errors / n, 3), "last_success": rec.last_success, "trips": rec.trips, "cooldown_until": rec.cooldown_until}
+
+    def states(self):
+        now = time.time()
+        with self.lock: return Counter(self._state(r, now) for r in self.records.values())
+
+domain_health = DomainHealth()
+
+def open_domain_health():
+    try: domain_health.load()
+    except Exception as e: write_error(f"domain health store -> {e}")
+
+def close_domain_health():
+    domain_health.close()
 
 def domain_allowed(domain, now_ts, fail_threshold, cooldown_seconds):
-    st = domain_status.get(domain, {})
-    return now_ts >= st.get("cooldown_until", 0)
+    return domain_health.allow(domain, now_ts)
 
 def record_domain_fail(domain, fail_threshold, cooldown_seconds):
-    st = domain_status.setdefault(domain, {"fails":0, "cooldown_until":0})
-    st["fails"] += 1
-    if st["fails"] >= fail_threshold:
-        st["cooldown_until"] = time.time() + cooldown_seconds
-        st["fails"] = 0
+    domain_health.failure(domain, fail_threshold, cooldown_seconds)
 
 def record_domain_success(domain):
-    st = domain_status.setdefault(domain, {"fails":0, "cooldown_until":0})
-    st["fails"] = 0
+    domain_health.success(domain)
+
+# -------------- Metrics --------------
+class Histogram:
+    """Fixed-bucket histogram (Prometheus-style upper bounds; counts are per bucket, not cumulative)."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+    def __init__(self, bounds):
+        self.bounds = bounds; self.counts = [0] * (len(bounds) + 1); self.sum = 0.0; self.count = 0
+    def observe(self, v):
+        self.counts[bisect_left(self.bounds, v)] += 1; self.sum += v; self.count += 1
+    def as_dict(self):
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": dict(zip([*map(str, self.bounds), "+Inf"], self.counts))}
+
+class Metrics:
+    """Run-wide timings and counters: per-stage latency histograms (fetch.*, parse.*, output.*), per-domain
+    latency/status/bytes/circuit-breaker trips and event counts (fallbacks, manual review). write() dumps a
+    snapshot as JSON, or as Prometheus text when the file name ends in .prom."""
+    SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.lock = Lock(); self.started = time.time()
+        self.stages = defaultdict(lambda: Histogram(self.SECONDS))
+        self.domains = defaultdict(lambda: {"latency": Histogram(self.SECONDS), "status": Counter(), "bytes": 0, "trips": 0})
+        self.events = Counter()
+
+    def stage(self, name, seconds):
+        with self.lock: self.stages[name].observe(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        t0 = time.perf_counter()
+        try: yield
+        finally: self.stage(name, time.perf_counter() - t0)
+
+    def response(self, domain, status, latency, nbytes=0):
+        with self.lock:
+            d = self.domains[domain]; d["latency"].observe(latency); d["status"][str(status or "error")] += 1; d["bytes"] += nbytes
+
+    def trip(self, domain):
+        with self.lock: self.domains[domain]["trips"] += 1; self.events["circuit_breaker.trip"] += 1
+
+    def event(self, name, n=1):
+        with self.lock: self.events[name] += n
+
+    def merge_stages(self, stages):
+        """Fold {stage: (counts, sum, count)} recorded in another process (parse workers) into this run's histograms."""
+        with self.lock:
+            for name, (counts, total, n) in stages.items():
+                h = self.stages[name]; h.sum += total; h.count += n
+                for i, c in enumerate(counts): h.counts[i] += c
+
+    def snapshot(self):
+        with self.lock:
+            snap = {"uptime_seconds": round(time.time() - self.started, 1),
+                    "stages": {k: h.as_dict() for k, h in self.stages.items()},
+                    "domains": {k: {"latency": d["latency"].as_dict(), "status": dict(d["status"]), "bytes": d["bytes"], "trips": d["trips"]}
+                                for k, d in self.domains.items()},
+                    "events": dict(self.events)}
+        for dom, ctl in list(domain_controllers.items()):
+            if dom in snap["domains"]: snap["domains"][dom]["rate"] = ctl.snapshot()
+        for dom in snap["domains"]: snap["domains"][dom]["health"] = domain_health.stats(dom)
+        if proxy_pool: snap["proxies"] = proxy_pool.snapshot()
+        snap["output_queue"] = output_sinks.q.qsize() if output_sinks else 0
+        return snap
+
+    @staticmethod
+    def _prom_hist(name, labels, h):
+        lines, acc = [], 0
+        for le, n in h["buckets"].items():
+            acc += n; lines.append(f'{name}_bucket{{{labels},le="{le}"}} {acc}')
+        return lines + [f"{name}_sum{{{labels}}} {h['sum']}", f"{name}_count{{{labels}}} {h['count']}"]
+
+    def prometheus(self, snap):
+        q = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"')
+        out = ["# TYPE scrape_stage_seconds histogram"]
+        for k, h in snap["stages"].items(): out += self._prom_hist("scrape_stage_seconds", f'stage="{q(k)}"', h)
+        out.append("# TYPE scrape_domain_latency_seconds histogram")
+        for k, d in snap["domains"].items(): out += self._prom_hist("scrape_domain_latency_seconds", f'domain="{q(k)}"', d["latency"])
+        out.append("# TYPE scrape_domain_responses_total counter")
+        out += [f'scrape_domain_responses_total{{domain="{q(k)}",status="{st}"}} {n}' for k, d in snap["domains"].items() for st, n in d["status"].items()]
+        out.append("# TYPE scrape_domain_bytes_total counter")
+        out += [f'scrape_domain_bytes_total{{domain="{q(k)}"}} {d["bytes"]}' for k, d in snap["domains"].items()]
+        out.append("# TYPE scrape_domain_trips_total counter")
+        out += [f'scrape_domain_trips_total{{domain="{q(k)}"}} {d["trips"]}' for k, d in snap["domains"].items()]
+        out.append("# TYPE scrape_domain_breaker_state gauge")  # 0 closed, 1 half-open, 2 open
+        out += [f'scrape_domain_breaker_state{{domain="{q(k)}"}} {("closed", "half-open", "open").index(d["health"]["state"])}' for k, d in snap["domains"].items() if d.get("health")]
+        out.append("# TYPE scrape_domain_concurrency_limit gauge")
+        out += [f'scrape_domain_concurrency_limit{{domain="{q(k)}"}} {d["rate"]["limit"]}' for k, d in snap["domains"].items() if "rate" in d]
+        out.append("# TYPE scrape_events_total counter")
+        out += [f'scrape_events_total{{event="{q(k)}"}} {n}' for k, n in snap["events"].items()]
+        if "proxies" in snap:
+            out.append("# TYPE scrape_proxy_success_ratio gauge")
+            out += [f'scrape_proxy_success_ratio{{proxy="{q(k)}"}} {p["success"]}' for k, p in snap["proxies"].items()]
+            out.append("# TYPE scrape_proxy_quarantined_seconds gauge")
+            out += [f'scrape_proxy_quarantined_seconds{{proxy="{q(k)}"}} {p["quarantined_for"]}' for k, p in snap["proxies"].items()]
+        out += ["# TYPE scrape_output_queue_depth gauge", f"scrape_output_queue_depth {snap['output_queue']}"]
+        return "\n".join(out) + "\n"
+
+    def write(self, path):
+        snap = self.snapshot(); tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"): f.write(self.prometheus(snap))
+            else: json.dump(snap, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+metrics = Metrics()
+_metrics_stop = None
+
+def start_metrics(args):
+    """Write args.metrics_file every args.metrics_interval seconds (0 = only at the end of the run)."""
+    global _metrics_stop
+    if not args.metrics_file: return
+    _metrics_stop = Event()
+    def loop():
+        while not _metrics_stop.wait(args.metrics_interval or None):
+            try: metrics.write(args.metrics_file)
+            except Exception as e: write_error(f"metrics -> {e}")
+    Thread(target=loop, name="metrics", daemon=True).start()
+
+def stop_metrics(args):
+    global _metrics_stop
+    if _metrics_stop is None: return
+    _metrics_stop.set(); _metrics_stop = None
+    metrics.write(args.metrics_file)
+
+def start_profiler():
+    """cProfile the main thread and every thread started from now on (one profiler per thread)."""
+    import cProfile, threading
+    profilers = [cProfile.Profile()]; lock = Lock()
+    def per_thread(*_):
+        sys.setprofile(None); p = cProfile.Profile()
+        with lock: profilers.append(p)
+        p.enable()
+    threading.setprofile(per_thread)
+    profilers[0].enable()
+    return profilers
+
+def stop_profiler(profilers, path):
+    import pstats, threading
+    profilers[0].disable(); threading.setprofile(None)
+    stats = pstats.Stats(profilers[0])
+    for p in profilers[1:]:
+        try: stats.add(p)
+        except Exception: pass  # thread never ran any Python code
+    stats.dump_stats(path)
+    with open(path + ".txt", "w", encoding="utf-8") as f:
+        pstats.Stats(path, stream=f).sort_stats("cumulative").print_stats(60)
+
+# -------------- HTTP cache --------------
+class CacheEntry(namedtuple("CacheEntry", "body headers etag last_modified stored_at fresh")):
+    def validators(self):
+        v={}
+        if self.etag: v["If-None-Match"] = self.etag
+        if self.last_modified: v["If-Modified-Since"] = self.last_modified
+        return v
+
+class HttpCache:
+    """Persistent GET cache for repeat crawls: zlib-compressed bodies + validators in one SQLite file.
+
+    Entries with ETag/Last-Modified are always revalidated with a conditional GET (a 304 is served
+    from here); entries without validators are reused for `max_age` seconds. The total compressed
+    size is kept under `max_bytes` by evicting the least recently used entries.
+    """
+    KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+    def __init__(self, path=HTTP_CACHE_FILE, max_age=DEFAULT_CACHE_MAX_AGE, max_bytes=DEFAULT_CACHE_MAX_MB << 20):
+        self.max_age, self.max_bytes = max_age, max_bytes
+        self.lock = Lock(); self.stats = Counter()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL"); self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, headers TEXT, etag TEXT, last_modified TEXT,
+                           stored_at REAL, last_access REAL, size INTEGER, body BLOB)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+        self.total = self.db.execute("SELECT COALESCE(SUM(size),0) FROM responses").fetchone()[0]
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT headers, etag, last_modified, stored_at, body FROM responses WHERE url=?", (url,)).fetchone()
+            if not row: self.stats["miss"] += 1; return None
+            self.db.execute("UPDATE responses SET last_access=? WHERE url=?", (time.time(), url))
+        headers, etag, last_modified, stored_at, body = row
+        fresh = not (etag or last_modified) and time.time() - stored_at < self.max_age
+        if fresh: self.stats["fresh"] += 1
+        return CacheEntry(zlib.decompress(body), requests.structures.CaseInsensitiveDict(json.loads(headers)), etag, last_modified, stored_at, fresh)
+
+    def store(self, url, headers, body):
+        kept = {k: headers.get(k) for k in self.KEEP_HEADERS if headers.get(k)}
+        blob = zlib.compress(body or b"", 6); now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE url=?", (url,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?,?)",
+                            (url, json.dumps(kept), kept.get("ETag"), kept.get("Last-Modified"), now, now, len(blob), blob))
+            self.total += len(blob) - (old[0] if old else 0); self.stats["stored"] += 1
+            if self.total > self.max_bytes: self._evict()
+
+    def revalidated(self, url, headers):
+        with self.lock:
+            self.stats["revalidated"] += 1
+            etag, lm = headers.get("ETag"), headers.get("Last-Modified")
+            self.db.execute("UPDATE responses SET stored_at=?, etag=COALESCE(?,etag), last_modified=COALESCE(?,last_modified) WHERE url=?", (time.time(), etag, lm, url))
+
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        for url, size in self.db.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall():
+            if self.total <= target: break
+            self.db.execute("DELETE FROM responses WHERE url=?", (url,)); self.total -= size; self.stats["evicted"] += 1
+
+    def close(self):
+        with self.lock: self.db.close()
+
+def open_http_cache(args):
+    global http_cache
+    if args.http_cache:
+        http_cache = HttpCache(HTTP_CACHE_FILE, args.cache_max_age, args.cache_max_mb << 20)
+
+def close_http_cache():
+    global http_cache
+    if http_cache:
+        cache, http_cache = http_cache, None
+        cache.close()
+        return cache.stats
+    return None
+
+# -------------- Response archive (--archive / --reparse) --------------
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, url TEXT, file TEXT, offset INTEGER, length INTEGER, status INTEGER, fetched REAL);
+CREATE INDEX IF NOT EXISTS records_url ON records(url, id);
+"""
+ArchivedResponse = namedtuple("ArchivedResponse", "url status headers body date truncated")
+
+class ResponseArchive:
+    """Append-only, WARC-style store of every page this run fetched (or rendered), for --reparse.
+
+    archive/<run>.warc.gz holds one gzip member per record: a WARC/1.1 'response' header block (target URI, date,
+    record id, WARC-Truncated for --max-bytes cuts) followed by the HTTP status line, headers and body, so standard
+    WARC tools can read it and one seek + one decompress reads a single record back. archive/index.sqlite maps
+    URL -> (file, offset, length, status, time); the latest record of a URL wins. Index rows are committed with the
+    output checkpoints, after the data file is flushed, so the index never points past the end of a file.
+    """
+    DROP_HEADERS = ("content-encoding", "transfer-encoding", "content-length")  # the stored body is already decoded
+
+    def __init__(self, path=ARCHIVE_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.name = f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{os.getpid()}.warc.gz"
+        self.f = open(os.path.join(path, self.name), "ab")
+        self.db = sqlite3.connect(os.path.join(path, ARCHIVE_INDEX), timeout=60, check_same_thread=False)
+        self.db.executescript(ARCHIVE_SCHEMA)
+        self.lock = Lock(); self.pending = []; self.stats = Counter()
+
+    def add(self, url, status, headers, body, truncated=False):
+        import gzip, uuid
+        from http.client import responses as reasons
+        now = datetime.now(timezone.utc); body = body or b""
+        kept = "".join(f"{k}: {v}\r\n" for k, v in (headers or {}).items() if k.lower() not in self.DROP_HEADERS)
+        http = f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n{kept}\r\n".encode("utf-8", "replace")
+        warc = (f"WARC/1.1\r\nWARC-Type: response\r\nWARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\nWARC-Date: {now:%Y-%m-%dT%H:%M:%SZ}\r\n"
+                f"WARC-Target-URI: {url}\r\nContent-Type: application/http;msgtype=response\r\n"
+                + ("WARC-Truncated: length\r\n" if truncated else "") + f"Content-Length: {len(http) + len(body)}\r\n\r\n").encode("utf-8", "replace")
+        record = gzip.compress(warc + http + body + b"\r\n\r\n", 6, mtime=0)
+        with self.lock:
+            offset = self.f.tell(); self.f.write(record)
+            self.pending.append((url, self.name, offset, len(record), status, now.timestamp()))
+            self.stats["records"] += 1; self.stats["bytes"] += len(record)
+
+    def flush(self):
+        with self.lock:
+            self.f.flush(); rows, self.pending = self.pending, []
+        if rows:
+            self.db.executemany("INSERT INTO records (url, file, offset, length, status, fetched) VALUES (?,?,?,?,?,?)", rows); self.db.commit()
+
+    def close(self):
+        self.flush(); self.f.close(); self.db.close()
+
+class ArchiveReader:
+    """Read side of ResponseArchive: the latest record of a URL with one indexed lookup and one seek."""
+    def __init__(self, path):
+        self.path, self.files = path, {}
+        self.db = sqlite3.connect(f"file:{os.path.join(path, ARCHIVE_INDEX)}?mode=ro", uri=True, check_same_thread=False)
+
+    def get(self, url):
+        import gzip
+        row = self.db.execute("SELECT file, offset, length FROM records WHERE url=? ORDER BY id DESC LIMIT 1", (url,)).fetchone()
+        if not row: return None
+        name, offset, length = row
+        f = self.files.get(name) or self.files.setdefault(name, open(os.path.join(self.path, name), "rb"))
+        f.seek(offset); data = gzip.decompress(f.read(length))
+        head, _, rest = data.partition(b"\r\n\r\n")
+        warc = dict(line.split(": ", 1) for line in head.decode("utf-8", "replace").split("\r\n")[1:] if ": " in line)
+        status_line, _, rest = rest[:int(warc["Content-Length"])].partition(b"\r\n")
+        http_head, _, body = (b"\r\n" + rest).partition(b"\r\n\r\n")
+        headers = requests.structures.CaseInsensitiveDict(line.split(": ", 1) for line in http_head.decode("utf-8", "replace").split("\r\n") if ": " in line)
+        return ArchivedResponse(url, int(status_line.split()[1]), headers, body, warc.get("WARC-Date", ""), "WARC-Truncated" in warc)
+
+    def close(self):
+        for f in self.files.values(): f.close()
+        self.db.close()
+
+def archive_response(url, status, headers, body, truncated=False):
+    if response_archive: response_archive.add(url, status, headers, body, truncated)
+
+def start_response_archive(args):
+    global response_archive
+    if args.archive: response_archive = ResponseArchive(ARCHIVE_DIR)
+
+def close_response_archive():
+    global response_archive
+    if response_archive is None: return None
+    archive, response_archive = response_archive, None
+    archive.close()
+    return archive.stats
+
+def open_archive_reader(path):
+    global archive_reader
+    archive_reader = ArchiveReader(path) if path else None
+
+# -------------- Keyword matcher --------------
+_is_word = re.compile(r"\w").match
+_word_end = re.compile(r"(?:e?s)?(?!\w)").match  # end of a whole-word hit: a plural "s"/"es" may follow the keyword
+
+def _trie_pattern(words):
+    trie={}
+    for w in words:
+        n=trie
+        for ch in w: n=n.setdefault(ch,{})
+        n[""]={}
+    def build(n):
+        alts=[]
+        for ch in sorted(k for k in n if k):
+            lit, sub = ch, n[ch]
+            while len(sub) == 1 and "" not in sub:
+                (c, sub), = sub.items(); lit += c
+            alts.append(re.escape(lit) + build(sub))
+        if not alts: return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in n else body
+    return build(trie)
+
+class KeywordMatcher:
+    """Finds every keyword of several named groups in one pass over a (lowercased) text.
+
+    Uses a pyahocorasick automaton when installed, otherwise a single trie-compiled regex.
+    With word_boundary a hit may not sit inside a longer word ("tile" does not match "textile") but may be followed
+    by a plural "s"/"es" ("tiles", "garages" and "sea views" still match "tile", "garage" and "sea view").
+    """
+    def __init__(self, groups, word_boundary=False):
+        self.word_boundary = word_boundary
+        self.group_names = list(groups)
+        self.groups_of = defaultdict(set)
+        for g, kws in groups.items():
+            for k in kws:
+                k = str(k).strip().lower()
+                if k: self.groups_of[k].add(g)
+        self._automaton = self._regex = None
+        try:
+            import ahocorasick
+            self._automaton = ahocorasick.Automaton()
+            for k in self.groups_of: self._automaton.add_word(k, k)
+            self._automaton.make_automaton()
+        except ImportError:
+            self._build_regex()
+
+    def _build_regex(self):
+        kws = list(self.groups_of)
+        if not kws:
+            self._regex = re.compile(r"(?!)"); self._prefixes = {}; return
+        trie = _trie_pattern(kws)
+        # zero-width lookahead so overlapping hits are reported; the engine returns the longest keyword
+        # starting at each position and _prefixes expands it to the shorter keywords it contains there
+        self._regex = re.compile(r"(?<!\w)(?=(" + trie + r")(?:e?s)?(?!\w))" if self.word_boundary else "(?=(" + trie + "))")
+        self._prefixes = {k: [p for p in kws if p != k and k.startswith(p) and not (self.word_boundary and not _word_end(k, len(p)))] for k in kws}
+
+    def _iter_keywords(self, text):
+        if self._automaton is not None:
+            for end, kw in self._automaton.iter(text):
+                start = end - len(kw) + 1
+                if self.word_boundary and ((start and _is_word(text[start-1])) or not _word_end(text, end+1)): continue
+                yield kw
+            return
+        seen=set()
+        for m in self._regex.finditer(text):
+            kw = m.group(1)
+            if kw in seen: continue
+            seen.add(kw); yield kw; yield from self._prefixes[kw]
+
+    def scan(self, text):
+        """Return {group: set(keywords found)} for every group."""
+        hits = {g: set() for g in self.group_names}
+        for kw in self._iter_keywords(text or ""):
+            for g in self.groups_of[kw]: hits[g].add(kw)
+        return hits
+
+def load_feature_dictionaries(path):
+    """Extend FEATURES / FEATURE_FLAGS / FEATURE_PICKS from a JSON or YAML file shaped like
+    {"features": {"interior": [...]}, "flags": {"Parking": [...]}, "picks": {"View": [...]}}."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yml", ".yaml")):
+            import yaml  # optional: pip install pyyaml
+            data = yaml.safe_load(f) or {}
+        else:
+            data = json.load(f)
+    for key, target in (("features", FEATURES), ("flags", FEATURE_FLAGS), ("picks", FEATURE_PICKS)):
+        for name, kws in (data.get(key) or {}).items():
+            if name not in target:
+                write_error(f"load_feature_dictionaries({path}) -> unknown {key} group '{name}' ignored"); continue
+            cur = target[name]
+            cur.extend(k for k in kws if k not in cur)
+
+def build_feature_matcher(word_boundary=False):
+    return KeywordMatcher({**FEATURES, **FEATURE_FLAGS, **FEATURE_PICKS}, word_boundary=word_boundary)
+
+FEATURE_MATCHER = build_feature_matcher()
+
+def configure_features(path="", word_boundary=False):
+    global FEATURE_MATCHER
+    if path:
+        try: load_feature_dictionaries(path)
+        except Exception as e: write_error(f"Features file failed: {e}")
+    FEATURE_MATCHER = build_feature_matcher(word_boundary)
+
+# -------------- Parsed page --------------
+JSONLD_TYPE = "application/ld+json"
+
+class ParsedPage:
+    """One fetched response, parsed once. DOM, visible text, JSON-LD and meta are built lazily and shared by every extractor.
+    This is the BeautifulSoup backend (--parser bs4); LxmlPage/ScanPage produce the same values from a raw lxml tree."""
+    def __init__(self, html, url=""):
+        self.html = html or ""; self.url = url
+
+    @cached_property
+    def soup(self):
+        with metrics.timed("parse.soup"): return soupify(self.html)
+
+    @cached_property
+    def text(self):
+        s = self.soup
+        with metrics.timed("parse.text"): return s.get_text(" ", strip=True) or ""
+
+    @cached_property
+    def text_lower(self): return self.text.lower()
+
+    @cached_property
+    def feature_hits(self):
+        t = self.text_lower
+        with metrics.timed("parse.features"): return FEATURE_MATCHER.scan(t)
+
+    def jsonld_sources(self):
+        """Raw contents of the <script type="application/ld+json"> blocks (None for an empty block)."""
+        return [sc.string for sc in self.soup.find_all("script", type=JSONLD_TYPE)]
+
+    @cached_property
+    def jsonld(self):
+        arr=[]
+        with metrics.timed("parse.jsonld"):
+            for src in self.jsonld_sources():
+                try:
+                    data = json.loads(src or "{}")
+                    arr.extend(data if isinstance(data, list) else [data])
+                except Exception: continue
+        return arr
+
+    @cached_property
+    def meta(self):
+        """(title, description, raw og:image, lang) — og:image is resolved against a base URL by extract_meta."""
+        s = self.soup
+        with metrics.timed("parse.meta"):
+            title = s.title.text.strip() if s.title else ""
+            md = s.find("meta", {"name":"description"}) or s.find("meta", {"property":"og:description"})
+            desc = (md.get("content") or "").strip() if md else ""
+            og = s.find("meta", {"property":"og:image"})
+            og_raw = (og.get("content") or "").strip() if og else ""
+            html_tag = s.find("html")
+            lang = html_tag.get("lang","").strip() if html_tag else ""
+        return title, desc, og_raw, lang
+
+    @cached_property
+    def hrefs(self):
+        """href of every <a href>, in document order."""
+        return [a["href"] for a in self.soup.find_all("a", href=True)]
+
+    @cached_property
+    def scripts(self):
+        """Contents of every <script> ("" when empty)."""
+        return [sc.string or "" for sc in self.soup.find_all("script")]
+
+    @cached_property
+    def feeds(self):
+        """(type, href) of every <link> carrying both attributes."""
+        return [(link.get("type",""), link.get("href")) for link in self.soup.find_all("link", type=True, href=True)]
+
+# text nodes BeautifulSoup's get_text() keeps: no comments, nothing inside script/style/template/ruby annotations
+LXML_TEXT_XPATH = "//text()[not(ancestor::script or ancestor::style or ancestor::template or ancestor::rt or ancestor::rp)]"
+
+def lxml_document(html):
+    """lxml.html root for html, or None when there is no document (empty/comment-only)."""
+    import lxml.html
+    from lxml import etree
+    try: return lxml.html.document_fromstring(html)
+    except ValueError:  # str carrying an <?xml encoding=...?> declaration
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+    except etree.ParserError: return None
+
+class LxmlPage(ParsedPage):
+    """--parser lxml: the same extraction on a raw lxml.html tree (no BeautifulSoup objects)."""
+    @cached_property
+    def tree(self):
+        with metrics.timed("parse.tree"): return lxml_document(self.html) if self.html.strip() else None
+
+    @cached_property
+    def text(self):
+        root = self.tree
+        if root is None: return ""
+        with metrics.timed("parse.text"):
+            return " ".join(t for t in (s.strip() for s in root.xpath(LXML_TEXT_XPATH, smart_strings=False)) if t)
+
+    def _first(self, path):
+        return self.tree.find(path) if self.tree is not None else None
+
+    def jsonld_sources(self):
+        return [sc.text for sc in self.tree.iter("script") if sc.get("type") == JSONLD_TYPE] if self.tree is not None else []
+
+    @cached_property
+    def meta(self):
+        root = self.tree
+        with metrics.timed("parse.meta"):
+            t = self._first(".//title")
+            title = t.xpath("string()").strip() if t is not None else ""
+            md = self._first(".//meta[@name='description']")
+            if md is None: md = self._first(".//meta[@property='og:description']")
+            desc = (md.get("content") or "").strip() if md is not None else ""
+            og = self._first(".//meta[@property='og:image']")
+            og_raw = (og.get("content") or "").strip() if og is not None else ""
+            lang = (root.get("lang") or "").strip() if root is not None else ""
+        return title, desc, og_raw, lang
+
+    @cached_property
+    def hrefs(self):
+        return [a.get("href") for a in self.tree.iter("a") if a.get("href") is not None] if self.tree is not None else []
+
+    @cached_property
+    def scripts(self):
+        return [sc.text or "" for sc in self.tree.iter("script")] if self.tree is not None else []
+
+    @cached_property
+    def feeds(self):
+        if self.tree is None: return []
+        return [(l.get("type"), l.get("href")) for l in self.tree.iter("link") if l.get("type") is not None and l.get("href") is not None]
+
+SCRIPT_TAG_RE = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.I | re.S)
+TYPE_ATTR_RE = re.compile(r"""\btype\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.I)
+
+class ScanPage(LxmlPage):
+    """--parser scan: LxmlPage, but JSON-LD blocks are cut out of the raw HTML without building a tree
+    (pages that only need JSON-LD never get parsed)."""
+    def jsonld_sources(self):
+        if "ld+json" not in self.html: return []
+        out = []
+        for m in SCRIPT_TAG_RE.finditer(self.html):
+            t = TYPE_ATTR_RE.search(m.group(1))
+            if t and next(v for v in t.groups() if v is not None) == JSONLD_TYPE: out.append(m.group(2) or None)
+        return out
+
+PARSERS = {"bs4": ParsedPage, "lxml": LxmlPage, "scan": ScanPage}
+PAGE_CLASS = ParsedPage
+
+def configure_parser(name="bs4"):
+    global PAGE_CLASS
+    PAGE_CLASS = PARSERS[name]
+
+def as_page(html, url=""):
+    return html if isinstance(html, ParsedPage) else PAGE_CLASS(html, url)
 
 # -------------- Parsers --------------
 def parse_jsonld(html):
-    s = soupify(html); arr=[]
-    for sc in s.find_all("script", type="application/ld+json"):
-        try:
-            data = json.loads(sc.string or "{}")
-            arr.extend(data if isinstance(data, list) else [data])
-        except Exception: continue
-    return arr
+    return as_page(html).jsonld
 
 def extract_meta(html, base_url=""):
-    s = soupify(html)
-    title = s.title.text.strip() if s.title else ""
-    md = s.find("meta", {"name":"description"}) or s.find("meta", {"property":"og:description"})
-    desc = (md.get("content") or "").strip() if md else ""
-    og = s.find("meta", {"property":"og:image"})
-    og_image = absolute_url((og.get("content") or "").strip(), base_url) if og else ""
-    lang = s.find("html").get("lang","").strip() if s.find("html") else ""
-    return title, desc, og_image, lang
+    title, desc, og_raw, lang = as_page(html, base_url).meta
+    return title, desc, absolute_url(og_raw, base_url) if og_raw else "", lang
 
 def agents_from_jsonld(jsonlds):
     out=[]
@@ -244,30 +1355,13 @@ def extract_amenities_from_jsonld(d):
     return feats
 
 def harvest_text_features(html, desc=""):
-    s = soupify(html); tl = (desc or "") + " " + (s.get_text(" ", strip=True) or ""); tl = tl.lower()
-    def pick(keys): return ", ".join(sorted({k for k in keys if k in tl}))
-    interior = pick(FEATURES["interior"])
-    exterior = pick(FEATURES["exterior"])
-    amenities = pick(FEATURES["amenities"])
-    services  = pick(FEATURES["services"])
-    parking   = "Yes" if any(k in tl for k in ("parking","garage","garaje","garagem","cochera","estacionamiento","carport")) else ""
-    furnished = "Yes" if any(k in tl for k in ("furnished","amueblado","mobiliado","gemeubileerd")) else ""
-    airco     = "Yes" if any(k in tl for k in ("air conditioning","aire acondicionado","ar-condicionado","airco","climatisation")) else ""
-    heating   = "Yes" if any(k in tl for k in ("heating","calefacción","aquecimento","chauffage","vloerverwarming")) else ""
-    view = ", ".join([v for v in ("sea view","ocean view","city view","mountain view","lake view","vista al mar","vista a la montaña") if v in tl])
-    flooring = ", ".join([v for v in ("hardwood","tile","ceramic","porcelain","marble","laminate","vinyl","parquet") if v in tl])
-    return {
-        "Interior Features": interior,
-        "Exterior Features": exterior,
-        "Amenities": amenities,
-        "Services": services,
-        "Parking": parking,
-        "Furnished": furnished,
-        "Air Conditioning": airco,
-        "Heating": heating,
-        "View": view,
-        "Flooring": flooring
-    }
+    page_hits = as_page(html).feature_hits
+    desc_hits = FEATURE_MATCHER.scan(desc.lower()) if desc else {}
+    def found(group): return page_hits.get(group, set()) | desc_hits.get(group, set())
+    out = {col: ", ".join(sorted(found(cat))) for cat, col in FEATURE_COLUMNS.items()}
+    out.update({col: "Yes" if found(col) else "" for col in FEATURE_FLAGS})
+    out.update({col: ", ".join(k for k in FEATURE_PICKS[col] if k.lower() in found(col)) for col in FEATURE_PICKS})
+    return out
 
 def property_from_jsonld(d):
     item={}
@@ -305,29 +1399,264 @@ def property_from_jsonld(d):
     return item
 
 # -------------- Fallback discovery --------------
-def try_sitemap(base_url):
+def _xml_local(tag):
+    return tag.rsplit("}", 1)[-1].lower()
+
+class TeeReader:
+    """Read-through file wrapper keeping a copy of the first `limit` bytes read (truncated once more went past)."""
+    def __init__(self, fp, limit):
+        self.fp, self.limit, self.buf, self.truncated = fp, limit, bytearray(), False
+
+    def read(self, n=-1):
+        data = self.fp.read(n); room = self.limit - len(self.buf)
+        if len(data) > room: self.truncated = True
+        if room > 0: self.buf += data[:room]
+        return data
+
+class _Prepend:
+    """fp with `head` (bytes already read from it) put back in front."""
+    def __init__(self, head, fp): self.head, self.fp = head, fp
+
+    def read(self, n=-1):
+        if not self.head: return self.fp.read(n)
+        if n is None or n < 0: data, self.head = self.head + self.fp.read(), b""; return data
+        data, self.head = self.head[:n], self.head[n:]
+        return data
+
+def sitemap_locs(fp):
+    """Yield ("url"|"sitemap", loc) from a sitemap document read incrementally from fp (a gzip body is unpacked on the fly)."""
+    import gzip
+    import xml.etree.ElementTree as ET
+    head = fp.read(2); fp = _Prepend(head, fp)
+    if head == b"\x1f\x8b": fp = gzip.GzipFile(fileobj=fp)
+    kind = root = None
+    for event, el in ET.iterparse(fp, events=("start", "end")):
+        tag = _xml_local(el.tag)
+        if root is None:
+            root, kind = el, {"urlset":"url", "sitemapindex":"sitemap"}.get(tag)
+            if kind is None: return
+        elif event == "end":
+            if tag == "loc" and (el.text or "").strip(): yield kind, el.text.strip()
+            elif tag in ("url", "sitemap"): root.clear()
+
+def stream_sitemap(url, timeout=DEFAULT_TIMEOUT, proxy=None):
+    """Yield ("url"|"sitemap", loc) from one sitemap document without loading it whole; .xml.gz is unpacked on the fly.
+    Like fetch() it goes through --http-cache (fresh and 304-revalidated entries are parsed from the cached bytes),
+    retries RETRY_STATUSES and archives the response; a complete 200 body of at most SITEMAP_KEEP_BYTES is cached."""
+    import io
+    domain = get_domain(url)
+    entry, req_headers = cache_request(url, None)
+    if entry and entry.fresh:
+        archive_response(url, 200, entry.headers, entry.body)
+        yield from sitemap_locs(io.BytesIO(entry.body)); return
+    attempt = 0
+    while attempt <= FETCH_RETRIES:
+        t0 = time.monotonic(); tee = None; complete = False
+        try:
+            with proxy_slot(domain) as pooled, session.get(url, headers=req_headers, timeout=timeout, proxies=proxy or pooled, stream=True) as r:
+                elapsed = time.monotonic() - t0
+                metrics.response(domain, r.status_code, elapsed)
+                if r.status_code in RETRY_STATUSES:
+                    observe_response(domain, r.status_code, elapsed, r.headers.get("Retry-After"))
+                    attempt += 1
+                    wait = retry_wait(r.status_code, r.headers, attempt) if attempt <= FETCH_RETRIES else None
+                    if wait is None:
+                        write_error(f"stream_sitemap({url}) -> too many {r.status_code} error responses"); return
+                    time.sleep(wait); continue
+                observe_response(domain, r.status_code, elapsed)
+                if r.status_code == 304 and entry:
+                    status, headers, body, _ = cache_response(url, entry, 304, r.headers, b"")
+                    archive_response(url, status, headers, body)
+                    yield from sitemap_locs(io.BytesIO(body)); return
+                if r.status_code != 200:
+                    archive_response(url, r.status_code, r.headers, r.content); return
+                r.raw.decode_content = True
+                tee = TeeReader(r.raw, SITEMAP_KEEP_BYTES)
+                yield from sitemap_locs(tee)
+                tee.read(); complete = True  # to the end, so the copy is the whole body
+        except Exception as e:
+            if tee is None:
+                observe_response(domain, None, time.monotonic() - t0)
+                metrics.response(domain, None, time.monotonic() - t0)
+            write_error(f"stream_sitemap({url}) -> {e}")
+        finally:
+            if tee is not None:
+                truncated = tee.truncated or not complete; body = bytes(tee.buf)
+                cache_response(url, entry, 200, r.headers, body, truncated)
+                archive_response(url, 200, r.headers, body, truncated)
+        return
+
+def try_sitemap(base_url, max_urls=SITEMAP_MAX_URLS, max_files=SITEMAP_MAX_FILES):
+    """Listing URLs from the first well-known sitemap that has any, following nested sitemap indexes (each file once)."""
     parsed = urlparse(base_url); base=f"{parsed.scheme}://{parsed.netloc}"
-    for path in ("/sitemap.xml","/sitemap_index.xml"):
-        url=f"{base}{path}"; tx=fetch_url(url)
-        if tx and "<urlset" in tx.lower():
-            s=soupify(tx); return [u.text.strip() for u in s.find_all("loc") if u.text.strip()]
+    for path in SITEMAP_PATHS:
+        pending=deque([f"{base}{path}"]); seen=set(); urls=[]
+        while pending and len(seen) < max_files and len(urls) < max_urls:
+            sm=pending.popleft()
+            if sm in seen: continue
+            seen.add(sm)
+            for kind, loc in stream_sitemap(sm):
+                if kind == "sitemap": pending.append(absolute_url(loc, sm)); continue
+                urls.append(loc)
+                if len(urls) >= max_urls: break
+        if urls: return urls
     return []
 
+def discover_once(kind, domain, fn, *a):
+    """Run a discovery step at most once per (kind, domain) per run; concurrent callers wait for the first one's result."""
+    with discovery_lock:
+        fut = discovery_memo.get((kind, domain)); owner = fut is None
+        if owner: fut = discovery_memo[(kind, domain)] = Future()
+    if not owner: return fut.result()
+    try: fut.set_result(fn(*a))
+    except Exception as e:
+        write_error(f"{kind} discovery({domain}) -> {e}"); fut.set_result([])
+    finally:
+        if not fut.done(): fut.set_result([])  # KeyboardInterrupt/SystemExit: never leave the waiters hanging
+    return fut.result()
+
 def try_api_endpoints(html, base_url):
     urls=[]
-    s=soupify(html)
-    for script in s.find_all("script"):
-        txt = script.string or ""
+    page=as_page(html, base_url)
+    for txt in page.scripts:
         for m in re.findall(r'["\'](/[^"\']{5,200})["\']', txt):
             if m.startswith("/api") or "search" in m.lower() or "/list" in m.lower():
                 urls.append(absolute_url(m, base_url))
-    for link in s.find_all("link", type=True, href=True):
-        t=link.get("type","")
+    for t, href in page.feeds:
         if "rss" in t or "xml" in t:
-            urls.append(absolute_url(link.get("href"), base_url))
+            urls.append(absolute_url(href, base_url))
     return list(dict.fromkeys(urls))
 
+# -------------- Browser pool (--use-playwright) --------------
+BLOCKED_RESOURCES = ("image", "font", "media")  # only the DOM is needed
+
+def playwright_proxy(proxy):
+    """requests-style proxies dict -> Playwright proxy settings (credentials split out of the URL)."""
+    if not proxy: return None
+    if "server" in proxy: return proxy
+    u = urlparse(proxy.get("https") or proxy.get("http") or "")
+    if not u.hostname: return None
+    pw = {"server": f"{u.scheme or 'http'}://{u.hostname}" + (f":{u.port}" if u.port else "")}
+    if u.username: pw["username"], pw["password"] = unquote(u.username), unquote(u.password or "")
+    return pw
+
+def _block_heavy(route):
+    if route.request.resource_type in BLOCKED_RESOURCES: route.abort()
+    else: route.continue_()
+
+def render_page(browser, contexts, url, timeout, proxy):
+    """Render url in the browser's context for this proxy (created on first use, heavy resources blocked)."""
+    settings = playwright_proxy(proxy); key = json.dumps(settings, sort_keys=True)
+    ctx = contexts.get(key)
+    if ctx is None:
+        ctx = contexts[key] = browser.new_context(**({"proxy": settings} if settings else {}))
+        ctx.route("**/*", _block_heavy)
+    page = ctx.new_page()
+    try:
+        page.goto(url, timeout=timeout*1000)
+        page.wait_for_load_state("networkidle", timeout=timeout*1000)
+        return page.content()
+    finally: page.close()
+
+class BrowserPool:
+    """Long-lived headless Chromium browsers, each owned by one thread (Playwright's sync API is thread-bound).
+    Contexts are kept per proxy; a browser is relaunched after recycle_pages renders or when it crashes.
+    A render not done within its timeout + BROWSER_QUEUE_GRACE returns "" and is cancelled if still queued."""
+
+    def __init__(self, size, recycle_pages):
+        self.jobs = queue.Queue(); self.recycle_pages = recycle_pages
+        self.stats = Counter(); self.stats_lock = Lock()
+        self.alive, self.dead = size, False
+        self.threads = [Thread(target=self._worker, name=f"browser-{i}", daemon=True) for i in range(size)]
+        for t in self.threads: t.start()
+
+    def render(self, url, timeout=30, proxy=None):
+        if self.dead: return ""
+        fut = Future(); self.jobs.put((url, timeout, proxy, fut))
+        if self.dead: self._drain()
+        try: return fut.result(timeout=timeout + BROWSER_QUEUE_GRACE)
+        except FutureTimeout:
+            fut.cancel()  # still queued: the worker skips it instead of rendering for nobody
+            write_error(f"playwright_render({url}) -> no result after {timeout + BROWSER_QUEUE_GRACE}s"); self._count("timed_out")
+            return ""
+
+    def _count(self, key):
+        with self.stats_lock: self.stats[key] += 1
+
+    def _drain(self):
+        """Resolve every queued job with "" (the pool is closing or has no live workers)."""
+        while True:
+            try: job = self.jobs.get_nowait()
+            except queue.Empty: break
+            if job and job[3].set_running_or_notify_cancel(): job[3].set_result("")
+
+    def _worker(self):
+        try:
+            from playwright.sync_api import sync_playwright
+            pw = sync_playwright().start()
+        except Exception as e:
+            write_error(f"browser pool: playwright failed to start -> {e}"); self._count("start_failed")
+            with self.stats_lock:
+                self.alive -= 1; self.dead = self.alive <= 0
+            if self.dead: self._drain()
+            return
+        browser, contexts, pages = None, {}, 0
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None: break
+                url, timeout, proxy, fut = job
+                if not fut.set_running_or_notify_cancel(): continue
+                try:
+                    if browser is not None and not browser.is_connected():
+                        self._count("crashed"); browser = None
+                    if browser is not None and pages >= self.recycle_pages:
+                        self._count("recycled"); self._close_browser(browser); browser = None
+                    if browser is None:
+                        browser, contexts, pages = pw.chromium.launch(headless=True, args=["--no-sandbox"]), {}, 0
+                        self._count("launched")
+                    pages += 1
+                    html = render_page(browser, contexts, url, timeout, proxy); self._count("rendered")
+                except Exception as e:
+                    write_error(f"playwright_render({url}) -> {e}"); self._count("failed"); html = ""
+                    contexts.pop(json.dumps(playwright_proxy(proxy), sort_keys=True), None)
+                    if browser is not None and not browser.is_connected(): self._count("crashed"); browser = None
+                fut.set_result(html)
+        finally:
+            self._close_browser(browser)
+            try: pw.stop()
+            except Exception: pass
+
+    @staticmethod
+    def _close_browser(browser):
+        if browser is None: return
+        try: browser.close()
+        except Exception: pass
+
+    def close(self):
+        self._drain()
+        for _ in self.threads: self.jobs.put(None)
+        for t in self.threads: t.join(timeout=30)
+
+def start_browser_pool(args):
+    global browser_pool
+    if not args.use_playwright: return
+    try: import playwright.sync_api  # noqa: F401
+    except Exception:
+        write_error("--use-playwright: playwright is not installed; rendering fallback disabled"); return
+    browser_pool = BrowserPool(args.browser_pool_size, args.browser_recycle_pages)
+
+def close_browser_pool():
+    global browser_pool
+    if browser_pool:
+        pool, browser_pool = browser_pool, None
+        pool.close()
+        return pool.stats
+    return None
+
 def playwright_render(url, timeout=30, proxy=None):
+    """Rendered HTML of url ("" on failure); uses the browser pool when running, else a one-off browser."""
+    if browser_pool: return browser_pool.render(url, timeout=timeout, proxy=proxy)
     try:
         from playwright.sync_api import sync_playwright
     except Exception:
@@ -335,13 +1664,7 @@ def playwright_render(url, timeout=30, proxy=None):
     try:
         pw = sync_playwright().start()
         browser = pw.chromium.launch(headless=True, args=["--no-sandbox"])
-        ctx_kwargs={}
-        if proxy: ctx_kwargs["proxy"]=proxy
-        ctx = browser.new_context(**ctx_kwargs)
-        page = ctx.new_page()
-        page.goto(url, timeout=timeout*1000)
-        page.wait_for_load_state("networkidle", timeout=timeout*1000)
-        html = page.content()
+        html = render_page(browser, {}, url, timeout, proxy)
         browser.close(); pw.stop()
         return html
     except Exception as e:
@@ -350,24 +1673,180 @@ def playwright_render(url, timeout=30, proxy=None):
         except Exception: pass
         return ""
 
+# -------------- Parse processes (--parse-pool process) --------------
+def _parse_worker_init(features_file, word_boundary, parser, max_bytes=0, archive_path=""):
+    signal.signal(signal.SIGINT, signal.SIG_IGN); signal.signal(signal.SIGTERM, signal.SIG_IGN)  # the parent shuts the pool down
+    configure_features(features_file, word_boundary); configure_parser(parser)
+    fetch_config.update(max_bytes=max_bytes); open_archive_reader(archive_path)
+
+def _parse_task(fn, *a):
+    """Runs in a parse process: fn(*a) plus the parse.* stage timings it recorded, for the parent's metrics."""
+    metrics.stages.clear()
+    result = fn(*a)
+    return result, {k: (h.counts, h.sum, h.count) for k, h in metrics.stages.items()}
+
+def _parse_processes_broken(pool, e):
+    global parse_processes
+    with parse_processes_lock:
+        if parse_processes is not pool: return  # already reported
+        parse_processes = None
+    write_error(f"Parse processes died ({e}); parsing on the fetch threads from now on")
+
+def _parse_inline(out, fn, *a):
+    try: out.set_result(fn(*a))
+    except Exception as e: out.set_exception(e)
+
+def parse_stage(fn, *a):
+    """fn(*a) for a pure extractor (extract_listing, agency_from_html). With --parse-pool process it runs in a parse
+    process and a Future is returned instead, so the fetch thread can move on to its next request. Once the parse
+    processes die the task is parsed in this thread (or the pool's callback thread) and the Future is still returned."""
+    pool = parse_processes
+    if pool is None: return fn(*a)
+    out = Future(); t0 = time.perf_counter()
+    def done(f):
+        try: result, stages = f.result()
+        except BrokenProcessPool as e: _parse_processes_broken(pool, e); _parse_inline(out, fn, *a); return
+        except Exception as e: out.set_exception(e); return
+        metrics.merge_stages(stages); metrics.stage("parse.pool", time.perf_counter() - t0)
+        out.set_result(result)
+    try: fut = pool.submit(_parse_task, fn, *a)
+    except BrokenProcessPool as e:
+        _parse_processes_broken(pool, e); _parse_inline(out, fn, *a)
+        return out
+    fut.add_done_callback(done)
+    return out
+
+def start_parse_processes(args):
+    """Start the parse processes before any other thread exists (workers are forked from a single-threaded parent)."""
+    global parse_processes
+    if args.parse_pool != "process": return
+    from concurrent.futures import ProcessPoolExecutor
+    parse_processes = ProcessPoolExecutor(max_workers=args.parse_workers, initializer=_parse_worker_init,
+                                          initargs=(args.features_file, args.feature_match == "word", args.parser, max(0, args.max_bytes),
+                                                    os.path.join(args.reparse, ARCHIVE_DIR) if args.reparse else ""))
+    parse_processes.submit(int).result()  # launches every worker now
+
+def close_parse_processes():
+    global parse_processes
+    if parse_processes is None: return
+    parse_processes.shutdown(wait=True, cancel_futures=True); parse_processes = None
+
+# -------------- Contacts --------------
+Contacts = namedtuple("Contacts", "email phone whatsapp")
+
+def country_iso(row):
+    """Seed ISO code, else the one for its Country name ("" when unknown)."""
+    iso = (row.get("ISO") or "").strip().upper()
+    return "GB" if iso == "UK" else iso or ISO_BY_COUNTRY.get((row.get("Country") or "").strip().lower(), "")
+
+def to_e164(raw, iso=""):
+    """'+34 600 12 34 56', '0034 600123456', '+44 (0)20 7946 0000' or a national '600 123 456' (given the seed ISO)
+    -> '+34600123456'; "" when it cannot be a phone number."""
+    s = raw.strip().replace("(0)", ""); digits = NON_DIGIT_RE.sub("", s)
+    if s.startswith("+"): intl = digits
+    elif digits.startswith("00"): intl = digits[2:]
+    else:
+        cc = CALLING_CODES.get(iso)
+        if not cc: return ""
+        if cc == "1" and len(digits) == 11 and digits[0] == "1": intl = digits
+        else: intl = cc + (digits[1:] if digits.startswith("0") and iso not in TRUNK_ZERO_KEPT else digits)
+        if len(intl) - len(cc) < 6: return ""
+    return "+" + intl if 8 <= len(intl) <= 15 and intl[0] != "0" else ""
+
+def clean_email(raw):
+    e = unquote(raw).strip().strip(".").lower()
+    local, at, domain = e.partition("@")
+    tld = domain.rpartition(".")[2]
+    return e if at and local and "@" not in domain and tld.isalpha() and 2 <= len(tld) <= 24 and tld not in NOT_EMAIL_TLDS else ""
+
+def whatsapp_number(href):
+    """E.164 number of a wa.me/<number> or api.whatsapp.com/send?phone=<number> link ("" if none)."""
+    u = urlsplit(href if "//" in href else "https://" + href)
+    num = u.path.strip("/").split("/")[0] if (u.hostname or "").endswith("wa.me") else dict(parse_qsl(u.query)).get("phone", "")
+    return to_e164("+" + NON_DIGIT_RE.sub("", num)) if num else ""
+
+def _rank(found, key, score):
+    if not key: return
+    prev = found.get(key)
+    found[key] = (max(score, prev[0]) + 1, prev[1]) if prev else (score, len(found))  # repeats add a point; ties go to the first seen
+
+def _best(found):
+    return min(found, key=lambda k: (-found[k][0], found[k][1])) if found else ""
+
+def extract_contacts(html, iso="", socials=None):
+    """Best email, phone and WhatsApp number of an agency page (phones in E.164), from one pass over its links and one
+    over its visible text. Ranking: tel:/mailto:/wa.me links, then the JSON-LD organization, then text numbers with a
+    +/00 prefix or a phone label in front, then bare ones; WhatsApp links in <a href> rank above ones only found in
+    scripts/onclick handlers. Bare numbers must normalize with the seed ISO, and numbers next to a currency or a
+    ref/ID/postcode label are dropped (prices, dates and IDs are not phones)."""
+    page = as_page(html)
+    emails, phones, whatsapp = {}, {}, {}
+    site = (urlsplit(page.url).hostname or "").removeprefix("www.")
+    def add_email(e, score):
+        if e: _rank(emails, e, score + (20 if site and e.endswith(site) else 0) - (50 if "noreply" in e or "no-reply" in e else 0))
+    for href in page.hrefs:
+        h = href.strip(); scheme = h[:7].lower()
+        if scheme.startswith("tel:"):
+            raw = unquote(h[4:]); _rank(phones, to_e164(raw, iso) or raw.strip(), 100)
+        elif scheme == "mailto:": add_email(clean_email(h[7:].split("?")[0]), 100)
+    anchors = set(h.strip() for h in page.hrefs)
+    for href in (socials if socials is not None else find_social_links(page)).get("WhatsApp", []):
+        n = whatsapp_number(href); score = 60 if href in anchors else 50  # <a href> links before script-built ones
+        _rank(whatsapp, n, score); _rank(phones, n, score)
+    for d in page.jsonld:
+        if not isinstance(d, dict): continue
+        t = d.get("@type"); types = {str(x).lower() for x in (t if isinstance(t, list) else [t])}
+        if not types & ORG_TYPES: continue
+        for tel in (d.get("telephone") if isinstance(d.get("telephone"), list) else [d.get("telephone")]):
+            if tel: _rank(phones, to_e164(str(tel), iso) or str(tel).strip(), 90)
+        for em in (d.get("email") if isinstance(d.get("email"), list) else [d.get("email")]):
+            if em: add_email(clean_email(str(em).removeprefix("mailto:")), 90)
+    text = page.text
+    with metrics.timed("parse.contacts"):
+        for m in CONTACT_RE.finditer(text):
+            if m.lastgroup == "email": add_email(clean_email(m.group()), 10); continue
+            raw, (s, e) = m.group(), m.span()
+            before = text[max(0, s - 24):s]
+            if JUNK_LABEL_RE.search(before) or CURRENCY_RE.match(text[e:e + 6].lstrip()) or CURRENCY_RE.search(before[-3:]): continue
+            labelled, prefixed = bool(PHONE_LABEL_RE.search(before)), raw.startswith(("+", "00"))
+            if not (labelled or prefixed) and (DATE_LIKE_RE.match(raw) or THOUSANDS_RE.match(raw)): continue
+            _rank(phones, to_e164(raw, iso), (40 if prefixed else 10) + (30 if labelled else 0))
+    return Contacts(_best(emails), _best(phones), _best(whatsapp))
+
 # -------------- Agency scrape --------------
-def find_social_links(html: str):
-    out={}
-    s=soupify(html)
-    for a in s.find_all("a", href=True):
-        href=a["href"].strip(); dom=urlparse(href).netloc.lower()
-        for d,label in SOCIAL_DOMAINS.items():
-            if d in dom: out.setdefault(label,set()).add(href)
-    for m in WHATS_RE.findall(html or ""):
-        out.setdefault("WhatsApp",set()).add(m)
-    return {k:sorted(list(v)) for k,v in out.items()}
+def social_label(host):
+    """SOCIAL_DOMAINS label of a hostname or of its nearest listed parent domain (m.facebook.com -> Facebook)."""
+    host = host.rstrip(".")
+    while host:
+        label = SOCIAL_DOMAINS.get(host)
+        if label: return label
+        host = host.partition(".")[2]
+    return None
+
+def find_social_links(html):
+    """{label: sorted hrefs} of the links pointing at SOCIAL_DOMAINS (one dict lookup per host suffix), plus the
+    WhatsApp links that only appear in scripts or event handlers (one WHATS_RE pass over the raw HTML)."""
+    out={}; page=as_page(html)
+    for href in page.hrefs:
+        href=href.strip()
+        if href[:2] != "//" and href[:4].lower() != "http": continue  # relative links have no host
+        try: label = social_label(urlsplit(href).hostname or "")
+        except ValueError: continue
+        if label: out.setdefault(label,set()).add(href)
+    for m in WHATS_RE.finditer(page.html): out.setdefault("WhatsApp",set()).add(m.group())
+    return {k:sorted(v) for k,v in out.items()}
 
 def extract_agency_info(row, throttle=0.0, proxy=None):
     url=(row.get("Website") or "").strip()
     if not url: return None, None, ""
     html = fetch_url(url, proxy=proxy)
     if throttle: time.sleep(throttle)
-    jsonlds = parse_jsonld(html)
+    return agency_from_html(row, url, html)
+
+def agency_from_html(row, url, html):
+    """Pure extraction of (enriched row, profile row, og:image) from an agency homepage (no I/O)."""
+    page = as_page(html, url)
+    jsonlds = parse_jsonld(page)
     # org
     addr=lat=lng=""
     for d in jsonlds:
@@ -380,16 +1859,13 @@ def extract_agency_info(row, throttle=0.0, proxy=None):
             g=d.get("geo") or {}
             if isinstance(g,list) and g: g=g[0]
             lat=str(g.get("latitude") or ""); lng=str(g.get("longitude") or "")
-    title, desc, og_image, lang = extract_meta(html, url)
-    socials = find_social_links(html)
-    body = soupify(html).get_text(" ", strip=True)
-    emails = EMAIL_RE.findall(body) or []
-    phones = PHONE_RE.findall(body) or []
+    title, desc, og_image, lang = extract_meta(page, url)
+    contacts = extract_contacts(page, country_iso(row), find_social_links(page))
     enriched = dict(row)
     enriched.update({
         "Detected_Address": addr, "Detected_Latitude": lat, "Detected_Longitude": lng,
         "Meta_Title": title or row.get("Description",""), "Meta_Description": desc, "OG_Image": og_image,
-        "Email": row.get("Email") or (emails[0] if emails else ""), "Phone": row.get("Phone") or (phones[0] if phones else "")
+        "Email": row.get("Email") or contacts.email, "Phone": row.get("Phone") or contacts.phone
     })
     profile = {
         "Header": row.get("Agency Name",""),
@@ -399,11 +1875,31 @@ def extract_agency_info(row, throttle=0.0, proxy=None):
         "Address": addr, "Longitude": lng, "Latitude": lat,
         "Banner Image": og_image, "Short description": desc or row.get("Description",""),
         "Country": row.get("Country",""),
-        "Phone": enriched["Phone"], "WhatsApp Number": row.get("WhatsApp",""), "Email": enriched["Email"],
+        "Phone": enriched["Phone"], "WhatsApp Number": row.get("WhatsApp") or contacts.whatsapp, "Email": enriched["Email"],
         "City/Region (seed)": row.get("City/Region",""),
     }
     return enriched, profile, og_image
 
+def agency_key(row): return (row.get("Agency Name",""), row.get("Website",""))
+
+def process_agency(row, args):
+    """extract_agency_info under the same per-domain cap/circuit breaker as listings.
+    Deferred while the domain's breaker is open (the gate re-queues it); None when no proxy got through
+    (agency stays unprocessed for the next run)."""
+    url=(row.get("Website") or "").strip()
+    if not url: return None, None, ""
+    domain = get_domain(url)
+    ensure_semaphore_for(domain, args.domain_max_concurrency)
+    if not domain_allowed(domain, time.time(), args.domain_fail_threshold, args.domain_cooldown_seconds):
+        return Deferred(domain, domain_health.retry_at(domain))
+    with domain_slot(domain):
+        res = fetch(url)
+    if res.proxy_failed: return None
+    html = res.text
+    if html: record_domain_success(domain)
+    else: record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
+    return parse_stage(agency_from_html, row, url, html)
+
 # -------------- Property scrape --------------
 def build_property_row(base, extras, seed_row, agency_logo, url, listing_og):
     imgs = base.get("Images","") or ""
@@ -449,136 +1945,1621 @@ def build_property_row(base, extras, seed_row, agency_logo, url, listing_og):
         "Flooring": extras.get("Flooring",""),
     }
 
-def process_listing_seed(seed_row, agency_logo, args, proxies_hook):
+def looks_blocked(html): return not html or bool(BLOCK_RE.search(html))
+
+def resolve_blocked_listing(url, html, domain, args):
+    """Sitemap/API/Playwright fallbacks for a blocked or empty listing page.
+    Returns usable HTML, or "" after recording the domain failure (and manual review when nothing helped)."""
+    metrics.event("blocked_pages")
+    seeds = discover_once("sitemap", domain, try_sitemap, url)
+    if seeds:
+        metrics.event("fallback.sitemap")
+        record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
+        return ""
+    apis = discover_once("api", domain, try_api_endpoints, as_page(html, url), url)
+    if apis:
+        metrics.event("fallback.api")
+        record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
+        return ""
+    if args.use_playwright:
+        with metrics.timed("fetch.playwright"), proxy_slot(domain) as proxy: html_pw = playwright_render(url, timeout=args.task_timeout, proxy=proxy)
+        metrics.event("fallback.playwright" if html_pw else "fallback.playwright_failed")
+        if html_pw:
+            archive_response(url, 200, {"Content-Type": "text/html; charset=utf-8", "X-Rendered-By": "playwright"}, html_pw.encode("utf-8"))
+            return html_pw
+        write_manual_review({"Listing URL":url, "Reason":"Cloudflare/CAPTCHA/empty"})
+    else:
+        write_manual_review({"Listing URL":url, "Reason":"Blocked or empty (no Playwright)"})
+    record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
+    return ""
+
+def extract_listing(html, seed_row, agency_logo, url):
+    """Pure extraction of property rows + deduped agents from a listing page (no I/O)."""
+    page = as_page(html, url)
+    jsonlds = parse_jsonld(page)
+    listing_title, listing_desc, listing_og, _ = extract_meta(page, url)
+    prop_nodes = [d for d in jsonlds if any(tt in (d.get("@type") if isinstance(d.get("@type"),str) else d.get("@type") or []) for tt in ("Offer","Product","Residence","Apartment","House","RealEstateListing"))]
+    props=[]
+
+    if not prop_nodes:
+        extras_text = harvest_text_features(page, listing_desc)
+        base = property_from_jsonld({})
+        base["Title"] = seed_row.get("Title") or listing_title or ""
+        base["Content"] = page.text[:5000]
+        p = build_property_row(base, extras_text, seed_row, agency_logo, url, listing_og)
+        props.append(p)
+    else:
+        for d in prop_nodes:
+            base = property_from_jsonld(d)
+            extras = harvest_text_features(page, base.get("Content",""))
+            if base.get("Amenities_from_jsonld"):
+                merged = ", ".join(sorted(set((extras.get("Amenities","") + ", " + ", ".join(base["Amenities_from_jsonld"])).strip(", ").split(", "))))
+                extras["Amenities"] = merged
+            p = build_property_row(base, extras, seed_row, agency_logo, url, listing_og)
+            props.append(p)
+
+    # agents
+    agents = agents_from_jsonld(jsonlds)
+    seen=set(); dedup=[]
+    for a in agents:
+        key=(a.get("Agent Name","").strip(), a.get("Email","").strip(), a.get("Phone","").strip())
+        if key in seen: continue
+        seen.add(key)
+        if not a.get("Photo"): a["Photo"]=agency_logo
+        dedup.append(a)
+    return props, dedup
+
+def process_listing_seed(seed_row, agency_logo, args):
+    """(props, agents) for one seed; with --parse-pool process a Future of them once the page is fetched.
+    Deferred while the domain's breaker is open (the gate re-queues the seed); None when the fetch or extraction
+    failed, so the seed is not checkpointed (and is retried in --cluster mode)."""
     url = seed_row.get("Listing URL","").strip()
     if not url: return [], []
     domain = get_domain(url)
     ensure_semaphore_for(domain, args.domain_max_concurrency)
     if not domain_allowed(domain, time.time(), args.domain_fail_threshold, args.domain_cooldown_seconds):
-        return [], []
-    proxy = proxies_hook.get_next() if proxies_hook else None
-    domain_semaphores[domain].acquire()
+        return Deferred(domain, domain_health.retry_at(domain))
     try:
-        html = fetch_url(url, proxy=proxy)
-        if not html or any(k in (html or "").lower() for k in ("access denied","cf-chl-bypass","captcha")):
-            seeds = try_sitemap(url)
-            if seeds: 
-                record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
-                return [], []
-            apis = try_api_endpoints(html or "", url)
-            if apis:
-                record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
-                return [], []
-            if args.use_playwright:
-                html_pw = playwright_render(url, timeout=args.task_timeout, proxy=proxy)
-                if html_pw: html = html_pw
-                else:
-                    write_manual_review({"Listing URL":url, "Reason":"Cloudflare/CAPTCHA/empty"})
-                    record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
-                    return [], []
-            else:
-                write_manual_review({"Listing URL":url, "Reason":"Blocked or empty (no Playwright)"})
-                record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
-                return [], []
-        jsonlds = parse_jsonld(html)
-        listing_title, listing_desc, listing_og, _ = extract_meta(html, url)
-        prop_nodes = [d for d in jsonlds if any(tt in (d.get("@type") if isinstance(d.get("@type"),str) else d.get("@type") or []) for tt in ("Offer","Product","Residence","Apartment","House","RealEstateListing"))]
-        props=[]
-
-        extras_text = harvest_text_features(html, listing_desc)
-        if not prop_nodes:
-            base = property_from_jsonld({})
-            base["Title"] = seed_row.get("Title") or listing_title or ""
-            base["Content"] = soupify(html).get_text(" ", strip=True)[:5000]
-            p = build_property_row(base, extras_text, seed_row, agency_logo, url, listing_og)
-            props.append(p)
-        else:
-            for d in prop_nodes:
-                base = property_from_jsonld(d)
-                extras = harvest_text_features(html, base.get("Content",""))
-                if base.get("Amenities_from_jsonld"):
-                    merged = ", ".join(sorted(set((extras.get("Amenities","") + ", " + ", ".join(base["Amenities_from_jsonld"])).strip(", ").split(", "))))
-                    extras["Amenities"] = merged
-                p = build_property_row(base, extras, seed_row, agency_logo, url, listing_og)
-                props.append(p)
-
-        # agents
-        agents = agents_from_jsonld(jsonlds)
-        seen=set(); dedup=[]
-        for a in agents:
-            key=(a.get("Agent Name","").strip(), a.get("Email","").strip(), a.get("Phone","").strip())
-            if key in seen: continue
-            seen.add(key)
-            if not a.get("Photo"): a["Photo"]=agency_logo
-            dedup.append(a)
-
+        with domain_slot(domain):
+            res = fetch(url); html = res.text
+            if res.proxy_failed: return None  # the proxies failed, not the site
+            if looks_blocked(html):
+                html = resolve_blocked_listing(url, html, domain, args)
+                if not html: return None
+        if fingerprints and fingerprints.page_unchanged(url, html):
+            record_domain_success(domain); return Unchanged(url), []
+        result = parse_stage(extract_listing, html, seed_row, agency_logo, url)
         record_domain_success(domain)
-        return props, dedup
+        return result
     except Exception as e:
         write_error(f"process_listing_seed({url}) -> {e}")
         record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
-        return [], []
-    finally:
-        try: domain_semaphores[domain].release()
-        except Exception: pass
+        return None
 
 # -------------- Manual review + progress --------------
 def write_manual_review(item):
-    with csv_lock:
-        fn="manual_review.csv"; exist=os.path.exists(fn)
-        with open(fn, "a", encoding="utf-8-sig", newline="") as f:
-            w=csv.DictWriter(f, fieldnames=list(item.keys()))
-            if not exist: w.writeheader()
-            w.writerow(item)
+    metrics.event("manual_review")
+    append_csv_row("manual_review.csv", list(item.keys()), item)
 
-def load_progress():
-    if os.path.exists(PROGRESS_FILE):
-        try:
-            with open(PROGRESS_FILE,"r",encoding="utf-8") as f: return json.load(f)
-        except Exception: return {}
-    return {}
-def save_progress(data):
-    with progress_lock:
-        with open(PROGRESS_FILE,"w",encoding="utf-8") as f: json.dump(data,f,ensure_ascii=False,indent=2)
-
-# -------------- Proxies hook (round-robin) --------------
-class ProxiesHook:
-    def __init__(self, proxies_list):
-        self.proxies = proxies_list or []; self.idx=0; self.lock=Lock()
-    def get_next(self):
-        with self.lock:
-            if not self.proxies: return None
-            p = self.proxies[self.idx % len(self.proxies)]; self.idx += 1
-            if isinstance(p,str): return {"http":p,"https":p}
-            return p
+class CheckpointStore:
+    """Resume state as a progress.json snapshot plus an append-only progress.journal.
+
+    Every completion appends one short JSON line, so a checkpoint costs O(1) however long the run is.
+    Compaction writes a new snapshot to a temp file and os.replace()s it before truncating the journal,
+    so a crash never leaves a half-written snapshot; a torn last journal line is skipped on load.
+    """
+    def __init__(self, path=PROGRESS_FILE, journal=JOURNAL_FILE, compact_every=DEFAULT_COMPACT_EVERY):
+        self.path, self.journal_path, self.compact_every = path, journal, compact_every
+        self.extra, self.agencies, self.listings = {}, set(), set()
+        self.pending = 0; self.fh = None
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path,"r",encoding="utf-8") as f: self.extra = json.load(f)
+            except Exception as e: write_error(f"CheckpointStore.load({self.path}) -> {e}")
+        self.listings = set(self.extra.pop("processed_listings", []))
+        self.agencies = set(tuple(x) for x in self.extra.pop("processed_agencies", []))
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path,"r",encoding="utf-8") as f:
+                for line in f:
+                    try: rec = json.loads(line)
+                    except ValueError: continue
+                    if rec[0] == "l": self.listings.add(rec[1])
+                    elif rec[0] == "a": self.agencies.add((rec[1], rec[2]))
+                    self.pending += 1
+        self.fh = open(self.journal_path, "a", encoding="utf-8")
+        return self.agencies, self.listings
+
+    def _append(self, rec):
+        with progress_lock:
+            self.fh.write(json.dumps(rec, ensure_ascii=False) + "\n"); self.pending += 1
+            if self.pending >= self.compact_every: self._compact()
+
+    def add_agency(self, key):
+        if key in self.agencies: return
+        self.agencies.add(key); self._append(["a", key[0], key[1]])
+
+    def add_listing(self, url):
+        if url in self.listings: return
+        self.listings.add(url); self._append(["l", url])
+
+    def flush(self, fsync=False):
+        with progress_lock:
+            self.fh.flush()
+            if fsync: os.fsync(self.fh.fileno())
+
+    def _compact(self):
+        data = dict(self.extra, processed_agencies=[list(x) for x in self.agencies], processed_listings=list(self.listings))
+        tmp = self.path + ".tmp"
+        with open(tmp,"w",encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False); f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.fh.close(); self.fh = open(self.journal_path, "w", encoding="utf-8"); self.pending = 0
+
+    def close(self):
+        with progress_lock:
+            self._compact(); self.fh.close()
+
+# -------------- Proxy pool (--proxies-file) --------------
+class _Ewma:
+    """Success rate + latency averages (alpha 0.2); latency stays None until a response arrives."""
+    __slots__ = ("ok", "lat", "n")
+    def __init__(self): self.ok, self.lat, self.n = 1.0, None, 0
+    def observe(self, ok, latency=None):
+        self.ok = 0.8 * self.ok + 0.2 * ok; self.n += 1
+        if latency is not None: self.lat = latency if self.lat is None else 0.8 * self.lat + 0.2 * latency
+
+class PooledProxy:
+    __slots__ = ("name", "label", "proxies", "health", "inflight", "streak", "strikes", "quarantined_until", "probing", "stats")
+    def __init__(self, proxies):
+        self.proxies = {"http": proxies, "https": proxies} if isinstance(proxies, str) else dict(proxies)
+        self.name = self.proxies.get("https") or self.proxies.get("http") or json.dumps(self.proxies, sort_keys=True)
+        self.label = re.sub(r"//[^/@]*@", "//", self.name)  # no credentials in metrics
+        self.health = _Ewma(); self.inflight = self.streak = self.strikes = 0
+        self.quarantined_until = 0.0; self.probing = False; self.stats = Counter()
+
+    def usable(self, now, cap):
+        if self.quarantined_until:  # quarantined, then half-open: a single probe request
+            return now >= self.quarantined_until and not self.probing
+        return not cap or self.inflight < cap
+
+class ProxyPool:
+    """Health-scored proxy choice per request (replaces round-robin).
+
+    Every proxy keeps a success/latency EWMA over proxy-side outcomes only (refused or timed-out connects to the proxy,
+    tunnel failures, 407); each (proxy, domain) pair keeps its own over all outcomes, so a proxy a site has banned is
+    avoided for that site alone. acquire() picks the lowest latency / success score among proxies under the
+    concurrency cap (untried proxies first). PROXY_FAIL_STREAK proxy failures in a row quarantine a proxy for
+    quarantine_seconds, doubling per relapse up to PROXY_QUARANTINE_MAX; afterwards one probe request decides.
+    With sticky=True a domain keeps its proxy (cookies, fewer CAPTCHAs) until that proxy fails for it.
+    """
+    def __init__(self, proxies, max_inflight=DEFAULT_PROXY_CONCURRENCY, quarantine_seconds=DEFAULT_PROXY_QUARANTINE, sticky=False):
+        self.proxies = [PooledProxy(p) for p in proxies or []]
+        self.cap, self.quarantine_seconds, self.sticky = max_inflight, quarantine_seconds, sticky
+        self.pairs = defaultdict(_Ewma); self.pinned = {}
+        self.cond = Condition(Lock())
+
+    def _score(self, p, domain):
+        pair = self.pairs.get((p.name, domain))
+        lat = pair.lat if pair and pair.lat is not None else p.health.lat
+        if lat is None: return -1.0  # untried: measure it first
+        ok = min(p.health.ok, pair.ok) if pair else p.health.ok
+        return lat * (1 + p.inflight) / max(ok, 0.05)
+
+    def _try_acquire(self, domain, exclude):
+        """A proxy (slot taken), or how long to wait; None when every proxy has been excluded."""
+        now = time.monotonic()
+        pinned = self.pinned.get(domain) if self.sticky else None
+        if pinned and pinned.name not in exclude and pinned.usable(now, self.cap): best = pinned
+        else:
+            free = [p for p in self.proxies if p.name not in exclude and p.usable(now, self.cap)]
+            if not free:
+                left = [p.quarantined_until - now for p in self.proxies if p.name not in exclude]
+                return max(0.05, min(left)) if left else None
+            best = min(free, key=lambda p: (self._score(p, domain), random.random()))
+            if self.sticky: self.pinned[domain] = best
+        best.inflight += 1; best.probing = bool(best.quarantined_until)
+        return best
+
+    def acquire(self, domain, exclude=(), timeout=None):
+        """Best proxy for domain, waiting (up to timeout) while all are busy or quarantined; None if none became usable."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                got = self._try_acquire(domain, exclude)
+                if got is None or isinstance(got, PooledProxy): return got
+                if shutdown_flag or (deadline is not None and time.monotonic() + got > deadline): return None
+                self.cond.wait(timeout=min(got, 1.0))
+
+    async def acquire_async(self, domain, exclude=(), timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.cond: got = self._try_acquire(domain, exclude)
+            if got is None or isinstance(got, PooledProxy): return got
+            if shutdown_flag or (deadline is not None and time.monotonic() + got > deadline): return None
+            await asyncio.sleep(min(got, 0.25))
+
+    def done(self, p, domain, outcome, latency):
+        """Free p's slot and record one request: outcome "ok", "site" (the proxy worked, the site failed) or "proxy"."""
+        with self.cond:
+            p.inflight -= 1; p.stats[outcome] += 1
+            self.pairs[(p.name, domain)].observe(outcome == "ok", latency if outcome != "proxy" else None)
+            if outcome != "ok" and self.pinned.get(domain) is p: del self.pinned[domain]
+            if outcome == "proxy":
+                p.health.observe(0); p.streak += 1
+                if p.probing or p.streak >= PROXY_FAIL_STREAK:
+                    p.strikes += 1; p.streak = 0; p.stats["quarantined"] += 1; metrics.event("proxy.quarantined")
+                    p.quarantined_until = time.monotonic() + min(PROXY_QUARANTINE_MAX, self.quarantine_seconds * 2 ** (p.strikes - 1))
+            else:
+                p.health.observe(1, latency); p.streak = 0
+                if p.quarantined_until: p.quarantined_until = 0.0; p.strikes = 0
+            p.probing = False
+            self.cond.notify_all()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.cond:
+            return {p.label: {"success": round(p.health.ok, 3), "latency_ewma": round(p.health.lat or 0.0, 3), "inflight": p.inflight,
+                             "quarantined_for": round(max(0.0, p.quarantined_until - now), 1), **p.stats} for p in self.proxies}
+
+def is_proxy_error(e):
+    """Failures of the proxy itself (not of the site behind it), for requests and aiohttp exceptions."""
+    if isinstance(e, (requests.exceptions.ProxyError, requests.exceptions.ConnectTimeout)): return True
+    return type(e).__name__ in ("ClientProxyConnectionError", "ClientHttpProxyError")
+
+@contextmanager
+def proxy_slot(domain, timeout=DEFAULT_TIMEOUT):
+    """requests-style proxies for one request outside fetch() (None without --proxies-file or when no proxy is usable)."""
+    p = proxy_pool.acquire(domain, timeout=timeout) if proxy_pool else None
+    t0 = time.monotonic(); outcome = "site"
+    try:
+        yield p.proxies if p else None
+        outcome = "ok"
+    except Exception as e:
+        outcome = "proxy" if is_proxy_error(e) else "site"; raise
+    finally:
+        if p: proxy_pool.done(p, domain, outcome, time.monotonic() - t0)
+
+def start_proxy_pool(args):
+    global proxy_pool
+    if not (args.proxies_file and os.path.exists(args.proxies_file)): return
+    try:
+        with open(args.proxies_file,"r",encoding="utf-8") as pf: proxies = json.load(pf)
+    except Exception as e:
+        write_error(f"Proxies file failed: {e}"); return
+    if proxies: proxy_pool = ProxyPool(proxies, args.proxy_max_concurrency, args.proxy_quarantine_seconds, args.proxy_sticky)
+
+# -------------- Output sinks --------------
+_csv_direct_lock = Lock()
 
-# -------------- CSV writer --------------
 def append_csv_row(fn, fieldnames, row):
-    with csv_lock:
+    row = {k: row.get(k,"") for k in fieldnames}
+    if output_sinks: output_sinks.write_row(fn, fieldnames, row); return
+    with _csv_direct_lock:
         exist = os.path.exists(fn)
         with open(fn,"a",encoding="utf-8-sig",newline="") as f:
             w=csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
             if not exist: w.writeheader()
-            w.writerow({k: row.get(k,"") for k in fieldnames})
+            w.writerow(row)
+
+class OutputSinks:
+    """One long-lived buffered handle per output file, owned by a dedicated writer thread.
+
+    Workers only enqueue rows (never blocking on file I/O). The writer flushes every `flush_rows`
+    rows or `flush_seconds`, and on flush() (checkpoints); close() fsyncs every file.
+    A CSV gets its header only if it was new or empty when first opened, as with the old per-row appends.
+    """
+    _FLUSH = object()
+
+    def __init__(self, flush_rows=DEFAULT_FLUSH_ROWS, flush_seconds=DEFAULT_FLUSH_SECONDS):
+        self.flush_rows, self.flush_seconds = flush_rows, flush_seconds
+        self.q = queue.SimpleQueue(); self.handles = {}; self.writers = {}; self.needs_header = {}
+        self.thread = Thread(target=self._run, name="output-sinks", daemon=True); self.thread.start()
+
+    def write_row(self, fn, fieldnames, row): self.q.put((fn, tuple(fieldnames), row))
+    def write_line(self, fn, line): self.q.put((fn, None, line))
+
+    def flush(self, fsync=False):
+        done = Event(); self.q.put((self._FLUSH, fsync, done)); done.wait()
+
+    def close(self):
+        self.flush(fsync=True); self.q.put(None); self.thread.join()
+        for fh in self.handles.values(): fh.close()
+
+    def _handle(self, fn, is_csv):
+        fh = self.handles.get(fn)
+        if fh is None:
+            self.needs_header[fn] = not os.path.exists(fn) or os.path.getsize(fn) == 0
+            fh = self.handles[fn] = open(fn, "a", encoding="utf-8-sig" if is_csv else "utf-8", newline="" if is_csv else None, buffering=1 << 16)
+        return fh
+
+    def _write(self, fn, fieldnames, row):
+        if fieldnames is None:
+            self._handle(fn, False).write(row); return
+        fh = self._handle(fn, True)
+        w = self.writers.get((fn, fieldnames))
+        if w is None:
+            w = self.writers[(fn, fieldnames)] = csv.DictWriter(fh, fieldnames=list(fieldnames), quoting=csv.QUOTE_MINIMAL)
+            if self.needs_header[fn]: w.writeheader(); self.needs_header[fn] = False
+        w.writerow(row)
+
+    def _flush(self, fsync):
+        with metrics.timed("output.fsync" if fsync else "output.flush"):
+            for fh in self.handles.values():
+                fh.flush()
+                if fsync: os.fsync(fh.fileno())
+
+    def _run(self):
+        unflushed, last = 0, time.monotonic()
+        while True:
+            try: item = self.q.get(timeout=self.flush_seconds)
+            except queue.Empty: item = ()
+            if item is None: return
+            try:
+                if item and item[0] is self._FLUSH:
+                    self._flush(item[1]); item[2].set(); unflushed, last = 0, time.monotonic(); continue
+                if item: self._write(*item); unflushed += 1
+                if unflushed and (unflushed >= self.flush_rows or time.monotonic() - last >= self.flush_seconds):
+                    self._flush(False); unflushed, last = 0, time.monotonic()
+            except Exception as e:
+                print(f"[WARN] output writer: {e}", file=sys.stderr)
+                if item and item[0] is self._FLUSH: item[2].set()
+
+def start_output_sinks(flush_rows=DEFAULT_FLUSH_ROWS, flush_seconds=DEFAULT_FLUSH_SECONDS):
+    global output_sinks
+    output_sinks = OutputSinks(flush_rows, flush_seconds)
+
+def close_output_sinks():
+    global output_sinks
+    if output_sinks:
+        sinks, output_sinks = output_sinks, None
+        sinks.close()
+
+# -------------- Image stage (--check-images / --mirror-images) --------------
+ImageResult = namedtuple("ImageResult", "ok status content_type size sha256 path")
+
+def split_images(value): return [u.strip() for u in (value or "").split(",") if u.strip()]
+
+class ByteBudget:
+    """Bandwidth budget shared by the image workers: at most `rate` bytes/s on average (0 = unlimited)."""
+    def __init__(self, rate):
+        self.rate = rate; self.lock = Lock(); self.allowance = float(rate); self.stamp = time.monotonic()
+
+    def spend(self, n):
+        if not self.rate: return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.stamp) * self.rate) - n; self.stamp = now
+            debt = -self.allowance / self.rate if self.allowance < 0 else 0
+        if debt: time.sleep(debt)
+
+def probe_image(url, timeout=8, proxy=None, http=None):
+    """(status, content type, size) from a HEAD, or a 1-byte range GET where HEAD is refused."""
+    http = http or session
+    r = http.head(url, timeout=timeout, headers=HEADERS, proxies=proxy, allow_redirects=True)
+    if r.status_code in (403, 405, 501) or not r.headers.get("Content-Type"):
+        with http.get(url, timeout=timeout, headers={**HEADERS, "Range": "bytes=0-0"}, proxies=proxy, stream=True) as r: pass
+    size = r.headers.get("Content-Range","").rpartition("/")[2] if r.status_code == 206 else r.headers.get("Content-Length","")
+    return r.status_code, r.headers.get("Content-Type","").split(";")[0].strip().lower(), int(size) if size.isdigit() else None
+
+class ImageStage:
+    """Checks (and with `mirror`, downloads) listing images on its own worker pool and bandwidth budget.
+
+    Results are cached across runs in image_cache.sqlite (re-checked after `max_age` seconds); mirrored
+    files are content-addressed by sha256 under `store`, so an image reused by many listings is kept once.
+    submit() only queues the URLs (it runs on the engine's driver thread and never blocks); a feeder thread
+    keeps at most 4 checks per worker in flight and only those are held in memory, settled results are
+    read back from the cache. finalize() rewrites properties_import.csv without dead images once the
+    run's rows are written, streaming it row by row.
+    """
+    def __init__(self, workers=DEFAULT_IMAGE_WORKERS, bandwidth=0, max_age=DEFAULT_IMAGE_CACHE_MAX_AGE,
+                 mirror=False, store=IMAGE_STORE_DIR):
+        self.max_age, self.mirror, self.store = max_age, mirror, store
+        self.budget = ByteBudget(bandwidth); self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+        # own connection pool and a single quick retry: a dead image host must not tie up the stage
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=workers, max_retries=Retry(total=1, backoff_factor=0.2, status_forcelist=[]))
+        self.http.mount("http://", adapter); self.http.mount("https://", adapter)
+        self.lock = Lock(); self.stats = Counter(); self.pending = {}  # url -> Future, in-flight checks only
+        self.slots = Semaphore(4 * workers)
+        self.queue = deque(); self.cond = Condition(); self.closing = False  # URLs waiting for the feeder
+        self.feeder = Thread(target=self._feed, name="image-feeder", daemon=True); self.feeder.start()
+        self.db = sqlite3.connect(IMAGE_CACHE_FILE, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, ok INTEGER, status INTEGER, content_type TEXT,
+                           size INTEGER, sha256 TEXT, path TEXT, checked_at REAL)""")
+        if mirror: os.makedirs(os.path.join(store, "tmp"), exist_ok=True)
+
+    def cached(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT ok, status, content_type, size, sha256, path, checked_at FROM images WHERE url=?", (url,)).fetchone()
+        if not row or time.time() - row[6] > self.max_age: return None
+        res = ImageResult(bool(row[0]), *row[1:6])
+        if self.mirror and res.ok and not (res.path and os.path.exists(res.path)): return None
+        return res
+
+    def submit(self, urls):
+        with self.cond:
+            self.queue.extend(u for u in urls if u.startswith(("http://", "https://")))
+            self.cond.notify()
+
+    def _feed(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closing: self.cond.wait()
+                if not self.queue: return
+                url = self.queue.popleft()
+            self._start(url)
+
+    def _stop_feeder(self):
+        """Stop the feeder; queued URLs are dropped (finalize() re-reads every image from the CSV)."""
+        with self.cond: self.queue.clear(); self.closing = True; self.cond.notify_all()
+        self.feeder.join()
+
+    def _start(self, url):
+        """Start the check for url unless it is in flight or cached; waits for a free slot."""
+        if url in self.pending or self.cached(url): return
+        self.slots.acquire()
+        fut = self.pool.submit(self._check, url)
+        with self.lock: self.pending[url] = fut
+        fut.add_done_callback(lambda fut, url=url: self._settled(url, fut))
+
+    def _settled(self, url, fut):
+        with self.lock:
+            if self.pending.get(url) is fut: del self.pending[url]
+        self.slots.release()
+
+    def _check(self, url):
+        if shutdown_flag: return None
+        try:
+            with proxy_slot(get_domain(url)) as proxy:
+                status, ctype, size = probe_image(url, proxy=proxy, http=self.http)
+                res = ImageResult(status < 400 and ctype.startswith("image/"), status, ctype, size, "", "")
+                if res.ok and self.mirror: res = self._download(url, proxy)
+        except Exception as e:
+            write_error(f"image_check({url}) -> {e}")
+            with self.lock: self.stats["errors"] += 1
+            return None  # transient: not cached, the URL is kept
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO images VALUES (?,?,?,?,?,?,?,?)", (url, int(res.ok), *res[1:], time.time()))
+            self.stats["checked"] += 1; self.stats["dead"] += not res.ok
+        return res
+
+    def _download(self, url, proxy):
+        import mimetypes
+        h = hashlib.sha256(); size = 0
+        tmp = os.path.join(self.store, "tmp", hashlib.md5(url.encode()).hexdigest())
+        with self.http.get(url, timeout=DEFAULT_TIMEOUT, headers=HEADERS, proxies=proxy, stream=True) as r:
+            r.raise_for_status()
+            ctype = r.headers.get("Content-Type","").split(";")[0].strip().lower()
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(1 << 16):
+                    self.budget.spend(len(chunk)); h.update(chunk); f.write(chunk); size += len(chunk)
+        digest = h.hexdigest()
+        path = os.path.join(self.store, digest[:2], digest[2:] + (mimetypes.guess_extension(ctype) or ""))
+        fresh = not os.path.exists(path)
+        if fresh: os.makedirs(os.path.dirname(path), exist_ok=True); os.replace(tmp, path)
+        else: os.remove(tmp)
+        with self.lock: self.stats["downloaded" if fresh else "deduped"] += 1; self.stats["bytes"] += size
+        return ImageResult(True, r.status_code, ctype, size, digest, path)
+
+    def result(self, url):
+        """Final result for url (waits for its check); None means unknown and the URL is kept."""
+        with self.lock: fut = self.pending.get(url)
+        if fut is not None and not fut.cancelled(): return fut.result()
+        return self.cached(url)
+
+    def finalize(self, fn="properties_import.csv"):
+        if not os.path.exists(fn): return
+        with open(fn, encoding="utf-8-sig", newline="") as f:  # first pass: queue every image not checked yet
+            reader = csv.DictReader(f); fields = list(reader.fieldnames or [])
+            for row in reader:
+                for url in split_images(row.get("Images")) + [row.get("Primary Image (resolved)","").strip()]:
+                    if url.startswith(("http://", "https://")): self._start(url)
+        if self.mirror: fields += [c for c in ("Images (local)", "Primary Image (local)") if c not in fields]
+        def alive(url):
+            res = self.result(url)
+            return res is None or res.ok
+        tmp = fn + ".tmp"
+        with open(fn, encoding="utf-8-sig", newline="") as src, open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fields, quoting=csv.QUOTE_MINIMAL); w.writeheader()
+            for row in csv.DictReader(src):
+                imgs = [u for u in split_images(row.get("Images")) if alive(u)]
+                primary = row.get("Primary Image (resolved)","").strip()
+                if not primary or not alive(primary): primary = imgs[0] if imgs else ""
+                row["Images"], row["Primary Image (resolved)"] = ", ".join(imgs), primary
+                if self.mirror:
+                    local = lambda u: (self.result(u) or ImageResult(False, 0, "", None, "", "")).path
+                    row["Images (local)"] = ", ".join(p for p in map(local, imgs) if p)
+                    row["Primary Image (local)"] = local(primary) if primary else ""
+                w.writerow({k: row.get(k) or "" for k in fields})
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, fn)
+
+    def close(self, finalize=True, fn="properties_import.csv"):
+        self._stop_feeder()
+        if finalize and not shutdown_flag: self.finalize(fn)
+        self.pool.shutdown(wait=True, cancel_futures=True); self.http.close()
+        with self.lock: self.db.close()
+
+def start_image_stage(args):
+    global image_stage
+    if args.check_images or args.mirror_images:
+        image_stage = ImageStage(args.image_workers, args.image_bandwidth_kbps * 1024, args.image_cache_max_age,
+                                 args.mirror_images, IMAGE_STORE_DIR)
+
+def close_image_stage(fn="properties_import.csv"):
+    global image_stage
+    if image_stage:
+        stage, image_stage = image_stage, None
+        stage.close(fn=fn)
+        return stage.stats
+    return None
+
+# -------------- Dedupe index --------------
+class DedupeIndex:
+    """Run-wide and cross-run "seen" set for fetch targets (canonical URLs), Unique IDs and agent keys.
+
+    Keys are stored as 64-bit blake2b hashes (namespace included) in one SQLite table; an in-memory Bloom
+    filter answers the common "never seen" case without touching SQLite, so millions of keys cost a few
+    MB of RAM. The filter is saved with the table and rebuilt (at double capacity) when it gets too full.
+    add(done=False) claims a key for this run only: unless mark_done() is called, the claim is dropped on
+    close (or at once by release()), so a listing that failed is tried again.
+    """
+    def __init__(self, path=DEDUPE_FILE, capacity=DEFAULT_DEDUPE_CAPACITY, error_rate=0.01):
+        self.error_rate = error_rate
+        self.lock = Lock(); self.stats = Counter()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS dedupe_keys (h INTEGER PRIMARY KEY, done INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS dedupe_meta (k TEXT PRIMARY KEY, v)")
+        self.count = self.db.execute("SELECT COUNT(*) FROM dedupe_keys").fetchone()[0]
+        meta = dict(self.db.execute("SELECT k, v FROM dedupe_meta"))
+        if meta.get("count") == self.count and meta.get("bits"):
+            self.capacity, self.k, self.bits = meta["capacity"], meta["k"], bytearray(meta["bits"]); self.m = len(self.bits) * 8
+        else: self._rebuild(max(capacity, self.count * 2))
+        self._drop_claims()
+
+    @staticmethod
+    def _hash(ns, key):
+        return int.from_bytes(hashlib.blake2b(f"{ns}\0{key}".encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+
+    def _positions(self, h):
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.m for i in range(self.k)]
+
+    def _set(self, h):
+        for p in self._positions(h): self.bits[p >> 3] |= 1 << (p & 7)
+
+    def _rebuild(self, capacity):
+        """Size the Bloom filter for `capacity` keys and refill it from SQLite."""
+        self.capacity = capacity
+        self.m = max(64, int(-capacity * math.log(self.error_rate) / math.log(2) ** 2)) // 8 * 8
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray(self.m // 8)
+        for (h,) in self.db.execute("SELECT h FROM dedupe_keys"): self._set(h & 0xFFFFFFFFFFFFFFFF)
+
+    def _drop_claims(self):
+        n = self.db.execute("DELETE FROM dedupe_keys WHERE done=0").rowcount  # their Bloom bits stay: harmless false positives
+        self.count -= n; self.db.commit()
+
+    def add(self, ns, key, done=True):
+        """True (and the key is recorded) when key was not seen before in namespace ns."""
+        h = self._hash(ns, key); signed = h - (1 << 64) if h >> 63 else h
+        with self.lock:
+            if all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h)):
+                if self.db.execute("SELECT 1 FROM dedupe_keys WHERE h=?", (signed,)).fetchone():
+                    self.stats[ns] += 1; metrics.event(f"dedupe.{ns}")
+                    return False
+            self.db.execute("INSERT INTO dedupe_keys VALUES (?,?)", (signed, int(done)))
+            self.count += 1; self._set(h)
+            if self.count > self.capacity: self._rebuild(self.capacity * 2)
+            return True
+
+    def mark_done(self, ns, key):
+        h = self._hash(ns, key); signed = h - (1 << 64) if h >> 63 else h
+        with self.lock: self.db.execute("UPDATE dedupe_keys SET done=1 WHERE h=?", (signed,))
+
+    def release(self, ns, key):
+        """Drop an add(done=False) claim now; its Bloom bits stay (a harmless false positive)."""
+        h = self._hash(ns, key); signed = h - (1 << 64) if h >> 63 else h
+        with self.lock: self.count -= self.db.execute("DELETE FROM dedupe_keys WHERE h=? AND done=0", (signed,)).rowcount
+
+    def flush(self):
+        with self.lock: self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self._drop_claims()
+            self.db.executemany("INSERT OR REPLACE INTO dedupe_meta VALUES (?,?)",
+                                [("count", self.count), ("capacity", self.capacity), ("k", self.k), ("bits", bytes(self.bits))])
+            self.db.commit(); self.db.close()
+
+def agent_key(agency, a):
+    return "|".join((agency, a.get("Agent Name","").strip().lower(), a.get("Email","").strip().lower(), re.sub(r"\D", "", a.get("Phone",""))))
+
+# -------------- Incremental mode (--incremental) --------------
+FINGERPRINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (n INTEGER PRIMARY KEY, id TEXT, started TEXT, finished TEXT, stats TEXT, signature INTEGER);
+CREATE TABLE IF NOT EXISTS pages (page TEXT PRIMARY KEY, url TEXT, agency TEXT, fp INTEGER, listed INTEGER, fetched INTEGER);
+CREATE TABLE IF NOT EXISTS records (ns TEXT, key TEXT, fp INTEGER, page TEXT, url TEXT, agency TEXT, seen INTEGER, PRIMARY KEY (ns, key));
+CREATE INDEX IF NOT EXISTS records_page ON records(page);
+"""
+REMOVED_FIELDS = ["Unique ID","Listing URL","Agency Name","Reason"]
+Unchanged = namedtuple("Unchanged", "url")  # listing result when the page is byte-identical to the last run's
+SCRIPT_FILE = os.path.abspath(__file__)  # resolved before main() changes into --outdir
+
+def fingerprint(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big", signed=True)
+
+def extraction_signature(args):
+    """Fingerprint of everything that shapes a row besides the page: this script, the parser and the feature dictionaries."""
+    with open(SCRIPT_FILE, "rb") as f: source = f.read().decode("utf-8", "replace")
+    return fingerprint(json.dumps([source, args.parser, args.feature_match, FEATURES, FEATURE_FLAGS, FEATURE_PICKS], sort_keys=True))
+
+def row_fingerprint(row):
+    """Fingerprint of a CSV row with whitespace normalized (re-wrapped descriptions are not a change)."""
+    return fingerprint(json.dumps({k: " ".join(str(v).split()) for k, v in row.items()}, sort_keys=True, ensure_ascii=False))
+
+class FingerprintStore:
+    """Cross-run memory for --incremental: a fingerprint per listing page (canonical URL), per property (Unique ID)
+    and per agent (agent_key), plus the run in which each was last seen.
+
+    A page whose body hashes the same as last run (a 304 from --http-cache included) is not parsed: its properties
+    are just marked seen. Otherwise every row is compared with its stored fingerprint and only new or changed rows
+    go to delta-<run>/. When a run completes, properties of pages dropped from the seeds, or missing from a page
+    that was fetched this run, are written to removed_listings.csv; listings that merely failed are kept.
+    An interrupted run is resumed (same run, same delta directory) by the next --incremental start.
+    When the extraction signature differs from the last completed run's, every page is parsed again (rows still
+    only reach the delta when they changed).
+    """
+    def __init__(self, signature, path=FINGERPRINT_FILE):
+        self.lock = Lock(); self.stats = Counter(); self.fresh = {}  # page -> body fingerprint, until the result is recorded
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(FINGERPRINT_SCHEMA)
+        last = self.db.execute("SELECT n, id FROM runs WHERE finished IS NULL ORDER BY n DESC LIMIT 1").fetchone()
+        if last: (self.run, self.id), self.resumed = last, True
+        else:
+            self.id, self.resumed = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"), False
+            self.run = self.db.execute("INSERT INTO runs (id, started, signature) VALUES (?,?,?)", (self.id, now_iso(), signature)).lastrowid
+        self.db.execute("UPDATE runs SET signature=? WHERE n=?", (signature, self.run))
+        previous = self.db.execute("SELECT signature FROM runs WHERE finished IS NOT NULL ORDER BY n DESC LIMIT 1").fetchone()
+        self.reparse = previous is not None and previous[0] != signature
+        self.db.commit()
+        self.dir = f"delta-{self.id}"; os.makedirs(self.dir, exist_ok=True)
+
+    def path(self, name): return os.path.join(self.dir, name)
+
+    def done_urls(self):
+        """Listing URLs already recorded by this run (resume)."""
+        with self.lock: return {u for (u,) in self.db.execute("SELECT url FROM pages WHERE fetched=?", (self.run,))}
+
+    def listed(self, url):
+        """The seeds still contain url: its properties are not removed unless the page itself drops them."""
+        with self.lock: self.db.execute("UPDATE pages SET listed=? WHERE page=?", (self.run, canonical_url(url)))
+
+    def page_unchanged(self, url, html):
+        """True when html is identical to the page recorded last time (worker threads)."""
+        page, fp = canonical_url(url), fingerprint(html)
+        with self.lock:
+            self.fresh[page] = fp
+            row = self.db.execute("SELECT fp, (SELECT COUNT(*) FROM records WHERE page=pages.page) FROM pages WHERE page=?", (page,)).fetchone()
+        return bool(row and row[0] == fp and row[1]) and not self.reparse
+
+    def unchanged(self, agency, url):
+        """Mark an unchanged page and its properties seen; returns how many properties it holds."""
+        page = canonical_url(url)
+        with self.lock:
+            self.fresh.pop(page, None)
+            self.db.execute("UPDATE pages SET listed=?, fetched=? WHERE page=?", (self.run, self.run, page))
+            n = self.db.execute("UPDATE records SET seen=? WHERE page=?", (self.run, page)).rowcount
+        self.stats["unchanged"] += n
+        return n
+
+    def page_fetched(self, agency, url):
+        page = canonical_url(url)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO pages VALUES (?,?,?,?,?,?)", (page, url, agency, self.fresh.pop(page, None), self.run, self.run))
+
+    def change(self, ns, key, row, agency):
+        """"new", "changed" or None (same as last run) for a property/agent row, which is recorded as seen."""
+        fp = row_fingerprint(row); url = row.get("Listing URL","")
+        with self.lock:
+            old = self.db.execute("SELECT fp FROM records WHERE ns=? AND key=?", (ns, key)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO records VALUES (?,?,?,?,?,?,?)", (ns, key, fp, canonical_url(url) if url else None, url, agency, self.run))
+        kind = "new" if old is None else "changed" if old[0] != fp else None
+        self.stats[f"{ns}.{kind or 'same'}"] += 1
+        return kind
+
+    def finish(self):
+        """Run complete: report properties that disappeared and close the run (called once, before the outputs close)."""
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM pages WHERE listed=? LIMIT 1", (self.run,)).fetchone():  # no seeds this run: nothing to compare
+                gone = self.db.execute("""SELECT r.key, r.url, r.agency, CASE WHEN p.listed < :run THEN 'not in seeds' ELSE 'gone from page' END
+                    FROM records r JOIN pages p ON p.page = r.page WHERE r.ns='uid' AND r.seen < :run AND (p.listed < :run OR p.fetched = :run)""",
+                    {"run": self.run}).fetchall()
+                for uid, url, agency, reason in gone:
+                    append_csv_row(self.path("removed_listings.csv"), REMOVED_FIELDS, {"Unique ID":uid, "Listing URL":url, "Agency Name":agency, "Reason":reason})
+                self.db.executemany("DELETE FROM records WHERE ns='uid' AND key=?", [(g[0],) for g in gone])
+                self.db.execute("DELETE FROM pages WHERE listed < ?", (self.run,))
+                self.stats["removed"] = len(gone)
+            self.db.execute("UPDATE runs SET finished=?, stats=? WHERE n=?", (now_iso(), json.dumps(self.stats), self.run))
+
+    def flush(self):
+        with self.lock: self.db.commit()
+
+    def close(self):
+        with self.lock: self.db.commit(); self.db.close()
+
+def start_incremental(args):
+    global fingerprints
+    if args.incremental:
+        fingerprints = FingerprintStore(extraction_signature(args))
+        print(f"[INFO] Incremental run {fingerprints.id}{' (resumed)' if fingerprints.resumed else ''}: deltas in {fingerprints.dir}/"
+              + (" — extraction changed, re-parsing every page" if fingerprints.reparse else ""))
+
+def close_incremental():
+    global fingerprints
+    if fingerprints is None: return None
+    store, fingerprints = fingerprints, None
+    store.close()
+    return store
+
+# -------------- Run state --------------
+AGENT_FIELDS = ["Agency Name","Agent Name","Email","Phone","WhatsApp","Photo","Profile URL"]
+PROFILE_FIELDS = ["Header","Agency Name","Website Url","Slogan","Address","Longitude","Latitude","Banner Image","Short description","Country","State","City","Phone","WhatsApp Number","Email","City/Region (seed)"]
+
+class RunState:
+    """Resume state + output bookkeeping shared by the fetch engines. Only called from the thread driving the run."""
+    def __init__(self, args):
+        self.args = args
+        self.checkpoint = CheckpointStore()
+        self.processed_agencies, self.processed_listings = self.checkpoint.load()
+        self.properties_file, self.agents_file = "properties_import.csv", "agents_import.csv"
+        if fingerprints:  # listings are redone every run; the seen-sets and outputs belong to the run
+            self.processed_listings = fingerprints.done_urls()
+            self.properties_file, self.agents_file = fingerprints.path(self.properties_file), fingerprints.path(self.agents_file)
+        self.dedupe = DedupeIndex(fingerprints.path(DEDUPE_FILE) if fingerprints else DEDUPE_FILE, capacity=args.dedupe_capacity)
+        self.per_agency_counts = defaultdict(int)
+        self.results = 0
+
+    def agency_done(self, key, enriched, profile):
+        if enriched:
+            append_csv_row("enriched_agencies.csv", list(enriched.keys()), enriched)
+        if profile:
+            append_csv_row("profile_import.csv", PROFILE_FIELDS, profile)
+        self.checkpoint.add_agency(key)
+        self._completed()
+
+    def listing_done(self, agency, props, agents):
+        if isinstance(props, Unchanged):
+            self.per_agency_counts[agency] += fingerprints.unchanged(agency, props.url)
+            self._listing_recorded(props.url); self._completed()
+            return
+        if fingerprints and props: fingerprints.page_fetched(agency, props[0].get("Listing URL",""))
+        for p in props or []:
+            if self.per_agency_counts[agency] >= self.args.max_per_agency: break
+            uid = p.get("Unique ID","")
+            if not self.dedupe.add("uid", uid, done=False): continue  # only a claim until the row is written
+            if cluster and not cluster.reserve_row(agency): self.dedupe.release("uid", uid); break
+            self.per_agency_counts[agency] += 1
+            if not fingerprints or fingerprints.change("uid", uid, p, agency):
+                append_csv_row(self.properties_file, list(p.keys()), p)
+                if image_stage: image_stage.submit(split_images(p.get("Images")) + [p.get("Primary Image (resolved)","")])
+            self.dedupe.mark_done("uid", uid)
+            self._listing_recorded(p.get("Listing URL",""))
+        for a in agents or []:
+            key = agent_key(agency, a)
+            if not self.dedupe.add("agent", key): continue
+            row = {"Agency Name":agency, **a}
+            if not fingerprints or fingerprints.change("agent", key, row, agency):
+                append_csv_row(self.agents_file, AGENT_FIELDS, row)
+        self._completed()
+
+    def _listing_recorded(self, url):
+        if fingerprints: self.processed_listings.add(url)  # the store itself is the resume state
+        else: self.checkpoint.add_listing(url)
+        self.dedupe.mark_done("fetch", canonical_url(url))
+
+    def _completed(self):
+        self.results += 1
+        if self.results % self.args.checkpoint_every == 0:
+            # outputs first, so the journal never claims rows that are still only in memory
+            if output_sinks: output_sinks.flush()
+            self.checkpoint.flush(); self.dedupe.flush()
+            if fingerprints: fingerprints.flush()
+            if response_archive: response_archive.flush()
+            domain_health.save()
+
+    def close(self):
+        close_output_sinks()
+        self.checkpoint.close()
+        self.dedupe.close()
+
+# -------------- Pass planning --------------
+class AgencyGate:
+    """Feeds listing jobs to the engines. An agency's seeds are released once its homepage (logo/OG image)
+    is known, so the properties pass overlaps the agency pass; with sequential=True nothing is released
+    until every agency is done (old two-pass behaviour).
+
+    `seeds` may be a lazy iterator: it is only read as far as take() needs, and at most `window` seeds
+    are parked waiting for their agency. Seeds for already processed (or already queued) listings are skipped, and an agency
+    never has more open jobs than its remaining --max-per-agency quota (extras wait for failures).
+    Tasks that come back Deferred (domain breaker open) are re-queued for when the domain may be asked again; at the
+    end of the run those due later than --requeue-max-wait are left for the next run.
+    """
+
+    def __init__(self, agency_rows, seeds, logos, state, args, sequential=False, window=None):
+        self.agency_rows, self.seeds, self.logos, self.state, self.args = list(agency_rows), iter(seeds), logos, state, args
+        self.pending = Counter(row.get("Agency Name","") for row in agency_rows)
+        self.sequential, self.window = sequential, window
+        self.parked = defaultdict(deque); self.n_parked = 0
+        self.ready = deque(); self.open = Counter()  # released, not yet finished
+        self.exhausted = False
+        self.deferred = []; self.requeued = self.dropped = 0  # heap of (until, n, kind, task)
+
+    @property
+    def poll_interval(self):
+        """None (block until a task completes) unless deferred tasks wait for a reopening domain."""
+        if not self.deferred: return None
+        return min(1.0, max(0.05, self.deferred[0][0] - time.time()))
+
+    def _defer(self, kind, task, until):
+        heapq.heappush(self.deferred, (until, self.requeued, kind, task)); self.requeued += 1
+        metrics.event("tasks.requeued")
+
+    def _release_due(self):
+        now = time.time()
+        while self.deferred and self.deferred[0][0] <= now:
+            _, _, kind, task = heapq.heappop(self.deferred)
+            (self.agency_rows if kind == "agency" else self.ready).append(task)
+
+    def _quota(self, agency):
+        return self.args.max_per_agency - self.state.per_agency_counts[agency] - self.open[agency]
+
+    def _drain(self, agency):
+        if self.pending[agency] or (self.sequential and self.pending): return
+        parked = self.parked[agency]
+        if self.state.per_agency_counts[agency] >= self.args.max_per_agency:
+            self.n_parked -= len(parked); parked.clear()
+        while parked and self._quota(agency) > 0:
+            seed = parked.popleft(); self.n_parked -= 1
+            if seed.get("Listing URL","") in self.state.processed_listings: continue
+            ensure_semaphore_for(get_domain(seed["Listing URL"]), self.args.domain_max_concurrency)
+            self.open[agency] += 1; self.ready.append((agency, self.logos.get(agency,""), seed))
+        if not parked: del self.parked[agency]
+
+    def _pull(self, n):
+        while not self.exhausted and (n is None or len(self.ready) < n) and (self.window is None or self.n_parked < self.window):
+            seed = next(self.seeds, None)
+            if seed is None: self.exhausted = True; break
+            url = (seed.get("Listing URL","") or "").strip(); agency = seed.get("Agency Name","")
+            if url and fingerprints: fingerprints.listed(url)
+            if not url or url in self.state.processed_listings: continue
+            if self.state.per_agency_counts[agency] >= self.args.max_per_agency: continue
+            if not self.state.dedupe.add("fetch", canonical_url(url), done=False): continue  # same listing, other URL spelling
+            self.parked[agency].append(seed); self.n_parked += 1
+            self._drain(agency)
+
+    def take(self, n=None):
+        """Up to n released jobs (agency, logo, seed); all of them when n is None."""
+        self._release_due(); self._pull(n)
+        k = len(self.ready) if n is None else min(n, len(self.ready))
+        return [self.ready.popleft() for _ in range(k)]
+
+    def take_agencies(self):
+        """Agency rows to start (all of them, once, plus deferred ones that are due again)."""
+        self._release_due()
+        rows, self.agency_rows = self.agency_rows, []
+        return rows
+
+    def finished(self):
+        """With no task pending only deferred ones can still be released."""
+        if self.deferred and self.deferred[0][0] - time.time() > self.args.requeue_max_wait:
+            self.dropped += len(self.deferred); self.deferred.clear()
+        return not self.deferred
+
+    def agency_finished(self, row, result):
+        name = row.get("Agency Name","")
+        if isinstance(result, Deferred): return self._defer("agency", row, result.until)
+        if result is not None: self.logos[name] = result[2]
+        self.pending[name] -= 1
+        if self.pending[name] > 0: return
+        del self.pending[name]
+        for agency in (list(self.parked) if self.sequential else [name]): self._drain(agency)
+
+    def listing_finished(self, agency, seed=None, result=None):
+        if isinstance(result, Deferred): return self._defer("listing", (agency, self.logos.get(agency,""), seed), result.until)
+        self.open[agency] -= 1
+        self._drain(agency)
+
+def iter_csv_rows(path, sep):
+    """Rows of a seed CSV, read lazily (the file stays open until exhausted)."""
+    with open(path,"r",encoding="utf-8-sig",newline="") as f:
+        yield from csv.DictReader(f, delimiter=sep)
+
+def load_agency_logos():
+    logos={}
+    try:
+        if os.path.exists("enriched_agencies.csv"):
+            with open("enriched_agencies.csv","r",encoding="utf-8-sig") as f:
+                for r in csv.DictReader(f):
+                    logos[r.get("Agency Name","")] = r.get("OG_Image","")
+    except Exception: pass
+    return logos
+
+# -------------- Cluster mode (--cluster) --------------
+CLUSTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, kind TEXT, key TEXT, agency TEXT, domain TEXT, payload TEXT, state TEXT,
+    attempts INTEGER DEFAULT 0, available_at REAL DEFAULT 0, lease_until REAL, node TEXT, error TEXT, UNIQUE(kind, key));
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks(kind, state, domain, id);
+CREATE INDEX IF NOT EXISTS tasks_agency ON tasks(agency, kind, state);
+CREATE INDEX IF NOT EXISTS tasks_node ON tasks(node, state);
+CREATE TABLE IF NOT EXISTS agencies (name TEXT PRIMARY KEY, logo TEXT DEFAULT '', pending INTEGER DEFAULT 0, rows INTEGER DEFAULT 0);
+CREATE TABLE IF NOT EXISTS domains (domain TEXT PRIMARY KEY, cooldown_until REAL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v);
+"""
+
+class ClusterGate:
+    """AgencyGate for a crawl split across processes or machines: the seeds live in a shared SQLite queue (--cluster file).
+
+    Tasks are leased for --lease-seconds and the lease is renewed by a heartbeat while the node holds them; when a
+    node dies its leases run out and the tasks become visible again. Failed listings are retried with backoff up to
+    --max-attempts. Politeness is cluster-wide: a domain never has more than --domain-concurrency-ceiling leased
+    tasks across all nodes (each node's AIMD controller works below that), and circuit-breaker cooldowns are shared.
+    Listings stay 'waiting' until their agency's homepage task is done (its logo is shared through the queue), and
+    --max-per-agency is counted across nodes. Task states: waiting, queued, leased, done, skipped, failed.
+    Completions are written to the queue only after this node's output rows are flushed, so a crashed node's
+    unsaved work is redone by another node (the shards may then repeat rows; --merge drops them).
+    """
+    poll_interval = 1.0
+
+    def __init__(self, path, args, node):
+        self.args, self.node = args, node
+        self.lock = Lock(); self.held = {}  # id(row or seed dict) -> (task id, kind)
+        self.unsaved = []; self.urgent = False; self.saved_at = time.monotonic()  # completions waiting for an output flush
+        self.requeued = self.dropped = 0
+        self.window = args.max_inflight if args.stream_seeds else max(4 * args.workers, 16)
+        self.cap = max(1, args.domain_concurrency_ceiling)
+        self.db = sqlite3.connect(path, timeout=600, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL"); self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(CLUSTER_SCHEMA)
+        self._stop = Event(); Thread(target=self._heartbeat, name="cluster-heartbeat", daemon=True).start()
+
+    @contextmanager
+    def _tx(self):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try: yield self.db
+            except BaseException: self.db.execute("ROLLBACK"); raise
+            else: self.db.execute("COMMIT")
+
+    def seed(self, agency_rows, seeds):
+        """Load the seed CSVs into the queue; only the first node to get here does it. Returns True if this node seeded."""
+        with self._tx() as db:
+            if db.execute("SELECT 1 FROM meta WHERE k='seeded'").fetchone(): return False
+            for row in agency_rows:
+                name, url = row.get("Agency Name",""), (row.get("Website") or "").strip()
+                cur = db.execute("INSERT OR IGNORE INTO tasks (kind, key, agency, domain, payload, state) VALUES ('agency',?,?,?,?,'queued')",
+                                 (f"{name}|{url}", name, get_domain(url), json.dumps(row, ensure_ascii=False)))
+                if cur.rowcount: db.execute("INSERT INTO agencies (name, pending) VALUES (?,1) ON CONFLICT(name) DO UPDATE SET pending=pending+1", (name,))
+            waiting = {n for (n,) in db.execute("SELECT name FROM agencies WHERE pending>0")}
+            for seed in seeds:
+                url, agency = (seed.get("Listing URL","") or "").strip(), seed.get("Agency Name","")
+                if not url: continue
+                db.execute("INSERT OR IGNORE INTO tasks (kind, key, agency, domain, payload, state) VALUES ('listing',?,?,?,?,?)",
+                           (canonical_url(url), agency, get_domain(url), json.dumps(seed, ensure_ascii=False), "waiting" if agency in waiting else "queued"))
+            db.execute("INSERT INTO meta VALUES ('seeded', ?)", (time.time(),))
+        return True
+
+    def _expire(self, db, now):
+        """Leases that ran out (dead node): back to the queue, or failed after --max-attempts."""
+        for tid, kind, agency, attempts in db.execute("SELECT id, kind, agency, attempts FROM tasks WHERE state='leased' AND lease_until<?", (now,)).fetchall():
+            failed = attempts >= self.args.max_attempts
+            db.execute("UPDATE tasks SET state=?, node=NULL, error='lease expired' WHERE id=?", ("failed" if failed else "queued", tid))
+            if failed and kind == "agency": self._agency_settled(db, agency, "")
+
+    def _agency_settled(self, db, name, logo):
+        db.execute("UPDATE agencies SET pending=pending-1, logo=CASE WHEN ?<>'' THEN ? ELSE logo END WHERE name=?", (logo, logo, name))
+        if (db.execute("SELECT pending FROM agencies WHERE name=?", (name,)).fetchone() or (0,))[0] <= 0:
+            db.execute("UPDATE tasks SET state='queued' WHERE agency=? AND kind='listing' AND state='waiting'", (name,))
+
+    def _lease(self, kind, n):
+        """Lease up to n ready tasks of one kind, spread over domains that are below the cluster-wide cap and not cooling down."""
+        if n <= 0: return []
+        now = time.time(); picked = []
+        with self._tx() as db:
+            self._expire(db, now)
+            cooling = dict(db.execute("SELECT domain, cooldown_until FROM domains WHERE cooldown_until>?", (now,)))
+            leased = Counter(dict(db.execute("SELECT domain, COUNT(*) FROM tasks WHERE state='leased' GROUP BY domain")))
+            domains = [d for (d,) in db.execute("SELECT DISTINCT domain FROM tasks WHERE kind=? AND state='queued'", (kind,))]
+            random.shuffle(domains)  # nodes leasing at the same moment start on different domains
+            for d in domains:
+                room = n - len(picked) if not d else min(n - len(picked), self.cap - leased[d])
+                if d in cooling or room <= 0: continue
+                rows = db.execute("""SELECT t.id, t.agency, t.payload, COALESCE(a.logo,''), COALESCE(a.rows,0) FROM tasks t LEFT JOIN agencies a ON a.name=t.agency
+                                     WHERE t.kind=? AND t.state='queued' AND t.domain=? AND t.available_at<=? ORDER BY t.id LIMIT ?""", (kind, d, now, room)).fetchall()
+                full = [r[0] for r in rows if kind == "listing" and r[4] >= self.args.max_per_agency]
+                if full: db.executemany("UPDATE tasks SET state='skipped' WHERE id=?", [(tid,) for tid in full])
+                picked += [r for r in rows if r[0] not in full]
+                if len(picked) >= n: break
+            db.executemany("UPDATE tasks SET state='leased', node=?, lease_until=?, attempts=attempts+1 WHERE id=?",
+                           [(self.node, now + self.args.lease_seconds, r[0]) for r in picked])
+        for d, until in cooling.items(): domain_health.adopt_cooldown(d, until)  # share the other nodes' circuit-breaker trips
+        return picked
+
+    def commit(self, force=False):
+        """Flush the outputs, then record the buffered completions (at once for agencies, else every 50 or every second)."""
+        if not self.unsaved or not (force or self.urgent or len(self.unsaved) >= 50 or time.monotonic() - self.saved_at >= 1.0): return
+        if output_sinks: output_sinks.flush()
+        with self._tx() as db:
+            for apply in self.unsaved: apply(db)
+        self.unsaved = []; self.urgent = False; self.saved_at = time.monotonic()
+
+    def take_agencies(self):
+        self.commit()
+        open_agencies = sum(1 for tid in self.held.values() if tid[1] == "agency")
+        out = []
+        for tid, agency, payload, _, _ in self._lease("agency", max(0, self.window // 4 - open_agencies)):
+            row = json.loads(payload); self.held[id(row)] = (tid, "agency"); out.append(row)
+        return out
+
+    def take(self, n=None):
+        self.commit()
+        out = []
+        for tid, agency, payload, logo, _ in self._lease("listing", self.window if n is None else n):
+            seed = json.loads(payload); self.held[id(seed)] = (tid, "listing"); out.append((agency, logo, seed))
+            ensure_semaphore_for(get_domain(seed.get("Listing URL","")), self.args.domain_max_concurrency)
+        return out
+
+    def _requeue(self, tid, until):
+        """Back to the queue for when the domain may be asked again, without charging the attempt."""
+        self.requeued += 1; metrics.event("tasks.requeued")
+        self.unsaved.append(lambda db: db.execute("UPDATE tasks SET state='queued', node=NULL, available_at=?, attempts=MAX(0, attempts-1), error='domain cooldown' WHERE id=?", (until, tid)))
+
+    def agency_finished(self, row, result):
+        tid, _ = self.held.pop(id(row))
+        if isinstance(result, Deferred): return self._requeue(tid, result.until)
+        def apply(db):
+            db.execute("UPDATE tasks SET state=?, node=NULL WHERE id=?", ("done" if result is not None else "skipped", tid))
+            self._agency_settled(db, row.get("Agency Name",""), result[2] if result is not None else "")
+        self.unsaved.append(apply); self.urgent = True  # its listings are waiting for it
+
+    def listing_finished(self, agency, seed, result):
+        """result None = the task failed: queued again after CLUSTER_RETRY_SECONDS (or the domain's cooldown, if later), failed after --max-attempts."""
+        tid, _ = self.held.pop(id(seed))
+        if isinstance(result, Deferred): return self._requeue(tid, result.until)
+        if result is None:
+            now = time.time()
+            retry_at = max(now + CLUSTER_RETRY_SECONDS, domain_health.retry_at(get_domain(seed.get("Listing URL","")), now))
+        def apply(db):
+            if result is not None: db.execute("UPDATE tasks SET state='done', node=NULL WHERE id=?", (tid,)); return
+            db.execute("UPDATE tasks SET state=CASE WHEN attempts>=? THEN 'failed' ELSE 'queued' END, node=NULL, available_at=?, error='error' WHERE id=?",
+                       (self.args.max_attempts, retry_at, tid))
+        self.unsaved.append(apply)
+
+    def reserve_row(self, agency):
+        """Count one written property against the cluster-wide --max-per-agency quota; False when it is used up."""
+        with self._tx() as db:
+            db.execute("INSERT OR IGNORE INTO agencies (name) VALUES (?)", (agency,))
+            return db.execute("UPDATE agencies SET rows=rows+1 WHERE name=? AND rows<?", (agency, self.args.max_per_agency)).rowcount == 1
+
+    def trip(self, domain, until):
+        with self._tx() as db:
+            db.execute("INSERT INTO domains VALUES (?,?) ON CONFLICT(domain) DO UPDATE SET cooldown_until=MAX(cooldown_until, excluded.cooldown_until)", (domain, until))
+
+    def finished(self):
+        self.commit(force=True)
+        with self.lock:
+            return not self.db.execute("SELECT 1 FROM tasks WHERE kind IN ('agency','listing') AND state IN ('queued','leased','waiting') LIMIT 1").fetchone()
+
+    def _heartbeat(self):
+        while not self._stop.wait(max(1.0, self.args.lease_seconds / 3)):
+            try:
+                with self._tx() as db:
+                    db.execute("UPDATE tasks SET lease_until=? WHERE node=? AND state='leased'", (time.time() + self.args.lease_seconds, self.node))
+            except Exception as e: write_error(f"cluster heartbeat -> {e}")
+
+    def stats(self):
+        with self.lock: return dict(self.db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+
+    def close(self):
+        """Hand unfinished leases straight back to the queue (no attempt charged) instead of waiting for them to expire."""
+        self._stop.set(); self.commit(force=True)
+        held = [(tid,) for tid, _ in self.held.values()]; self.held.clear()
+        with self._tx() as db:
+            db.executemany("UPDATE tasks SET state='queued', node=NULL, attempts=MAX(0, attempts-1) WHERE id=? AND state='leased'", held)
+        stats = self.stats()
+        with self.lock: self.db.close()
+        return stats
+
+def start_cluster(args, agencies, seeds, node):
+    global cluster
+    cluster = ClusterGate(args.cluster, args, node)
+    if cluster.seed(agencies, seeds): print(f"[INFO] Seeded cluster queue {args.cluster}")
+    return cluster
+
+def close_cluster():
+    global cluster
+    if cluster is None: return None
+    stats = cluster.close(); cluster = None
+    return stats
+
+MERGE_KEYS = {
+    "enriched_agencies.csv": agency_key,
+    "profile_import.csv": lambda r: (r.get("Agency Name",""), r.get("Website Url","")),
+    "properties_import.csv": lambda r: r.get("Unique ID",""),
+    "agents_import.csv": lambda r: agent_key(r.get("Agency Name",""), r),
+    "manual_review.csv": lambda r: (r.get("Listing URL",""), r.get("Reason","")),
+}
+
+def merge_shards(outdir):
+    """--merge: combine the node-*/ output shards of a --cluster crawl into outdir, dropping rows repeated across nodes."""
+    shards = sorted(d for d in glob.glob(os.path.join(outdir, "node-*")) if os.path.isdir(d))
+    for name, key in MERGE_KEYS.items():
+        parts = [os.path.join(d, name) for d in shards if os.path.exists(os.path.join(d, name))]
+        if not parts: continue
+        fields = []
+        for part in parts:
+            with open(part, encoding="utf-8-sig", newline="") as f:
+                fields += [c for c in next(csv.reader(f), []) if c not in fields]
+        seen = set(); written = 0; tmp = os.path.join(outdir, name + ".tmp")
+        with open(tmp, "w", encoding="utf-8-sig", newline="") as out:
+            w = csv.DictWriter(out, fieldnames=fields, quoting=csv.QUOTE_MINIMAL); w.writeheader()
+            for part in parts:
+                with open(part, encoding="utf-8-sig", newline="") as f:
+                    for row in csv.DictReader(f):
+                        k = hash(key(row))
+                        if k in seen: continue
+                        seen.add(k); w.writerow(row); written += 1
+        os.replace(tmp, os.path.join(outdir, name))
+        print(f"[INFO] {name}: {written} rows from {len(parts)} shard(s)")
+
+# -------------- Domain scheduler --------------
+class DomainScheduler:
+    """Executor whose workers only pick up tasks whose domain can take a request right now.
+
+    submit(domain, fn, ...) queues the task on the domain's ready queue and returns a Future. Workers
+    round-robin over domains with queued work, take the domain's slot without blocking (poll) and run
+    the task with that slot already held (domain_slot() inside the task uses it). Domains at capacity or
+    waiting for tokens are skipped, and tasks of a cooling-down domain stay parked without holding a
+    thread; once nothing else can run, parked tasks are handed out to come back Deferred (the gate re-queues them).
+    """
+    def __init__(self, workers, args):
+        self.args = args
+        self.queues = defaultdict(deque); self.rr = deque()
+        self.cond = Condition(Lock()); self.running = 0; self.stopping = False
+        self.threads = [Thread(target=self._worker, name=f"sched-{i}", daemon=True) for i in range(workers)]
+        for t in self.threads: t.start()
+
+    def submit(self, domain, fn, *a):
+        fut = Future()
+        if domain: ensure_semaphore_for(domain, self.args.domain_max_concurrency)
+        with self.cond:
+            if not self.queues[domain]: self.rr.append(domain)
+            self.queues[domain].append((fut, fn, a)); self.cond.notify()
+        return fut
+
+    def _next(self):
+        """(domain, task, slot_taken) for the next runnable task; None when stopping."""
+        with self.cond:
+            while not self.stopping:
+                now, wait_for, parked = time.time(), 1.0, None
+                for _ in range(len(self.rr)):
+                    domain = self.rr[0]; self.rr.rotate(-1)
+                    if domain_health.retry_at(domain, now):
+                        parked = parked or domain; continue
+                    ctl = domain_controllers.get(domain)
+                    wait = ctl.poll() if ctl else None
+                    if wait is None: return domain, self._pop(domain), ctl is not None
+                    wait_for = min(wait_for, wait)
+                if parked and not self.running and all(
+                        domain_health.retry_at(d, now) for d in self.rr):
+                    return parked, self._pop(parked), False
+                self.cond.wait(timeout=max(wait_for, 0.01))
+        return None
+
+    def _pop(self, domain):
+        q = self.queues[domain]; task = q.popleft()
+        if not q: del self.queues[domain]; self.rr.remove(domain)
+        self.running += 1
+        return task
+
+    def _worker(self):
+        while True:
+            nxt = self._next()
+            if nxt is None: return
+            domain, (fut, fn, a), slot_taken = nxt
+            _prepaid.domain = domain if slot_taken else None
+            try:
+                if fut.set_running_or_notify_cancel():
+                    try: fut.set_result(fn(*a))
+                    except BaseException as e: fut.set_exception(e)
+            finally:
+                if _prepaid.domain is not None: domain_controllers[domain].release(); _prepaid.domain = None
+                with self.cond: self.running -= 1; self.cond.notify_all()
+
+    def shutdown(self):
+        with self.cond:
+            self.stopping = True
+            for q in self.queues.values():
+                for fut, _, _ in q: fut.cancel()
+            self.queues.clear(); self.rr.clear(); self.cond.notify_all()
+        for t in self.threads: t.join()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.shutdown()
+
+# -------------- Threaded engine --------------
+def run_threaded(gate, state, args):
+    with DomainScheduler(args.workers, args) as executor:
+        pending={}; listings=0
+        def submit_agencies():
+            rows = gate.take_agencies()
+            for row in rows:
+                pending[executor.submit(get_domain((row.get("Website") or "").strip()), process_agency, row, args)] = ("agency", row, None)
+            return len(rows)
+        def submit_listings():
+            nonlocal listings
+            jobs = gate.take(None if gate.window is None else max(0, gate.window - listings))
+            for agency, logo, seed in jobs:
+                url = seed.get("Listing URL","").strip()
+                pending[executor.submit(get_domain(url), process_listing_seed, seed, logo, args)] = ("listing", agency, seed)
+            listings += len(jobs)
+            return len(jobs)
+        submit_agencies(); submit_listings()
+        bar = tqdm(total=len(pending))
+        while (pending or not gate.finished()) and not shutdown_flag:
+            if not pending: time.sleep(gate.poll_interval)
+            done, _ = wait(pending, timeout=gate.poll_interval, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, a, seed = pending.pop(fut)
+                try: result = fut.result(timeout=args.task_timeout); error = None
+                except Exception as e: result, error = None, e
+                if isinstance(result, Future):  # fetched; extraction is running on a parse process
+                    pending[result] = (kind, a, seed); continue
+                bar.update(1)
+                if kind == "agency":
+                    if error: write_error(f"Agency failed: {a.get('Agency Name','?')} -> {error}")
+                    if result is not None and not isinstance(result, Deferred): state.agency_done(agency_key(a), result[0], result[1])
+                    gate.agency_finished(a, result)
+                    continue
+                listings -= 1
+                if error:
+                    write_error(f"Task timeout/error: {seed.get('Listing URL','?')} -> {error}")
+                    record_domain_fail(get_domain(seed.get("Listing URL","")), args.domain_fail_threshold, args.domain_cooldown_seconds)
+                elif result is not None and not isinstance(result, Deferred): state.listing_done(a, *result)
+                gate.listing_finished(a, seed, None if error else result)
+            bar.total += submit_agencies() + submit_listings(); bar.refresh()
+        bar.close()
+        for fut in pending: fut.cancel()
+
+# -------------- Async engine (--engine async) --------------
+class AsyncFetcher:
+    """aiohttp counterpart of fetch_url: same headers, per-attempt timeouts, retry/backoff (incl. Retry-After) and proxies.
+    One pooled ClientSession holds up to --async-connections sockets across all domains."""
+    def __init__(self, args):
+        import aiohttp  # optional: pip install aiohttp
+        self.aiohttp = aiohttp; self.args = args; self.session = None
+
+    async def __aenter__(self):
+        connector = self.aiohttp.TCPConnector(limit=self.args.async_connections, limit_per_host=0, ttl_dns_cache=300)
+        self.session = self.aiohttp.ClientSession(connector=connector, headers=HEADERS)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    @staticmethod
+    async def read_body(r):
+        """(body, truncated): the whole body, or at most --max-bytes of it (the connection is dropped when cut short)."""
+        max_bytes = fetch_config["max_bytes"]
+        if not max_bytes: return await r.read(), False
+        buf = bytearray()
+        async for chunk in r.content.iter_chunked(65536):
+            buf += chunk
+            if len(buf) >= max_bytes:
+                r.close(); return bytes(buf[:max_bytes]), True
+        return bytes(buf), False
+
+    async def fetch(self, url, proxy=None, timeout=DEFAULT_TIMEOUT):
+        """FetchResult like fetch(): proxies come from the pool per attempt unless one is given."""
+        tmo = self.aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        domain = get_domain(url)
+        entry, req_headers = cache_request(url, None)
+        if entry and entry.fresh:
+            archive_response(url, 200, entry.headers, entry.body)
+            return FetchResult(decode_response(entry.body, entry.headers, 200), 200, entry.headers, 0.0, "fresh")
+        attempt = 0; tried = set()
+        while attempt <= FETCH_RETRIES:
+            pooled = await proxy_pool.acquire_async(domain, tried, timeout) if proxy is None and proxy_pool else None
+            if proxy is None and proxy_pool and pooled is None:
+                write_error(f"fetch_url({url}) -> no usable proxy"); return FetchResult("", 0, {}, 0.0, "", True)
+            proxies = pooled.proxies if pooled else proxy
+            proxy_url = proxies.get(urlparse(url).scheme) if isinstance(proxies, dict) else proxies
+            t0 = time.monotonic(); outcome = "site"
+            try:
+                async with self.session.get(url, proxy=proxy_url, timeout=tmo, headers=req_headers) as r:
+                    headers_at = time.monotonic() - t0
+                    body, truncated = await self.read_body(r)
+                    elapsed = time.monotonic() - t0
+                    metrics.stage("fetch.ttfb", headers_at); metrics.stage("fetch.download", elapsed - headers_at)
+                    if pooled and r.status == 407:
+                        outcome = "proxy"; metrics.event("proxy.failover"); tried.add(pooled.name); continue
+                    metrics.response(domain, r.status, elapsed, len(body))
+                    if truncated: metrics.event("fetch.truncated")
+                    if r.status not in RETRY_STATUSES:
+                        status, resp_headers, body, cached = cache_response(url, entry, r.status, r.headers, body, truncated)
+                        archive_response(url, status, resp_headers, body, truncated)
+                        text = decode_response(body, resp_headers, status)
+                        blocked = bool(BLOCK_RE.search(text)); outcome = response_outcome(r.status, blocked)
+                        observe_response(domain, r.status, elapsed, blocked=blocked)
+                        return FetchResult(text, status, resp_headers, elapsed, cached)
+                    observe_response(domain, r.status, elapsed, r.headers.get("Retry-After"))
+                    attempt += 1
+                    wait = retry_wait(r.status, r.headers, attempt) if attempt <= FETCH_RETRIES else None
+                    if wait is None:
+                        write_error(f"fetch_url({url}) -> too many {r.status} error responses"); return FetchResult("", r.status, r.headers, elapsed)
+            except Exception as e:
+                if pooled and is_proxy_error(e):
+                    outcome = "proxy"; metrics.event("proxy.failover"); tried.add(pooled.name); continue
+                observe_response(domain, None, time.monotonic() - t0)
+                metrics.response(domain, None, time.monotonic() - t0)
+                attempt += 1
+                if attempt > FETCH_RETRIES:
+                    write_error(f"fetch_url({url}) -> {e!r}"); return FetchResult("", 0, {}, time.monotonic() - t0)
+                wait = retry_backoff(attempt)
+            finally:
+                if pooled: proxy_pool.done(pooled, domain, outcome, time.monotonic() - t0)
+            await asyncio.sleep(wait)
+        return FetchResult("", 0, {}, 0.0)
+
+def extract_async(parse_pool, fn, *a):
+    """Awaitable fn(*a) on the parse processes (--parse-pool process), else on the engine's parse threads."""
+    if parse_processes is not None:
+        fut = parse_stage(fn, *a)
+        if not isinstance(fut, Future): result, fut = fut, Future(); fut.set_result(result)  # parse processes are gone
+        return asyncio.wrap_future(fut)
+    return asyncio.get_running_loop().run_in_executor(parse_pool, fn, *a)
+
+async def aprocess_agency(row, args, fetcher, parse_pool):
+    """process_agency on the event loop: async fetch under the domain cap, extraction on parse_pool."""
+    url=(row.get("Website") or "").strip()
+    if not url: return None, None, ""
+    domain = get_domain(url)
+    ctl = ensure_semaphore_for(domain, args.domain_max_concurrency)
+    await ctl.acquire_async()
+    try:
+        if not domain_allowed(domain, time.time(), args.domain_fail_threshold, args.domain_cooldown_seconds):  # checked with the slot held:
+            return Deferred(domain, domain_health.retry_at(domain))                                           # a trip while queued counts
+        res = await fetcher.fetch(url)
+    finally: ctl.release()
+    if res.proxy_failed: return None
+    html = res.text
+    if html: record_domain_success(domain)
+    else: record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
+    return await extract_async(parse_pool, agency_from_html, row, url, html)
+
+async def aprocess_listing_seed(seed_row, agency_logo, args, fetcher, parse_pool, fallback_pool):
+    """process_listing_seed on the event loop: the fetch is async, the blocked-page fallbacks (blocking sitemap/API
+    requests, Playwright) run on fallback_pool and extraction on parse_pool."""
+    url = seed_row.get("Listing URL","").strip()
+    if not url: return [], []
+    domain = get_domain(url)
+    ctl = ensure_semaphore_for(domain, args.domain_max_concurrency)
+    loop = asyncio.get_running_loop()
+    try:
+        await ctl.acquire_async()
+        try:
+            if not domain_allowed(domain, time.time(), args.domain_fail_threshold, args.domain_cooldown_seconds):
+                return Deferred(domain, domain_health.retry_at(domain))
+            res = await fetcher.fetch(url); html = res.text
+            if res.proxy_failed: return None
+            if looks_blocked(html):
+                html = await loop.run_in_executor(fallback_pool, resolve_blocked_listing, url, html, domain, args)
+                if not html: return None
+        finally: ctl.release()
+        if fingerprints and fingerprints.page_unchanged(url, html):
+            record_domain_success(domain); return Unchanged(url), []
+        props, agents = await extract_async(parse_pool, extract_listing, html, seed_row, agency_logo, url)
+        record_domain_success(domain)
+        return props, agents
+    except Exception as e:
+        write_error(f"process_listing_seed({url}) -> {e}")
+        record_domain_fail(domain, args.domain_fail_threshold, args.domain_cooldown_seconds)
+        return None
+
+async def _run_async(gate, state, args):
+    parse_pool = ThreadPoolExecutor(max_workers=args.parse_workers, thread_name_prefix="parse")
+    fallback_pool = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="fallbacks")  # network waits, not CPU: sized like the threaded engine
+    inflight = asyncio.Semaphore(args.async_connections)
+    async with AsyncFetcher(args) as fetcher:
+        async def run_agency(row):
+            async with inflight:
+                if shutdown_flag: return "agency", row, None
+                try: return "agency", row, await aprocess_agency(row, args, fetcher, parse_pool)
+                except Exception as e:
+                    write_error(f"Agency failed: {row.get('Agency Name','?')} -> {e}"); return "agency", row, None
+        async def run_listing(job):
+            agency, logo, seed = job
+            async with inflight:
+                if shutdown_flag: return "listing", (agency, seed), None
+                return "listing", (agency, seed), await aprocess_listing_seed(seed, logo, args, fetcher, parse_pool, fallback_pool)
+        listings = 0
+        def submit_listings():
+            nonlocal listings
+            jobs = gate.take(None if gate.window is None else max(0, gate.window - listings))
+            tasks.update(asyncio.ensure_future(run_listing(j)) for j in jobs)
+            listings += len(jobs)
+            return len(jobs)
+        def submit_agencies():
+            rows = gate.take_agencies()
+            tasks.update(asyncio.ensure_future(run_agency(row)) for row in rows)
+            return len(rows)
+        tasks = set()
+        submit_agencies(); submit_listings()
+        bar = tqdm(total=len(tasks))
+        try:
+            while (tasks or not gate.finished()) and not shutdown_flag:
+                if not tasks: await asyncio.sleep(gate.poll_interval); done = ()
+                else: done, tasks = await asyncio.wait(tasks, timeout=gate.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    kind, a, result = t.result(); bar.update(1)
+                    if kind == "agency":
+                        if result is not None and not isinstance(result, Deferred): state.agency_done(agency_key(a), result[0], result[1])
+                        gate.agency_finished(a, result)
+                    else:
+                        (agency, seed), listings = a, listings - 1
+                        if result is not None and not isinstance(result, Deferred): state.listing_done(agency, *result)
+                        gate.listing_finished(agency, seed, result)
+                bar.total += submit_agencies() + submit_listings(); bar.refresh()
+        finally:
+            bar.close()
+            for t in tasks: t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    fallback_pool.shutdown(wait=True)
+    parse_pool.shutdown(wait=True)
+
+def run_async(gate, state, args):
+    try: import aiohttp  # noqa: F401
+    except ImportError: raise SystemExit("[ERROR] --engine async requires aiohttp (pip install aiohttp)")
+    asyncio.run(_run_async(gate, state, args))
+
+# -------------- Offline reparse engine (--reparse) --------------
+def archived_page(url):
+    """Text of url's latest archived response, decoded the way fetch() decoded it (None when it was never archived)."""
+    rec = archive_reader.get(url) if archive_reader and url else None
+    if rec is None: return None
+    with metrics.timed("parse.archive"): return decode_response(rec.body, rec.headers, rec.status)
+
+def reparse_agency(row, url):
+    """process_agency over the archive."""
+    if not url: return None, None, ""
+    return agency_from_html(row, url, archived_page(url) or "")
+
+def reparse_listing(seed_row, agency_logo, url):
+    """process_listing_seed over the archive: (props, agents, note); note is "missing" or "blocked" when nothing was extracted."""
+    html = archived_page(url)
+    if html is None: return [], [], "missing"
+    if looks_blocked(html): return [], [], "blocked"
+    return (*extract_listing(html, seed_row, agency_logo, url), "")
+
+def run_reparse(gate, state, args):
+    """Engine for --reparse: no network. Every task reads its page from the archive and runs the extractor on the
+    parse processes (one per core by default), with at most 8 tasks per process in flight."""
+    pending = {}; cap = 8 * args.parse_workers
+    def submit(key, fn, *a):
+        fut = parse_stage(fn, *a)
+        if not isinstance(fut, Future): result, fut = fut, Future(); fut.set_result(result)  # parse processes are gone
+        pending[fut] = key
+    def submit_tasks():
+        rows = gate.take_agencies()
+        for row in rows: submit(("agency", row, None), reparse_agency, row, (row.get("Website") or "").strip())
+        jobs = gate.take(max(0, cap - len(pending)))
+        for agency, logo, seed in jobs: submit(("listing", agency, seed), reparse_listing, seed, logo, seed.get("Listing URL","").strip())
+        return len(rows) + len(jobs)
+    bar = tqdm(total=submit_tasks())
+    while (pending or not gate.finished()) and not shutdown_flag:
+        done, _ = wait(pending, timeout=gate.poll_interval, return_when=FIRST_COMPLETED)
+        for fut in done:
+            kind, a, seed = pending.pop(fut); bar.update(1)
+            try: result = fut.result(); error = None
+            except Exception as e: result, error = None, e
+            if kind == "agency":
+                if error: write_error(f"Agency failed: {a.get('Agency Name','?')} -> {error}")
+                if result is not None: state.agency_done(agency_key(a), result[0], result[1])
+                gate.agency_finished(a, result)
+                continue
+            if error:
+                write_error(f"Reparse failed: {seed.get('Listing URL','?')} -> {error}"); gate.listing_finished(a, seed, None); continue
+            props, agents, note = result
+            if note: metrics.event(f"reparse.{note}")
+            if note == "blocked": write_manual_review({"Listing URL": seed.get("Listing URL",""), "Reason": "Blocked or empty (archived page)"})
+            state.listing_done(a, props, agents); gate.listing_finished(a, seed, (props, agents))
+        bar.total += submit_tasks(); bar.refresh()
+    bar.close()
+    for fut in pending: fut.cancel()
 
 # -------------- Main --------------
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--in", required=True, dest="inp", help="Seed agencies CSV")
+    ap.add_argument("--in", dest="inp", help="Seed agencies CSV (required unless --merge)")
     ap.add_argument("--sep", default="\t", dest="sep", help="CSV separator (default: tab)")
     ap.add_argument("--props-in", default="", dest="props_in", help="Properties seed CSV")
     ap.add_argument("--outdir", default=".", dest="outdir")
     ap.add_argument("--max-per-agency", type=int, default=DEFAULT_MAX_PER_AGENCY)
     ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
-    ap.add_argument("--domain-max-concurrency", type=int, default=DEFAULT_DOMAIN_CONCURRENCY)
+    ap.add_argument("--domain-max-concurrency", type=int, default=DEFAULT_DOMAIN_CONCURRENCY, help="Starting per-domain concurrency")
+    ap.add_argument("--domain-concurrency-ceiling", type=int, default=DEFAULT_DOMAIN_CONCURRENCY_CEILING, help="Adaptive rate control: max per-domain concurrency")
+    ap.add_argument("--rate-control", choices=["adaptive","fixed"], default="adaptive", help="Per-domain AIMD rate control, or fixed concurrency + throttle")
     ap.add_argument("--task-timeout", type=int, default=DEFAULT_TASK_TIMEOUT)
     ap.add_argument("--domain-fail-threshold", type=int, default=5)
     ap.add_argument("--domain-cooldown-seconds", type=int, default=3600)
-    ap.add_argument("--throttle-seconds", type=float, default=0.0)
+    ap.add_argument("--requeue-max-wait", type=float, default=DEFAULT_REQUEUE_MAX_WAIT, help="End of run: wait at most this long for cooling domains to reopen (later tasks are left for the next run)")
+    ap.add_argument("--throttle-seconds", type=float, default=0.0, help="Minimum per-domain request interval (token bucket)")
     ap.add_argument("--checkpoint-every", type=int, default=50)
-    ap.add_argument("--proxies-file", default="")
+    ap.add_argument("--dedupe-capacity", type=int, default=DEFAULT_DEDUPE_CAPACITY, help=f"Keys the {DEDUPE_FILE} Bloom filter is sized for (grows as needed)")
+    ap.add_argument("--flush-rows", type=int, default=DEFAULT_FLUSH_ROWS, help="Output writer: flush after this many rows")
+    ap.add_argument("--flush-seconds", type=float, default=DEFAULT_FLUSH_SECONDS, help="Output writer: flush at least this often")
+    ap.add_argument("--max-bytes", type=int, default=0, help="Stream responses and stop reading after this many bytes; cheap encoding sniffing (0 = read whole bodies)")
+    ap.add_argument("--proxies-file", default="", help="JSON list of proxies (URLs or requests-style dicts), chosen per request by health score")
+    ap.add_argument("--proxy-max-concurrency", type=int, default=DEFAULT_PROXY_CONCURRENCY, help="Requests in flight per proxy (0 = unlimited)")
+    ap.add_argument("--proxy-quarantine-seconds", type=float, default=DEFAULT_PROXY_QUARANTINE, help="First quarantine of a failing proxy (doubles per relapse, then a probe request)")
+    ap.add_argument("--proxy-sticky", action="store_true", help="Keep each domain on the proxy it first got while that proxy works for it")
+    ap.add_argument("--check-images", action="store_true", help="HEAD-check listing images and drop dead ones from properties_import.csv")
+    ap.add_argument("--mirror-images", action="store_true", help="Also download live images into a content-addressed store (implies --check-images)")
+    ap.add_argument("--image-workers", type=int, default=DEFAULT_IMAGE_WORKERS, help="Concurrent image requests (separate from --workers)")
+    ap.add_argument("--image-bandwidth-kbps", type=int, default=0, help="Image download budget in KB/s (0 = unlimited)")
+    ap.add_argument("--image-cache-max-age", type=int, default=DEFAULT_IMAGE_CACHE_MAX_AGE, help="Seconds before a cached image check is redone")
     ap.add_argument("--use-playwright", action="store_true")
+    ap.add_argument("--browser-pool-size", type=int, default=DEFAULT_BROWSER_POOL, help="Chromium instances kept for --use-playwright (independent of --workers)")
+    ap.add_argument("--browser-recycle-pages", type=int, default=DEFAULT_BROWSER_RECYCLE_PAGES, help="Relaunch a browser after this many renders")
+    ap.add_argument("--http-cache", action="store_true", help=f"Cache responses in {HTTP_CACHE_FILE} and revalidate them on later runs")
+    ap.add_argument("--cache-max-age", type=int, default=DEFAULT_CACHE_MAX_AGE, help="Seconds to reuse cached pages that have no ETag/Last-Modified")
+    ap.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_MB, help="HTTP cache size limit (LRU eviction)")
+    ap.add_argument("--metrics-file", default=METRICS_FILE, help="Stage timings + per-domain stats, JSON (or Prometheus text for *.prom); empty = off")
+    ap.add_argument("--metrics-interval", type=float, default=DEFAULT_METRICS_INTERVAL, help="Seconds between metrics file updates (0 = only at the end)")
+    ap.add_argument("--profile", action="store_true", help=f"cProfile the run (all threads) into {PROFILE_FILE}")
+    ap.add_argument("--features-file", default="", help="JSON/YAML file extending the feature dictionaries")
+    ap.add_argument("--feature-match", choices=["word","substring"], default="substring", help="Keyword matching: raw substrings (default) or whole words, plurals allowed")
+    ap.add_argument("--parser", choices=list(PARSERS), default="bs4", help="HTML backend: BeautifulSoup (default), raw lxml, or lxml + JSON-LD scanner")
+    ap.add_argument("--engine", choices=["threads","async"], default="threads", help="Fetch engine (async requires aiohttp)")
+    ap.add_argument("--sequential-passes", action="store_true", help="Finish every agency before any listing starts")
+    ap.add_argument("--stream-seeds", action="store_true", help="Read --props-in lazily and keep at most --max-inflight listing tasks queued")
+    ap.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT, help="With --stream-seeds: listing tasks submitted (and seeds held) at once")
+    ap.add_argument("--cluster", default="", help="Shared SQLite queue file: run as one node of a multi-process/multi-machine crawl")
+    ap.add_argument("--node-id", default="", help="Cluster node name (default: host-pid); outputs go to --outdir/node-<id>/")
+    ap.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS, help="Cluster: task visibility timeout (renewed while the node is alive)")
+    ap.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Cluster: leases per task before it is marked failed")
+    ap.add_argument("--merge", action="store_true", help="Merge the node-*/ shards in --outdir into single CSVs and exit")
+    ap.add_argument("--incremental", action="store_true", help=f"Re-check every listing against {FINGERPRINT_FILE}; write only new/changed properties and agents (+ removed_listings.csv) to delta-<run>/")
+    ap.add_argument("--async-connections", type=int, default=DEFAULT_ASYNC_CONNECTIONS, help="Async engine: max concurrent requests/sockets")
+    ap.add_argument("--parse-workers", type=int, default=None, help=f"Parse processes (--parse-pool process; default {DEFAULT_PARSE_WORKERS}, one per core with --reparse); async engine: parse threads (blocked-page fallbacks get --workers threads of their own)")
+    ap.add_argument("--parse-pool", choices=["thread","process"], default="thread", help="Parse on the fetch threads (default) or hand pages to a process pool")
+    ap.add_argument("--archive", action="store_true", help=f"Keep every fetched page in --outdir/{ARCHIVE_DIR}/ (WARC-style .warc.gz + index) for --reparse")
+    ap.add_argument("--reparse", default="", metavar="DIR", help=f"No network: rebuild the outputs in --outdir from DIR/{ARCHIVE_DIR}/ (same --in/--props-in), extracting on every core")
     args = ap.parse_args()
+    if args.merge: return merge_shards(args.outdir)
+    if not args.inp: ap.error("--in is required")
+    if args.incremental and args.cluster: ap.error("--incremental keeps its fingerprints in one --outdir; it cannot be combined with --cluster")
+    if args.reparse:
+        if args.cluster or args.incremental or args.archive or args.check_images or args.mirror_images:
+            ap.error("--reparse works offline on one --outdir; drop --cluster/--incremental/--archive/--check-images/--mirror-images")
+        args.reparse = os.path.abspath(args.reparse)
+        if not os.path.exists(os.path.join(args.reparse, ARCHIVE_DIR, ARCHIVE_INDEX)): ap.error(f"no {ARCHIVE_DIR}/{ARCHIVE_INDEX} in {args.reparse} (crawl with --archive first)")
+        if os.path.abspath(args.outdir) == args.reparse: ap.error("--reparse needs a fresh --outdir (the crawl's own outputs and resume state live in DIR)")
+        args.parse_pool = "process"
+    if args.parse_workers is None: args.parse_workers = (os.cpu_count() or 1) if args.reparse else DEFAULT_PARSE_WORKERS
+    node = args.node_id or f"{socket.gethostname()}-{os.getpid()}"
+    if args.cluster:  # each node writes its own shard; shared/input paths stay relative to where it was started
+        args.cluster, args.inp = os.path.abspath(args.cluster), os.path.abspath(args.inp)
+        if args.props_in: args.props_in = os.path.abspath(args.props_in)
+        if args.proxies_file: args.proxies_file = os.path.abspath(args.proxies_file)
+        args.outdir = os.path.join(args.outdir, f"node-{node}")
+    configure_features(args.features_file, word_boundary=(args.feature_match == "word"))
+    configure_parser(args.parser)
+    configure_rate_control(args)
+    configure_fetch(args)
 
     if not os.path.exists(args.outdir): os.makedirs(args.outdir, exist_ok=True)
     os.chdir(args.outdir)
@@ -587,93 +3568,78 @@ def main():
         agencies = list(csv.DictReader(f, delimiter=args.sep))
     props_seed=[]
     if args.props_in:
-        with open(args.props_in,"r",encoding="utf-8-sig") as f:
-            props_seed = list(csv.DictReader(f, delimiter=args.sep))
-
-    proxies_hook=None
-    if args.proxies_file and os.path.exists(args.proxies_file):
-        try:
-            with open(args.proxies_file,"r",encoding="utf-8") as pf:
-                proxies_hook = ProxiesHook(json.load(pf))
-        except Exception as e:
-            write_error(f"Proxies file failed: {e}")
-
-    progress = load_progress()
-    processed_listings = set(progress.get("processed_listings", []))
-    processed_agencies = set(tuple(x) for x in progress.get("processed_agencies", []))
-
-    # Agencies pass
-    print("[INFO] Agencies pass...")
-    for row in tqdm(agencies):
-        if shutdown_flag: break
-        key=(row.get("Agency Name",""), row.get("Website",""))
-        if key in processed_agencies: continue
-        try:
-            enriched, profile, banner = extract_agency_info(row, throttle=args.throttle_seconds, proxy=(proxies_hook.get_next() if proxies_hook else None))
-            if enriched:
-                append_csv_row("enriched_agencies.csv", list(enriched.keys()), enriched)
-            if profile:
-                profile_fields=["Header","Agency Name","Website Url","Slogan","Address","Longitude","Latitude","Banner Image","Short description","Country","State","City","Phone","WhatsApp Number","Email","City/Region (seed)"]
-                append_csv_row("profile_import.csv", profile_fields, profile)
-            processed_agencies.add(key)
-            progress["processed_agencies"] = [list(x) for x in processed_agencies]
-            save_progress(progress)
-        except Exception as e:
-            write_error(f"Agency failed: {row.get('Agency Name','?')} -> {e}")
+        props_seed = iter_csv_rows(args.props_in, args.sep)
+        if not args.stream_seeds: props_seed = list(props_seed)
 
-    # map agency -> logo
-    agency_logo_by_name={}
+    start_parse_processes(args)
+    if args.reparse: open_archive_reader(os.path.join(args.reparse, ARCHIVE_DIR))  # after the fork: each parse process opens its own
+    profiler = start_profiler() if args.profile else None
+    start_output_sinks(args.flush_rows, args.flush_seconds)
+    start_metrics(args)
+    open_http_cache(args)
+    open_domain_health()
+    start_browser_pool(args)
+    start_proxy_pool(args)
+    start_image_stage(args)
+    start_incremental(args)
+    start_response_archive(args)
+    state = RunState(args)
     try:
-        if os.path.exists("enriched_agencies.csv"):
-            with open("enriched_agencies.csv","r",encoding="utf-8-sig") as f:
-                for r in csv.DictReader(f):
-                    agency_logo_by_name[r.get("Agency Name","")] = r.get("OG_Image","")
-    except Exception: pass
-
-    # Properties pass (parallel)
-    print("[INFO] Properties pass...")
-    seeds_by_agency = defaultdict(list)
-    for s in props_seed: seeds_by_agency[s.get("Agency Name","")].append(s)
-    per_agency_counts = defaultdict(int)
+        # Agencies + properties passes (parallel; an agency's listings start once its logo/OG image is known)
+        print(f"[INFO] Agencies + properties pass ({f'reparse of {args.reparse}' if args.reparse else args.engine})...")
+        if args.cluster: gate = start_cluster(args, agencies, props_seed, node)
+        else:
+            agency_rows = [row for row in agencies if agency_key(row) not in state.processed_agencies]
+            gate = AgencyGate(agency_rows, props_seed, load_agency_logos(), state, args, sequential=args.sequential_passes,
+                              window=args.max_inflight if args.stream_seeds else None)
+        if args.reparse: run_reparse(gate, state, args)
+        elif args.engine == "async": run_async(gate, state, args)
+        else: run_threaded(gate, state, args)
+        if fingerprints and not shutdown_flag: fingerprints.finish()
+    finally:
+        close_parse_processes()
+        cluster_stats = close_cluster()
+        browser_stats = close_browser_pool()
+        state.close()
+        archive_stats = close_response_archive()
+        delta = close_incremental()
+        image_stats = close_image_stage(state.properties_file)
+        cache_stats = close_http_cache()
+        stop_metrics(args)
+        close_domain_health()
+    if profiler: stop_profiler(profiler, PROFILE_FILE)
 
-    with ThreadPoolExecutor(max_workers=args.workers) as executor:
-        futures={}
-        for agency, seeds in seeds_by_agency.items():
-            logo = agency_logo_by_name.get(agency,"")
-            for seed in seeds:
-                if per_agency_counts[agency] >= args.max_per_agency: break
-                url = seed.get("Listing URL",""); if not url: continue
-                if url in processed_listings: continue
-                dom=get_domain(url); ensure_semaphore_for(dom, args.domain_max_concurrency)
-                futures[executor.submit(process_listing_seed, seed, logo, args, proxies_hook)] = (agency, seed)
-        for fut in tqdm(as_completed(futures), total=len(futures)):
-            if shutdown_flag: break
-            agency, seed = futures[fut]
-            try:
-                props, agents = fut.result(timeout=args.task_timeout)
-            except Exception as e:
-                write_error(f"Task timeout/error: {seed.get('Listing URL','?')} -> {e}")
-                record_domain_fail(get_domain(seed.get("Listing URL","")), args.domain_fail_threshold, args.domain_cooldown_seconds)
-                continue
-            if props:
-                remaining = args.max_per_agency - per_agency_counts[agency]
-                for p in props[:remaining]:
-                    append_csv_row("properties_import.csv", list(p.keys()), p)
-                    per_agency_counts[agency] += 1
-                    processed_listings.add(p.get("Listing URL",""))
-            if agents:
-                for a in agents:
-                    append_csv_row("agents_import.csv", ["Agency Name","Agent Name","Email","Phone","WhatsApp","Photo","Profile URL"], {"Agency Name":agency, **a})
-            if len(processed_listings) % args.checkpoint_every == 0:
-                progress["processed_listings"] = list(processed_listings); save_progress(progress)
-
-    progress["processed_listings"] = list(processed_listings); save_progress(progress)
+    processed_agencies, per_agency_counts = state.processed_agencies, state.per_agency_counts
 
     print("✅ Done")
     print(f" Agencies processed: {len(processed_agencies)}")
-    print(f" Properties written: {sum(per_agency_counts.values())}")
-    print(f" Agents file: agents_import.csv")
+    if delta is None: print(f" Properties written: {sum(per_agency_counts.values())}")  # incremental: the delta counts below
+    if os.path.exists(state.agents_file): print(f" Agents file: {state.agents_file}")
+    dup = state.dedupe.stats
+    if dup: print(f" Duplicates skipped: {dup['fetch']} listing URLs, {dup['uid']} properties, {dup['agent']} agents")
+    if delta is not None:
+        d = delta.stats
+        print(f" Incremental ({delta.dir}/): {d['uid.new']} new, {d['uid.changed']} changed, {d['uid.same'] + d['unchanged']} unchanged, {d['removed']} removed properties;"
+              f" {d['agent.new'] + d['agent.changed']} new/changed agents")
     if os.path.exists("manual_review.csv"): print(" Manual review: manual_review.csv")
+    breakers = domain_health.states()
+    if breakers["open"] or breakers["half-open"] or gate.requeued:
+        print(f" Domain breakers ({DOMAIN_HEALTH_FILE}): {breakers['open']} open, {breakers['half-open']} half-open;"
+              f" {gate.requeued} tasks re-queued, {gate.dropped} left for the next run")
+    if archive_stats is not None: print(f" Archive: {archive_stats['records']} responses ({archive_stats['bytes'] >> 20} MB compressed) in {ARCHIVE_DIR}/")
+    if args.reparse:
+        ev = metrics.snapshot()["events"]
+        print(f" Reparsed from {args.reparse}: {ev.get('reparse.missing', 0)} listings not archived, {ev.get('reparse.blocked', 0)} archived as blocked")
+    if cache_stats is not None: print(f" HTTP cache: {cache_stats['fresh']} fresh hits, {cache_stats['revalidated']} revalidated (304), {cache_stats['stored']} stored")
+    if image_stats is not None: print(f" Images: {image_stats['checked']} checked, {image_stats['dead']} dead, {image_stats['downloaded']} downloaded, {image_stats['deduped']} deduplicated ({image_stats['bytes'] >> 20} MB)")
+    if args.metrics_file: print(f" Metrics: {args.metrics_file}")
+    if profiler: print(f" Profile: {PROFILE_FILE} (top functions in {PROFILE_FILE}.txt)")
+    if proxy_pool:
+        px = proxy_pool.snapshot()
+        print(f" Proxies: {len(px)} in pool, {sum(1 for p in px.values() if p['quarantined_for'])} quarantined, "
+              f"{sum(p.get('proxy', 0) for p in px.values())} proxy failures, {sum(p.get('quarantined', 0) for p in px.values())} quarantines")
+    if browser_stats is not None: print(f" Browser pool: {browser_stats['rendered']} rendered, {browser_stats['failed']} failed, {browser_stats['launched']} launches ({browser_stats['recycled']} recycled, {browser_stats['crashed']} crashed)")
+    if cluster_stats is not None: print(f" Cluster queue ({args.cluster}): " + ", ".join(f"{n} {k}" for k, n in sorted(cluster_stats.items())) + f" — node-{node}; merge with --merge")
     print(f" Errors log: {ERROR_LOG}")
 
 if __name__ == "__main__":
@@ -0,0 +1,11 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """scrap.py writes its logs and stores relative to the working directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+import scrap
+
+def gate_args(**kw):
+    return SimpleNamespace(**{"workers": 2, "stream_seeds": False, "max_inflight": 16, "domain_concurrency_ceiling": 8,
+                              "domain_max_concurrency": 2, "max_attempts": 2, "lease_seconds": 60, "max_per_agency": 20, **kw})
+
+@pytest.fixture
+def gate(workdir, monkeypatch):
+    monkeypatch.setattr(scrap, "CLUSTER_RETRY_SECONDS", 0)
+    g = scrap.ClusterGate(str(workdir / "queue.sqlite"), gate_args(), "n1")
+    g.seed([], [{"Agency Name": "A", "Listing URL": "http://a.test/l/1"}])
+    yield g
+    g.close()
+
+def states(g):
+    with g.lock: return [(s, n, e) for s, n, e in g.db.execute("SELECT state, attempts, error FROM tasks WHERE kind='listing'")]
+
+def take_one(g):
+    jobs = g.take()
+    assert len(jobs) == 1
+    return jobs[0]
+
+def test_success_marks_done(gate):
+    agency, _, seed = take_one(gate)
+    gate.listing_finished(agency, seed, ([{"Unique ID": "u"}], []))
+    gate.commit(force=True)
+    assert states(gate) == [("done", 1, None)] and gate.finished()
+
+def test_failure_is_retried_then_failed(gate):
+    agency, _, seed = take_one(gate)
+    gate.listing_finished(agency, seed, None)
+    gate.commit(force=True)
+    assert states(gate) == [("queued", 1, "error")]
+    agency, _, seed = take_one(gate)
+    gate.listing_finished(agency, seed, None)
+    gate.commit(force=True)
+    assert states(gate) == [("failed", 2, "error")]
+    assert gate.take() == [] and gate.finished()
+
+def test_deferred_is_requeued_without_charging_an_attempt(gate):
+    agency, _, seed = take_one(gate)
+    gate.listing_finished(agency, seed, scrap.Deferred("a.test", 0))
+    gate.commit(force=True)
+    assert states(gate) == [("queued", 0, "domain cooldown")] and gate.requeued == 1
+
+def test_expired_lease_is_leased_again(gate):
+    take_one(gate)
+    with gate._tx() as db: db.execute("UPDATE tasks SET lease_until=0")
+    other = scrap.ClusterGate(gate.db.execute("PRAGMA database_list").fetchone()[2], gate_args(), "n2")
+    try:
+        assert len(other.take()) == 1
+        assert states(gate) == [("leased", 2, "lease expired")]
+    finally: other.close()
+
+def test_listings_wait_for_their_agency(workdir):
+    g = scrap.ClusterGate(str(workdir / "queue.sqlite"), gate_args(), "n1")
+    try:
+        g.seed([{"Agency Name": "A", "Website": "http://a.test/"}], [{"Agency Name": "A", "Listing URL": "http://a.test/l/1"}])
+        assert g.take() == []
+        (row,) = g.take_agencies()
+        g.agency_finished(row, ({}, {}, "http://a.test/logo.png"))
+        agency, logo, seed = take_one(g)
+        assert (agency, logo) == ("A", "http://a.test/logo.png")
+    finally: g.close()
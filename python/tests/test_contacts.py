@@ -0,0 +1,39 @@
+import scrap
+
+AGENCY_PAGE = """<html><head><script type="application/ld+json">
+{"@type": "RealEstateAgent", "telephone": "+34 911 222 333", "email": "info@agency.es"}</script></head>
+<body><a href="tel:+34 600 12 34 56">Call</a> <a href="mailto:sales@agency.es?subject=Hi">Mail</a>
+<a href="https://wa.me/34600111222">WhatsApp</a>
+<p>Price 450000 EUR. Ref: 123456789. Phone: 0034 600 999 888</p></body></html>"""
+
+def test_links_rank_above_jsonld_and_text():
+    assert scrap.extract_contacts(AGENCY_PAGE, "ES") == scrap.Contacts("sales@agency.es", "+34600123456", "+34600111222")
+
+def test_labelled_national_number_uses_seed_iso():
+    assert scrap.extract_contacts("<p>Tel: 600 123 456</p>", "ES").phone == "+34600123456"
+    assert scrap.extract_contacts("<p>Tel: 600 123 456</p>", "").phone == ""
+
+def test_prices_and_ids_are_not_phones():
+    assert scrap.extract_contacts("<p>Price: €600 123 456</p>", "ES").phone == ""
+    assert scrap.extract_contacts("<p>Posted 2024-05-12, ID 600123456, CP 28001</p>", "ES").phone == ""
+
+def test_international_prefix_beats_bare_number():
+    assert scrap.extract_contacts("<p>Call +44 20 7946 0000 or 600 123 456</p>", "ES").phone == "+442079460000"
+
+def test_noreply_email_ranks_last():
+    assert scrap.extract_contacts("<p>noreply@agency.es or info@agency.es</p>").email == "info@agency.es"
+
+def test_anchor_whatsapp_beats_script_built_link():
+    html = ("<button onclick=\"window.open('https://wa.me/34600111222')\">WA</button>"
+            "<a href=\"https://api.whatsapp.com/send?phone=34600333444\">WA</a>")
+    assert scrap.extract_contacts(html, "ES").whatsapp == "+34600333444"
+
+def test_script_built_whatsapp_link_is_found():
+    html = "<button onclick=\"window.open('https://wa.me/34600111222')\">WA</button>"
+    assert scrap.extract_contacts(html, "ES").whatsapp == "+34600111222"
+
+def test_to_e164():
+    assert scrap.to_e164("+44 (0)20 7946 0000") == "+442079460000"
+    assert scrap.to_e164("0034 600123456") == "+34600123456"
+    assert scrap.to_e164("600 123 456", "ES") == "+34600123456"
+    assert scrap.to_e164("600 123 456") == ""
@@ -0,0 +1,39 @@
+import scrap
+
+def test_add_reports_duplicates_and_persists(workdir):
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=100)
+    assert idx.add("uid", "a") and not idx.add("uid", "a")
+    assert idx.add("agent", "a")  # namespaces are separate
+    idx.close()
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=100)
+    assert not idx.add("uid", "a") and not idx.add("agent", "a")
+    idx.close()
+
+def test_claim_is_dropped_on_close_unless_marked_done(workdir):
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=100)
+    assert idx.add("fetch", "kept", done=False) and idx.add("fetch", "failed", done=False)
+    assert not idx.add("fetch", "failed")  # claimed for the rest of this run
+    idx.mark_done("fetch", "kept")
+    idx.close()
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=100)
+    assert not idx.add("fetch", "kept")
+    assert idx.add("fetch", "failed")
+    idx.close()
+
+def test_release_drops_claim_at_once(workdir):
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=100)
+    assert idx.add("uid", "x", done=False)
+    idx.release("uid", "x")
+    assert idx.add("uid", "x")  # Bloom bits stay set; SQLite has the final word
+    idx.mark_done("uid", "x"); idx.release("uid", "x")
+    assert not idx.add("uid", "x")  # done keys are not released
+    idx.close()
+
+def test_filter_grows_past_capacity(workdir):
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=8)
+    assert all(idx.add("uid", str(i)) for i in range(100))
+    assert idx.capacity >= 100 and not any(idx.add("uid", str(i)) for i in range(100))
+    idx.close()
+    idx = scrap.DedupeIndex(str(workdir / "d.sqlite"), capacity=8)
+    assert idx.count == 100 and not idx.add("uid", "99")
+    idx.close()
@@ -0,0 +1,27 @@
+import scrap
+
+GROUPS = {"interior": ["tile", "sea view", "pool"], "exterior": ["garage", "pool house"]}
+
+def test_substring_mode_matches_inside_words():
+    hits = scrap.KeywordMatcher(GROUPS).scan("textile floors, sea views, pool house and garages")
+    assert hits == {"interior": {"tile", "sea view", "pool"}, "exterior": {"garage", "pool house"}}
+
+def test_word_mode_rejects_keyword_inside_longer_word():
+    hits = scrap.KeywordMatcher(GROUPS, word_boundary=True).scan("textile upholstery, poolside bar")
+    assert hits == {"interior": set(), "exterior": set()}
+
+def test_word_mode_allows_plurals():
+    hits = scrap.KeywordMatcher(GROUPS, word_boundary=True).scan("new tiles, sea views and two garages")
+    assert hits == {"interior": {"tile", "sea view"}, "exterior": {"garage"}}
+
+def test_overlapping_keywords_are_all_reported():
+    hits = scrap.KeywordMatcher(GROUPS, word_boundary=True).scan("a pool house")
+    assert hits == {"interior": {"pool"}, "exterior": {"pool house"}}
+
+def test_keyword_in_several_groups():
+    hits = scrap.KeywordMatcher({"a": ["lift"], "b": ["Lift "]}).scan("with lift")
+    assert hits == {"a": {"lift"}, "b": {"lift"}}
+
+def test_empty_groups_and_text():
+    assert scrap.KeywordMatcher({"a": []}).scan("anything") == {"a": set()}
+    assert scrap.KeywordMatcher(GROUPS).scan(None) == {"interior": set(), "exterior": set()}
@@ -0,0 +1,53 @@
+import multiprocessing, os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import pytest
+
+import scrap
+
+def crash_in_worker(x):
+    """Kills a parse process; returns normally when run in the parent (the fallback)."""
+    if multiprocessing.parent_process() is not None: os._exit(1)
+    return x * 2
+
+def broken_pool():
+    pool = ProcessPoolExecutor(max_workers=1)
+    with pytest.raises(Exception): pool.submit(crash_in_worker, 0).result()
+    return pool
+
+@pytest.fixture(autouse=True)
+def no_parse_processes(monkeypatch):
+    monkeypatch.setattr(scrap, "parse_processes", None)
+
+def test_without_processes_runs_inline():
+    assert scrap.parse_stage(divmod, 7, 2) == (3, 1)
+
+def test_with_processes_returns_future():
+    scrap.parse_processes = ProcessPoolExecutor(max_workers=1)
+    try:
+        fut = scrap.parse_stage(divmod, 7, 2)
+        assert isinstance(fut, Future) and fut.result(timeout=30) == (3, 1)
+    finally: scrap.close_parse_processes()
+
+def test_pool_already_broken_falls_back_to_completed_future():
+    scrap.parse_processes = broken_pool()
+    fut = scrap.parse_stage(crash_in_worker, 21)
+    assert isinstance(fut, Future) and fut.done() and fut.result() == 42
+    assert scrap.parse_processes is None
+
+def test_pool_breaking_inside_task_falls_back():
+    scrap.parse_processes = ProcessPoolExecutor(max_workers=1)
+    fut = scrap.parse_stage(crash_in_worker, 21)
+    assert fut.result(timeout=30) == 42
+    assert scrap.parse_processes is None
+
+def test_fallback_keeps_extractor_errors():
+    scrap.parse_processes = broken_pool()
+    fut = scrap.parse_stage(divmod, 1, 0)
+    with pytest.raises(ZeroDivisionError): fut.result()
+
+def test_extract_async_after_pool_died():
+    import asyncio
+    scrap.parse_processes = broken_pool()
+    async def run(): return await scrap.extract_async(None, crash_in_worker, 5)
+    assert asyncio.run(run()) == 10
@@ -0,0 +1,63 @@
+import gzip, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import scrap
+
+def urlset(*locs):
+    return ('<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + "".join(f"<url><loc>{u}</loc></url>" for u in locs) + "</urlset>").encode()
+
+def index(*locs):
+    return ('<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + "".join(f"<sitemap><loc>{u}</loc></sitemap>" for u in locs) + "</sitemapindex>").encode()
+
+@pytest.fixture
+def site():
+    """Local HTTP server: site.pages[path] = body, or a list of (status, body) served in turn."""
+    pages, hits = {}, []
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            page = pages.get(self.path)
+            status, body = page.pop(0) if isinstance(page, list) else (200, page) if page is not None else (404, b"")
+            self.send_response(status); self.send_header("Content-Length", str(len(body))); self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *a): pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.pages, server.hits, server.base = pages, hits, f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown(); server.server_close()
+
+def test_plain_urlset(site):
+    site.pages["/sitemap.xml"] = urlset("http://a/1", "http://a/2")
+    assert list(scrap.stream_sitemap(site.base + "/sitemap.xml")) == [("url", "http://a/1"), ("url", "http://a/2")]
+
+def test_gzip_body_is_unpacked(site):
+    site.pages["/sitemap.xml.gz"] = gzip.compress(urlset("http://a/1"))
+    assert list(scrap.stream_sitemap(site.base + "/sitemap.xml.gz")) == [("url", "http://a/1")]
+
+def test_not_a_sitemap_and_missing(site):
+    site.pages["/sitemap.xml"] = b"<html><body>nope</body></html>"
+    assert list(scrap.stream_sitemap(site.base + "/sitemap.xml")) == []
+    assert list(scrap.stream_sitemap(site.base + "/gone.xml")) == []
+
+def test_retry_status_is_retried(site, monkeypatch):
+    monkeypatch.setattr(scrap, "retry_wait", lambda *a: 0)
+    site.pages["/sitemap.xml"] = [(503, b""), (200, urlset("http://a/1"))]
+    assert list(scrap.stream_sitemap(site.base + "/sitemap.xml")) == [("url", "http://a/1")]
+    assert site.hits == ["/sitemap.xml", "/sitemap.xml"]
+
+def test_try_sitemap_follows_nested_indexes_once(site):
+    site.pages["/sitemap.xml"] = index("/nested.xml", "/listings.xml.gz")
+    site.pages["/nested.xml"] = index("/listings.xml.gz", "/more.xml")
+    site.pages["/listings.xml.gz"] = gzip.compress(urlset("http://a/1", "http://a/2"))
+    site.pages["/more.xml"] = urlset("http://a/3")
+    assert sorted(scrap.try_sitemap(site.base + "/")) == ["http://a/1", "http://a/2", "http://a/3"]
+    assert site.hits.count("/listings.xml.gz") == 1
+
+def test_try_sitemap_respects_max_urls(site):
+    site.pages["/sitemap.xml"] = urlset(*(f"http://a/{i}" for i in range(10)))
+    assert scrap.try_sitemap(site.base + "/", max_urls=3) == ["http://a/0", "http://a/1", "http://a/2"]